@@ -0,0 +1,324 @@
+# activity.py
+# Activity feed of create/update/delete changes to tasks, comments, team
+# members and invites. Model signals turn changes into ActivityLogs rows, which
+# are buffered for the duration of a request and written with one bulk_create
+# by ActivityMiddleware. Entries made inside a transaction only reach the
+# buffer once it commits. Outside a request (commands, the worker) entries are
+# written straight away. An update's diff compares the saved values with the
+# ones the row was loaded (or last saved) with, copied in post_init, so a save
+# costs no extra query and loading a row only a copy of its tracked fields.
+# Writes that skip the signals (bulk_create, update()) call record_activity or
+# record_create themselves.
+import json
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.signals import post_init, post_save, post_delete
+from django.dispatch import receiver
+from django.utils.dateparse import parse_datetime
+
+from .pagination import encode_cursor, decode_cursor
+from .models import ActivityLogs, Tasks, Comments, TeamMembers, ProjectInvites, Projects
+
+_buffer = ContextVar('activity_buffer', default=None)
+_suppressed = ContextVar('activity_suppressed', default=False)
+
+TRACKED_FIELDS = {
+    Tasks: ('title', 'description', 'status', 'priority', 'due_date', 'project_id', 'assigned_to', 'tags', 'recurrence'),
+    Comments: ('content',),
+    TeamMembers: ('role',),
+    ProjectInvites: ('email', 'role', 'status'),
+}
+ENTITIES = {
+    Tasks: 'task',
+    Comments: 'comment',
+    TeamMembers: 'team_member',
+    ProjectInvites: 'invite',
+}
+
+
+@contextmanager
+def suppress_activity():
+    """Skip activity logging, for bulk maintenance such as archiving or deletion"""
+    token = _suppressed.set(True)
+    try:
+        yield
+    finally:
+        _suppressed.reset(token)
+
+
+def activity_suppressed():
+    return _suppressed.get()
+
+
+def _plain(value):
+    return json.loads(json.dumps(value, cls=DjangoJSONEncoder))
+
+
+def _snapshot(instance):
+    # Only loaded values, reading a deferred field would cost a query
+    values = instance.__dict__
+    return {field: _plain(values[field]) for field in TRACKED_FIELDS[type(instance)] if field in values}
+
+
+def previous_values(instance):
+    """Tracked values of the row being saved as it was loaded or last saved"""
+    if instance._state.adding:
+        return {}
+    return instance.__dict__.get('_activity_previous', {})
+
+
+def changes_field(instance, field):
+    """Whether saving `instance` changes a tracked field from its stored value"""
+    previous = previous_values(instance)
+    return field in previous and previous[field] != _plain(getattr(instance, field))
+
+
+def _scopes(instance):
+    """(project_id, task_id, team_id) of the entries an instance change produces"""
+    if isinstance(instance, Tasks):
+        return [(instance.project_id, instance.id, None)]
+    if isinstance(instance, Comments):
+        if Comments.task.is_cached(instance):
+            project_id = instance.task.project_id
+        else:
+            project_id = Tasks.objects.filter(id=instance.task_id).values_list('project_id', flat=True).first()
+        return [(project_id, instance.task_id, None)]
+    # Team level changes show up in the feed of every project of the team
+    project_ids = list(Projects.objects.filter(team_id=instance.team_id).values_list('id', flat=True))
+    return [(project_id, None, instance.team_id) for project_id in project_ids or [None]]
+
+
+def record_activity(instance, action, changes, actor=None):
+    if activity_suppressed():
+        return
+    entries = [
+        ActivityLogs(
+            project_id=project_id,
+            task_id=task_id,
+            team_id=team_id,
+            entity=ENTITIES[type(instance)],
+            entity_id=instance.pk,
+            action=action,
+            changes=changes,
+            actor=actor
+        )
+        for project_id, task_id, team_id in _scopes(instance)
+    ]
+    buffer = _buffer.get()
+    if buffer is None:
+        transaction.on_commit(lambda: ActivityLogs.objects.bulk_create(entries), using=instance._state.db)
+    else:
+        transaction.on_commit(lambda: buffer.extend(entries), using=instance._state.db)
+
+
+def record_create(instance, actor=None):
+    """Log a new row, also for rows inserted without signals by bulk_create"""
+    record_activity(instance, 'create', {field: [None, value] for field, value in _snapshot(instance).items()}, actor)
+
+
+def flush(entries, actor=None):
+    for entry in entries:
+        entry.actor = entry.actor or actor
+    if entries:
+        ActivityLogs.objects.bulk_create(entries, batch_size=settings.ACTIVITY_BATCH_SIZE)
+
+
+@contextmanager
+def buffer_activity(actor=None):
+    """Collect the entries made inside the block and write them with one bulk_create"""
+    entries = []
+    token = _buffer.set(entries)
+    try:
+        yield
+    finally:
+        _buffer.reset(token)
+    flush(entries, actor)
+
+
+def _cursor_time(value):
+    when = parse_datetime(value)
+    if when is None:
+        raise ValueError(f'Invalid cursor time: {value!r}')
+    return when
+
+
+def activity_page(queryset, cursor, limit):
+    """Newest first page of `queryset` after `cursor`, and the cursor of the next page.
+
+    Raises ValueError for a cursor that was not returned by a previous page.
+    """
+    queryset = queryset.order_by('-created_at', '-id')
+    if cursor:
+        position = decode_cursor(cursor, _cursor_time, uuid.UUID)
+        if position is None:
+            raise ValueError('Invalid cursor')
+        created_at, entry_id = position
+        queryset = queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=entry_id))
+
+    page = list(queryset[:limit + 1])
+    next_cursor = None
+    if len(page) > limit:
+        page = page[:limit]
+        next_cursor = encode_cursor(page[-1].created_at.isoformat(), page[-1].id)
+    return page, next_cursor
+
+
+def purge_activity(before, batch_size):
+    """Delete entries created before `before`, a batch per transaction"""
+    total = 0
+    while True:
+        with transaction.atomic():
+            ids = list(
+                ActivityLogs.objects.filter(created_at__lt=before)
+                .order_by('created_at')
+                .values_list('id', flat=True)[:batch_size]
+            )
+            if not ids:
+                return total
+            ActivityLogs.objects.filter(id__in=ids).delete()
+        total += len(ids)
+
+
+def _merge(changes, entry):
+    for field, (old, new) in entry.changes.items():
+        changes[field] = [changes.get(field, [old])[0], new]
+
+
+def compact_activity(start, end, window, batch_size):
+    """Merge bursts of updates to the same row by the same actor into one entry.
+
+    Updates created between `start` and `end` that follow the previous one
+    within `window` are folded into the first entry of the burst, whose
+    changes keep the oldest value and the newest one of each field. Entries
+    are read `batch_size` at a time in creation order and every chunk commits
+    on its own, only the bursts still open are kept in memory. Returns
+    (merged bursts, deleted entries).
+    """
+    updates = (
+        ActivityLogs.objects
+        .filter(action='update', created_at__gte=start, created_at__lt=end)
+        .order_by('created_at', 'id')
+    )
+    # (entity_id, project_id, actor) -> first and last entry and merged changes
+    bursts = {}
+    merged = deleted = 0
+    after = Q()
+    while True:
+        chunk = list(updates.filter(after)[:batch_size])
+        # first entry id -> burst, for the bursts to write and those that are done
+        touched, done, drop = {}, set(), []
+
+        def finish(burst):
+            if burst['changes'] is not None:
+                touched[burst['first'].id] = burst
+                done.add(burst['first'].id)
+
+        for entry in chunk:
+            key = (entry.entity_id, entry.project_id, entry.actor)
+            burst = bursts.get(key)
+            if burst is None or entry.created_at - burst['last'].created_at > window:
+                if burst is not None:
+                    finish(burst)
+                bursts[key] = {'first': entry, 'last': entry, 'changes': None}
+                continue
+            if burst['changes'] is None:
+                burst['changes'] = dict(burst['first'].changes)
+                merged += 1
+            _merge(burst['changes'], entry)
+            burst['last'] = entry
+            touched[burst['first'].id] = burst
+            drop.append(entry.id)
+
+        # Bursts nothing later in the range can join are done
+        if chunk:
+            newest = chunk[-1]
+            after = Q(created_at__gt=newest.created_at) | Q(created_at=newest.created_at, id__gt=newest.id)
+        for key in [
+            key for key, burst in bursts.items()
+            if not chunk or newest.created_at - burst['last'].created_at > window
+        ]:
+            finish(bursts.pop(key))
+
+        updated = []
+        for first_id, burst in touched.items():
+            first = burst['first']
+            # Drop fields the burst changed back to their original value
+            first.changes = {field: change for field, change in burst['changes'].items() if change[0] != change[1]}
+            if first.changes or first_id not in done:
+                updated.append(first)
+            else:
+                drop.append(first_id)
+        with transaction.atomic():
+            ActivityLogs.objects.bulk_update(updated, ['changes'], batch_size=batch_size)
+            ActivityLogs.objects.filter(id__in=drop).delete()
+        deleted += len(drop)
+        if not chunk:
+            return merged, deleted
+
+
+class ActivityMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        entries = []
+        token = _buffer.set(entries)
+        try:
+            response = self.get_response(request)
+        finally:
+            _buffer.reset(token)
+        # DRF sets the authenticated ClerkUser on the underlying request
+        flush(entries, getattr(getattr(request, 'user', None), 'id', None))
+        return response
+
+
+# Connected per model, a receiver for every sender would disable fast deletes
+@receiver(post_init, sender=Tasks)
+@receiver(post_init, sender=Comments)
+@receiver(post_init, sender=TeamMembers)
+@receiver(post_init, sender=ProjectInvites)
+def remember_state(sender, instance, **kwargs):
+    instance._activity_previous = _snapshot(instance)
+
+
+@receiver(post_save, sender=Tasks)
+@receiver(post_save, sender=Comments)
+@receiver(post_save, sender=TeamMembers)
+@receiver(post_save, sender=ProjectInvites)
+def log_save(sender, instance, created, update_fields=None, **kwargs):
+    previous = instance.__dict__.get('_activity_previous', {})
+    saved = _snapshot(instance)
+    if update_fields is not None:
+        saved = {
+            field: value for field, value in saved.items()
+            if field in update_fields or field.removesuffix('_id') in update_fields
+        }
+    # The next save of the same instance is compared with what was stored now
+    instance._activity_previous = saved if created else {**previous, **saved}
+
+    if activity_suppressed():
+        return
+    if created:
+        record_create(instance)
+        return
+    changes = {
+        field: [previous[field], value]
+        for field, value in saved.items()
+        if field in previous and previous[field] != value
+    }
+    if changes:
+        record_activity(instance, 'update', changes)
+
+
+@receiver(post_delete, sender=Tasks)
+@receiver(post_delete, sender=Comments)
+@receiver(post_delete, sender=TeamMembers)
+@receiver(post_delete, sender=ProjectInvites)
+def log_delete(sender, instance, **kwargs):
+    record_activity(instance, 'delete', {field: [value, None] for field, value in _snapshot(instance).items()})
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        # Register background job handlers and model signal receivers
+        from . import activity, archive, deletion, export, membership, ranking, reminders, snapshots  # noqa: F401
@@ -0,0 +1,158 @@
+# archive.py
+# Moves tasks and comments of long completed projects out of the hot Tasks and
+# Comments tables into ArchivedTasks/ArchivedComments, and back on reopen.
+# Work happens in small batches that each commit on their own, so a run can
+# be interrupted at any point and simply started again. Reopening a project
+# restores its rows in the background through the `restore_project` job.
+# Every batch first checks that the team accepts writes in the project's
+# database, so a run stops with TeamMoving while the team is being moved.
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+
+from .activity import suppress_activity
+from .jobs import job
+from .snapshots import mark_team_stale
+from .models import Projects, Tasks, Comments, ArchivedTasks, ArchivedComments
+from .tenancy import check_writable, locate, team_writes
+from .utils import query_flag
+
+
+def include_archived(request):
+    return query_flag(request, 'include_archived')
+
+
+def _copy(instance, model, **extra):
+    """Build an unsaved `model` row holding the same column values as `instance`"""
+    target_fields = {field.attname for field in model._meta.concrete_fields}
+    values = {
+        field.attname: getattr(instance, field.attname)
+        for field in instance._meta.concrete_fields
+        if field.attname in target_fields
+    }
+    values.update(extra)
+    return model(**values)
+
+
+def projects_to_archive(older_than=None):
+    """Completed projects past the archive age that were not fully archived yet"""
+    if older_than is None:
+        older_than = timedelta(days=settings.ARCHIVE_AFTER_DAYS)
+    return Projects.objects.filter(
+        Q(archived_at__isnull=True) | Q(Exists(Tasks.objects.filter(project=OuterRef('pk')))),
+        status='completed',
+        completed_at__lte=timezone.now() - older_than,
+        deletion_requested_at__isnull=True
+    )
+
+
+def projects_to_restore():
+    """Reopened projects that still have rows in the archive tables"""
+    return Projects.objects.exclude(status='completed').filter(
+        Exists(ArchivedTasks.objects.filter(project=OuterRef('pk'))),
+        deletion_requested_at__isnull=True
+    )
+
+
+def _with_occurrences(model, project, batch_size):
+    """Lock a batch of top-level tasks together with their materialized occurrences.
+
+    Occurrences always move with their recurring task, and come after it so
+    the parent row exists first when they are inserted.
+    """
+    parents = list(
+        model.objects
+        .select_for_update()
+        .filter(project=project, recurrence_parent_id__isnull=True)
+        .order_by('id')[:batch_size]
+    )
+    occurrences = list(
+        model.objects
+        .select_for_update()
+        .filter(recurrence_parent_id__in=[task.id for task in parents])
+    )
+    return parents + occurrences
+
+
+def archive_batch(project, batch_size):
+    """Move up to `batch_size` tasks of `project` with their comments to the archive"""
+    now = timezone.now()
+    check_writable(project.team_id, project._state.db)
+    # Archiving is not a user change, keep it out of the activity feed
+    with suppress_activity(), transaction.atomic(using=project._state.db):
+        # Locking the project row serializes batches with a concurrent reopen
+        if not Projects.objects.select_for_update().filter(id=project.id, status='completed').exists():
+            return 0
+        tasks = _with_occurrences(Tasks, project, batch_size)
+        if not tasks:
+            return 0
+        task_ids = [task.id for task in tasks]
+        comments = list(Comments.objects.filter(task_id__in=task_ids))
+
+        ArchivedTasks.objects.bulk_create(
+            [_copy(task, ArchivedTasks, archived_at=now) for task in tasks]
+        )
+        ArchivedComments.objects.bulk_create(
+            [_copy(comment, ArchivedComments, archived_at=now) for comment in comments]
+        )
+        Comments.objects.filter(task_id__in=task_ids).delete()
+        Tasks.objects.filter(id__in=task_ids).delete()
+    return len(tasks)
+
+
+def restore_batch(project, batch_size):
+    """Move up to `batch_size` archived tasks of `project` with their comments back"""
+    check_writable(project.team_id, project._state.db)
+    with transaction.atomic(using=project._state.db):
+        if Projects.objects.select_for_update().filter(id=project.id, status='completed').exists():
+            return 0
+        tasks = _with_occurrences(ArchivedTasks, project, batch_size)
+        if not tasks:
+            return 0
+        task_ids = [task.id for task in tasks]
+        comments = list(ArchivedComments.objects.filter(task_id__in=task_ids))
+
+        Tasks.objects.bulk_create([_copy(task, Tasks) for task in tasks])
+        Comments.objects.bulk_create([_copy(comment, Comments) for comment in comments])
+        ArchivedComments.objects.filter(task_id__in=task_ids).delete()
+        ArchivedTasks.objects.filter(id__in=task_ids).delete()
+    return len(tasks)
+
+
+def archive_project(project, batch_size=None):
+    batch_size = batch_size or settings.ARCHIVE_BATCH_SIZE
+    total = 0
+    while True:
+        moved = archive_batch(project, batch_size)
+        if not moved:
+            break
+        total += moved
+    Projects.objects.filter(id=project.id, status='completed').update(archived_at=timezone.now())
+    mark_team_stale([project.team_id], ['tasks'])
+    return total
+
+
+def restore_project(project, batch_size=None):
+    batch_size = batch_size or settings.ARCHIVE_BATCH_SIZE
+    total = 0
+    while True:
+        moved = restore_batch(project, batch_size)
+        if not moved:
+            break
+        total += moved
+    Projects.objects.filter(id=project.id).update(archived_at=None)
+    mark_team_stale([project.team_id], ['tasks'])
+    return total
+
+
+@job('restore_project')
+def restore_project_job(current):
+    _, team_id = locate(Projects, current.payload['project_id'], 'team_id')
+    with team_writes(team_id):
+        project = Projects.objects.filter(id=current.payload['project_id']).first()
+        if project is None:
+            return {'restored': 0}
+        return {'restored': restore_project(project)}
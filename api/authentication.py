@@ -10,11 +10,41 @@ class ClerkUser:
     def __init__(self, user_id):
         self.id = user_id
         self.is_authenticated = True
+        self._membership = None
+        self._profile = None
         
     @property
     def is_active(self):
         return True
 
+    @property
+    def membership(self):
+        """Teams, roles and projects of the user, resolved once per request"""
+        if self._membership is None:
+            from .membership import get_membership
+            self._membership = get_membership(self.id)
+        return self._membership
+
+    def forget(self):
+        """Drop the resolved membership and profile, after a change that may affect them"""
+        self._membership = None
+        self._profile = None
+
+    @property
+    def profile(self):
+        """Cached Clerk profile of the user, fetched once per request.
+
+        Raises if Clerk can't be reached; nothing is cached then, or for an
+        unknown user, so the next access asks again.
+        """
+        if self._profile is None:
+            from .clerk_users import get_user_profile
+            profile = get_user_profile(self.id, fail_silently=False)
+            if not profile:
+                return {}
+            self._profile = profile
+        return self._profile
+
 class ClerkAuthentication(authentication.BaseAuthentication):
     def authenticate(self, request):
         auth_header = request.headers.get('Authorization')
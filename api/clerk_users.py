@@ -0,0 +1,72 @@
+# clerk_users.py
+# Cached lookups of Clerk user profiles. Profiles are fetched in batches and
+# kept in the shared cache so bulk readers (exports, member lists) do not make
+# a remote call per row.
+import os
+
+from clerk_backend_api import Clerk
+from django.conf import settings
+from django.core.cache import cache
+
+CLERK_LIST_LIMIT = 100
+
+
+def _cache_key(user_id):
+    return f'clerk_user:{user_id}'
+
+
+def _profile(user):
+    return {
+        'user_id': user.id,
+        'first_name': user.first_name,
+        'last_name': user.last_name,
+        'email': user.email_addresses[0].email_address if user.email_addresses else None,
+        'image_url': user.image_url,
+    }
+
+
+def get_user_profiles(user_ids, fail_silently=True):
+    """Return a dict of user_id -> profile, fetching cache misses from Clerk in batches.
+
+    Users Clerk could not be asked about are left out, or with fail_silently
+    False the error is raised.
+    """
+    user_ids = list({user_id for user_id in user_ids if user_id})
+    if not user_ids:
+        return {}
+
+    cached = cache.get_many([_cache_key(user_id) for user_id in user_ids])
+    profiles = {profile['user_id']: profile for profile in cached.values()}
+    missing = [user_id for user_id in user_ids if user_id not in profiles]
+
+    if missing:
+        fetched = {}
+        try:
+            clerk = Clerk(bearer_auth=os.getenv('CLERK_SECRET_KEY'))
+            for start in range(0, len(missing), CLERK_LIST_LIMIT):
+                chunk = missing[start:start + CLERK_LIST_LIMIT]
+                for user in clerk.users.list(user_id=chunk, limit=CLERK_LIST_LIMIT) or []:
+                    fetched[user.id] = _profile(user)
+        except Exception as e:
+            print(f"Error fetching users {missing}: {str(e)}")
+            if not fail_silently:
+                raise
+
+        cache.set_many(
+            {_cache_key(user_id): profile for user_id, profile in fetched.items()},
+            timeout=settings.CLERK_USER_CACHE_TIMEOUT
+        )
+        profiles.update(fetched)
+
+    return profiles
+
+
+def get_user_profile(user_id, fail_silently=True):
+    return get_user_profiles([user_id], fail_silently).get(user_id)
+
+
+def display_name(profile):
+    if not profile:
+        return None
+    name = ' '.join(filter(None, [profile.get('first_name'), profile.get('last_name')]))
+    return name or profile.get('email') or profile.get('user_id')
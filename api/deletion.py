@@ -0,0 +1,147 @@
+# deletion.py
+# Deleting a team or project cascades to a lot of rows, and Tasks.project is
+# PROTECT. Instead of one long transaction the row is marked pending deletion,
+# which hides it at once, and the background worker deletes its rows in small
+# batches that each commit on their own. A crashed run is requeued by the
+# worker and picks up wherever the previous one stopped, as is a run that
+# meets the team being moved to another database (see tenancy.team_writes).
+# The mark and its job are written in one transaction; when the team lives
+# outside the default database the mark commits just before the job, so a job
+# never deletes rows that were not hidden first.
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .activity import suppress_activity
+from .jobs import job, enqueue
+from .membership import invalidate_team
+from .snapshots import mark_team_stale
+from .tenancy import check_writable, current_alias, forget_team, locate, team_writes
+from .models import (
+    Projects, Teams, TeamMembers, ProjectInvites, Tasks, ArchivedTasks,
+    ActivityLogs, BackgroundJobs, TeamShards
+)
+
+
+def request_project_deletion(project, requested_by=None):
+    with transaction.atomic(), transaction.atomic(using=current_alias()):
+        Projects.objects.filter(id=project.id).update(deletion_requested_at=timezone.now())
+        mark_team_stale([project.team_id], ['projects', 'tasks', 'invites'])
+        deletion_job = enqueue('delete_project', {'project_id': str(project.id)}, created_by=requested_by)
+    invalidate_team(project.team_id)
+    return deletion_job
+
+
+def request_team_deletion(team, requested_by=None):
+    now = timezone.now()
+    with transaction.atomic(), transaction.atomic(using=current_alias()):
+        Teams.objects.filter(id=team.id).update(deletion_requested_at=now)
+        Projects.objects.filter(team=team, deletion_requested_at__isnull=True).update(deletion_requested_at=now)
+        mark_team_stale([team.id], ['projects', 'tasks', 'invites'])
+        deletion_job = enqueue('delete_team', {'team_id': str(team.id)}, created_by=requested_by)
+    invalidate_team(team.id)
+    return deletion_job
+
+
+def delete_in_batches(queryset, batch_size, on_batch, team_id=None):
+    """Delete the rows of `queryset` a batch at a time, each batch in its own transaction.
+
+    With `team_id` every batch first checks that the team accepts writes.
+    """
+    total = 0
+    while True:
+        if team_id:
+            check_writable(team_id, queryset.db)
+        # The rows' history is deleted along with them, don't log the deletes
+        with suppress_activity(), transaction.atomic(using=queryset.db):
+            ids = list(queryset.order_by('pk').values_list('pk', flat=True)[:batch_size])
+            if not ids:
+                return total
+            # Cascades (comments, reminders, occurrences) stay within the batch
+            queryset.model.objects.filter(pk__in=ids).delete()
+        total += len(ids)
+        on_batch(len(ids))
+
+
+class Progress:
+    """Deleted row counts, saved on the job after every batch so it can be polled"""
+
+    def __init__(self, current):
+        self.current = current
+        self.counts = dict(current.result or {})
+
+    def counter(self, name):
+        def add(count):
+            self.counts[name] = self.counts.get(name, 0) + count
+            BackgroundJobs.objects.filter(id=self.current.id).update(result=self.counts)
+        return add
+
+
+def delete_project(project_id, progress, batch_size=None, team_id=None):
+    batch_size = batch_size or settings.DELETION_BATCH_SIZE
+    # Occurrences go with their recurring task, so only delete top-level tasks
+    delete_in_batches(
+        Tasks.objects.filter(project_id=project_id, recurrence_parent__isnull=True),
+        batch_size,
+        progress.counter('tasks'),
+        team_id
+    )
+    delete_in_batches(Tasks.objects.filter(project_id=project_id), batch_size, progress.counter('tasks'), team_id)
+    delete_in_batches(
+        ArchivedTasks.objects.filter(project_id=project_id),
+        batch_size,
+        progress.counter('archived_tasks'),
+        team_id
+    )
+    delete_in_batches(
+        ActivityLogs.objects.filter(project_id=project_id),
+        batch_size,
+        progress.counter('activity')
+    )
+    if team_id:
+        check_writable(team_id, current_alias())
+    Projects.objects.filter(id=project_id).delete()
+    progress.counter('projects')(1)
+
+
+@job('delete_project')
+def delete_project_job(current):
+    progress = Progress(current)
+    _, team_id = locate(Projects, current.payload['project_id'], 'team_id')
+    with team_writes(team_id):
+        delete_project(current.payload['project_id'], progress, team_id=team_id)
+    return progress.counts
+
+
+@job('delete_team')
+def delete_team_job(current):
+    team_id = current.payload['team_id']
+    batch_size = settings.DELETION_BATCH_SIZE
+    progress = Progress(current)
+
+    with team_writes(team_id):
+        for project_id in Projects.objects.filter(team_id=team_id).values_list('id', flat=True):
+            delete_project(project_id, progress, batch_size, team_id)
+        delete_in_batches(
+            ProjectInvites.objects.filter(team_id=team_id),
+            batch_size,
+            progress.counter('invites'),
+            team_id
+        )
+        delete_in_batches(
+            TeamMembers.objects.filter(team_id=team_id),
+            batch_size,
+            progress.counter('members'),
+            team_id
+        )
+        delete_in_batches(
+            ActivityLogs.objects.filter(team_id=team_id),
+            batch_size,
+            progress.counter('activity')
+        )
+        check_writable(team_id, current_alias())
+        Teams.objects.filter(id=team_id).delete()
+    TeamShards.objects.filter(team_id=team_id).delete()
+    forget_team(team_id)
+    progress.counter('teams')(1)
+    return progress.counts
@@ -0,0 +1,161 @@
+# export.py
+# Streaming export of a project's tasks (optionally joined with comments) as
+# CSV or NDJSON. Rows are read in fixed size chunks, one keyset query on
+# (created_at, id) each since not every driver streams a server-side cursor,
+# and names are resolved through the cached Clerk lookup once per chunk, so
+# memory stays flat no matter how many tasks the project holds.
+import csv
+import json
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db.models import Q
+
+from .clerk_users import get_user_profiles, display_name
+from .jobs import job
+from .models import Projects, Tasks, Comments, TeamMembers
+
+TASK_FIELDS = [
+    'id', 'title', 'description', 'status', 'priority', 'due_date',
+    'created_at', 'assigned_to', 'created_by', 'tags',
+]
+CSV_COLUMNS = TASK_FIELDS + ['assigned_to_name', 'created_by_name']
+CSV_COMMENT_COLUMNS = ['comment_id', 'comment_content', 'comment_created_at', 'comment_created_by', 'comment_created_by_name']
+
+CONTENT_TYPES = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+class Echo:
+    """File-like object whose write() hands the line back, for streaming csv.writer output"""
+
+    def write(self, value):
+        return value
+
+
+class NameResolver:
+    def __init__(self, project):
+        member_ids = TeamMembers.objects.filter(team_id=project.team_id).values_list('user_id', flat=True)
+        self.names = {
+            user_id: display_name(profile)
+            for user_id, profile in get_user_profiles(member_ids).items()
+        }
+
+    def prefetch(self, user_ids):
+        missing = {user_id for user_id in user_ids if user_id and user_id not in self.names}
+        if missing:
+            profiles = get_user_profiles(missing)
+            for user_id in missing:
+                self.names[user_id] = display_name(profiles.get(user_id))
+
+    def __getitem__(self, user_id):
+        return self.names.get(user_id)
+
+
+def iter_task_chunks(project, include_comments, chunk_size=None):
+    """Yield lists of task dicts, each with a `comments` list when requested"""
+    chunk_size = chunk_size or settings.EXPORT_CHUNK_SIZE
+    resolver = NameResolver(project)
+    tasks = Tasks.objects.filter(project=project).order_by('created_at', 'id').values(*TASK_FIELDS)
+    after = Q()
+
+    while True:
+        chunk = list(tasks.filter(after)[:chunk_size])
+        if not chunk:
+            return
+        last = chunk[-1]
+        after = Q(created_at__gt=last['created_at']) | Q(created_at=last['created_at'], id__gt=last['id'])
+
+        comments_by_task = {}
+        if include_comments:
+            comments = (
+                Comments.objects
+                .filter(task_id__in=[task['id'] for task in chunk])
+                .order_by('created_at')
+                .values('id', 'task_id', 'content', 'created_at', 'created_by')
+            )
+            for comment in comments:
+                comments_by_task.setdefault(comment['task_id'], []).append(comment)
+
+        user_ids = set()
+        for task in chunk:
+            user_ids.update([task['assigned_to'], task['created_by']])
+        for task_comments in comments_by_task.values():
+            user_ids.update(comment['created_by'] for comment in task_comments)
+        resolver.prefetch(user_ids)
+
+        for task in chunk:
+            task['assigned_to_name'] = resolver[task['assigned_to']]
+            task['created_by_name'] = resolver[task['created_by']]
+            if include_comments:
+                task['comments'] = [
+                    {
+                        'id': comment['id'],
+                        'content': comment['content'],
+                        'created_at': comment['created_at'],
+                        'created_by': comment['created_by'],
+                        'created_by_name': resolver[comment['created_by']],
+                    }
+                    for comment in comments_by_task.get(task['id'], [])
+                ]
+        yield chunk
+
+
+def _cell(value):
+    if isinstance(value, (list, dict)):
+        return json.dumps(value)
+    return '' if value is None else value
+
+
+def iter_csv(project, include_comments):
+    writer = csv.writer(Echo())
+    header = CSV_COLUMNS + (CSV_COMMENT_COLUMNS if include_comments else [])
+    yield writer.writerow(header)
+
+    for chunk in iter_task_chunks(project, include_comments):
+        for task in chunk:
+            row = [_cell(task[column]) for column in CSV_COLUMNS]
+            if not include_comments:
+                yield writer.writerow(row)
+                continue
+            # One line per comment, tasks without comments still get a line
+            for comment in task['comments'] or [None]:
+                comment_cells = [
+                    _cell(comment[key]) for key in ('id', 'content', 'created_at', 'created_by', 'created_by_name')
+                ] if comment else [''] * len(CSV_COMMENT_COLUMNS)
+                yield writer.writerow(row + comment_cells)
+
+
+def iter_ndjson(project, include_comments):
+    for chunk in iter_task_chunks(project, include_comments):
+        yield ''.join(json.dumps(task, default=str) + '\n' for task in chunk)
+
+
+def iter_export(project, export_format, include_comments):
+    if export_format == 'ndjson':
+        return iter_ndjson(project, include_comments)
+    return iter_csv(project, include_comments)
+
+
+@job('export_project')
+def export_project_job(current):
+    """Write an export to storage and return the stored file name"""
+    payload = current.payload
+    project = Projects.objects.get(id=payload['project_id'])
+    export_format = payload['format']
+
+    with tempfile.NamedTemporaryFile('w+', suffix=f'.{export_format}', encoding='utf-8', delete=False) as output:
+        for piece in iter_export(project, export_format, payload.get('include_comments', False)):
+            output.write(piece)
+    try:
+        with open(output.name, 'rb') as exported:
+            name = default_storage.save(f'exports/{current.id}.{export_format}', File(exported))
+    finally:
+        os.remove(output.name)
+
+    return {'file': name, 'format': export_format}
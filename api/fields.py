@@ -0,0 +1,56 @@
+# fields.py
+# UUIDs stored as 16 raw bytes. Django's UUIDField is char(32) on MySQL, which
+# doubles the width of every primary key and of each index and foreign key
+# that repeats it. New keys are time ordered (UUIDv7 layout), so inserts land
+# at the end of the clustered index instead of on random pages. Values are
+# still uuid.UUID objects in Python, the API representation does not change.
+import os
+import time
+import uuid
+
+from django.db import models
+
+
+def uuid7():
+    """UUID whose first 48 bits are the current Unix time in milliseconds"""
+    millis = time.time_ns() // 1_000_000
+    value = (millis & ((1 << 48) - 1)) << 80 | int.from_bytes(os.urandom(10), 'big')
+    # Version 7 and the RFC 4122 variant
+    value = (value & ~(0xf << 76)) | (0x7 << 76)
+    value = (value & ~(0x3 << 62)) | (0x2 << 62)
+    return uuid.UUID(int=value)
+
+
+class BinaryUUIDField(models.UUIDField):
+    """A UUIDField stored as binary(16) on MySQL, see `manage.py convert_uuid_columns`"""
+
+    # Stored as raw bytes, keeps the backends' UUIDField converters off the values
+    def get_internal_type(self):
+        return 'BinaryField'
+
+    def db_type(self, connection):
+        if connection.features.has_native_uuid_field:
+            return 'uuid'
+        return {
+            'mysql': 'binary(16)',
+            'oracle': 'RAW(16)',
+        }.get(connection.vendor, 'blob')
+
+    def rel_db_type(self, connection):
+        return self.db_type(connection)
+
+    def get_db_prep_value(self, value, connection, prepared=False):
+        if value is None:
+            return None
+        if not isinstance(value, uuid.UUID):
+            value = self.to_python(value)
+        if connection.features.has_native_uuid_field:
+            return value
+        return value.bytes
+
+    def from_db_value(self, value, expression, connection):
+        if value is None or isinstance(value, uuid.UUID):
+            return value
+        if isinstance(value, (bytes, bytearray, memoryview)):
+            return uuid.UUID(bytes=bytes(value))
+        return self.to_python(value)
@@ -0,0 +1,204 @@
+# importer.py
+# Bulk import of tasks into a project from CSV, NDJSON or a JSON array.
+# Input is parsed row by row, validated against the project's task_statuses
+# (loaded once) and inserted with bulk_create in batches, each batch inside
+# its own savepoint so one bad batch does not lose the others. Each batch
+# first checks the team accepts writes, a move in progress aborts the import.
+import csv
+import io
+import json
+import os
+from datetime import datetime, time
+
+from django.conf import settings
+from django.db import transaction, DatabaseError
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .models import Tasks
+from .activity import buffer_activity, record_create
+from .ranking import last_rank, rank_sequence
+from .tenancy import check_writable, current_alias
+from .snapshots import mark_team_stale
+
+FORMATS = ('csv', 'ndjson', 'json')
+MAX_REPORTED_ERRORS = 1000
+
+
+def detect_format(name, default='csv'):
+    extension = os.path.splitext(name or '')[1].lower().lstrip('.')
+    if extension == 'jsonl':
+        return 'ndjson'
+    return extension if extension in FORMATS else default
+
+
+def iter_rows(stream, input_format):
+    """Yield row dicts from a binary or text stream"""
+    if isinstance(stream.read(0), bytes):
+        stream = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+
+    if input_format == 'csv':
+        yield from csv.DictReader(stream)
+    elif input_format == 'ndjson':
+        for line in stream:
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                # Reported as an invalid row instead of aborting the import
+                yield line
+    elif input_format == 'json':
+        # A JSON array has to be read whole, prefer NDJSON for large files
+        yield from json.load(stream)
+    else:
+        raise ValueError(f'Unsupported format: {input_format}')
+
+
+def _parse_due_date(value):
+    if isinstance(value, datetime):
+        parsed = value
+    else:
+        value = str(value or '').strip()
+        parsed = parse_datetime(value)
+        if parsed is None:
+            day = parse_date(value)
+            parsed = datetime.combine(day, time()) if day else None
+    if parsed is None:
+        raise ValueError('Enter a valid date/time.')
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def _parse_tags(value):
+    if value in (None, ''):
+        return []
+    if isinstance(value, list):
+        return value
+    value = str(value).strip()
+    if value.startswith('['):
+        tags = json.loads(value)
+        if not isinstance(tags, list):
+            raise ValueError('Tags must be a list.')
+        return tags
+    return [tag.strip() for tag in value.split(',') if tag.strip()]
+
+
+class TaskImporter:
+    def __init__(self, project, created_by=None, batch_size=None, dry_run=False):
+        self.project = project
+        self.created_by = created_by
+        self.batch_size = batch_size or settings.IMPORT_BATCH_SIZE
+        self.dry_run = dry_run
+        # Validation data is loaded once for the whole import
+        self.statuses = list(project.task_statuses or [])
+        self.priorities = {choice for choice, _ in Tasks._meta.get_field('priority').choices}
+        self.ranks = {}
+        self.valid = 0
+        self.created = 0
+        self.error_count = 0
+        self.errors = []
+
+    def _error(self, row_number, errors):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'row': row_number, 'errors': errors})
+
+    def _next_rank(self, status):
+        # Imported tasks go to the bottom of their column in input order
+        if status not in self.ranks:
+            self.ranks[status] = rank_sequence(last_rank(self.project.id, status))
+        return next(self.ranks[status])
+
+    def build(self, row):
+        """Validate one input row and return an unsaved task, or raise a dict of errors"""
+        errors = {}
+        if not isinstance(row, dict):
+            raise ValueError({'row': 'Expected a JSON object.'})
+
+        title = str(row.get('title') or '').strip()
+        if not title:
+            errors['title'] = 'This field is required.'
+        elif len(title) > 255:
+            errors['title'] = 'Ensure this field has no more than 255 characters.'
+
+        status = row.get('status') or (self.statuses[0] if self.statuses else None)
+        if not self.statuses:
+            errors['project'] = 'The project does not have defined task statuses.'
+        elif status not in self.statuses:
+            errors['status'] = f'Status must be one of: {", ".join(self.statuses)}'
+
+        priority = str(row.get('priority') or '').strip().lower()
+        if priority not in self.priorities:
+            errors['priority'] = f'Priority must be one of: {", ".join(sorted(self.priorities))}'
+
+        try:
+            due_date = _parse_due_date(row.get('due_date'))
+        except ValueError as e:
+            errors['due_date'] = str(e)
+
+        try:
+            tags = _parse_tags(row.get('tags'))
+        except ValueError:
+            errors['tags'] = 'Tags must be a JSON list or a comma separated string.'
+
+        if errors:
+            raise ValueError(errors)
+
+        return Tasks(
+            title=title,
+            description=str(row.get('description') or ''),
+            status=status,
+            priority=priority,
+            due_date=due_date,
+            project=self.project,
+            assigned_to=str(row['assigned_to']) if row.get('assigned_to') else None,
+            created_by=self.created_by,
+            tags=tags,
+            rank=self._next_rank(status)
+        )
+
+    def _flush(self, batch):
+        self.valid += len(batch)
+        if not batch or self.dry_run:
+            return
+        check_writable(self.project.team_id, current_alias())
+        try:
+            with transaction.atomic(using=current_alias()):
+                Tasks.objects.bulk_create([task for _, task in batch])
+                # bulk_create skips the signals the activity feed is built from
+                for _, task in batch:
+                    record_create(task, actor=self.created_by)
+            self.created += len(batch)
+        except DatabaseError as e:
+            for row_number, _ in batch:
+                self._error(row_number, {'database': str(e)})
+
+    def run(self, rows):
+        batch = []
+        with buffer_activity(self.created_by), transaction.atomic(using=current_alias()):
+            for row_number, row in enumerate(rows, start=1):
+                try:
+                    batch.append((row_number, self.build(row)))
+                except ValueError as e:
+                    errors = e.args[0] if e.args and isinstance(e.args[0], dict) else {'row': str(e)}
+                    self._error(row_number, errors)
+                    continue
+                if len(batch) >= self.batch_size:
+                    self._flush(batch)
+                    batch = []
+            self._flush(batch)
+            if self.created:
+                # bulk_create skips the signals that refresh home snapshots
+                mark_team_stale([self.project.team_id], ['tasks'])
+        return self.report()
+
+    def report(self):
+        return {
+            'dry_run': self.dry_run,
+            'valid': self.valid,
+            'created': self.created,
+            'error_count': self.error_count,
+            'errors': self.errors,
+        }
@@ -0,0 +1,104 @@
+# jobs.py
+# A small database-backed job queue processed by `manage.py run_worker`.
+# Handlers register themselves with @job('<kind>') and receive the job row;
+# whatever they return is stored as the job's result. Jobs run in the tenant
+# context (see tenancy.py) they were enqueued from; handlers writing to a team
+# look up where it lives now with team_writes, and wait while it is moved.
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import BackgroundJobs
+from .tenancy import TeamMoving, current_alias, using_alias
+
+HANDLERS = {}
+
+
+def job(kind):
+    def register(func):
+        HANDLERS[kind] = func
+        return func
+    return register
+
+
+def enqueue(kind, payload=None, created_by=None, delay=None):
+    run_after = timezone.now() + delay if delay else timezone.now()
+    return BackgroundJobs.objects.create(
+        kind=kind,
+        payload=payload or {},
+        created_by=created_by,
+        run_after=run_after,
+        tenant_alias=current_alias()
+    )
+
+
+def enqueue_on_commit(kind, payload=None, created_by=None):
+    """Enqueue once the surrounding transaction commits, so the worker sees its data"""
+    alias = current_alias()
+
+    def enqueue_in_context():
+        with using_alias(alias):
+            enqueue(kind, payload, created_by)
+    transaction.on_commit(enqueue_in_context, using=alias)
+
+
+def requeue_stale():
+    """Put jobs whose worker died mid-run back in the queue"""
+    cutoff = timezone.now() - timedelta(seconds=settings.JOB_TIMEOUT_SECONDS)
+    return BackgroundJobs.objects.filter(
+        status='running',
+        started_at__lt=cutoff
+    ).update(status='pending')
+
+
+def claim_next():
+    with transaction.atomic():
+        next_job = (
+            BackgroundJobs.objects
+            .select_for_update(skip_locked=True)
+            .filter(status='pending', run_after__lte=timezone.now())
+            .order_by('run_after')
+            .first()
+        )
+        if next_job is None:
+            return None
+        next_job.status = 'running'
+        next_job.started_at = timezone.now()
+        next_job.attempts += 1
+        next_job.save(update_fields=['status', 'started_at', 'attempts'])
+    return next_job
+
+
+def run_job(current):
+    handler = HANDLERS.get(current.kind)
+    try:
+        if handler is None:
+            raise ValueError(f'No handler registered for job kind {current.kind!r}')
+        with using_alias(current.tenant_alias):
+            current.result = handler(current)
+        current.status = 'done'
+        current.error = ''
+    except TeamMoving:
+        # Not a failure, try again once the move is done without using up an attempt
+        current.error = traceback.format_exc()
+        current.status = 'pending'
+        current.attempts -= 1
+        current.run_after = timezone.now() + timedelta(seconds=settings.TENANT_DIRECTORY_CACHE_TIMEOUT)
+    except Exception:
+        current.error = traceback.format_exc()
+        if current.attempts < settings.JOB_MAX_ATTEMPTS and handler is not None:
+            # Back off before the next attempt
+            current.status = 'pending'
+            current.run_after = timezone.now() + timedelta(seconds=30 * current.attempts)
+        else:
+            current.status = 'failed'
+    current.finished_at = timezone.now()
+    fields = ['status', 'error', 'run_after', 'finished_at', 'attempts']
+    if current.status == 'done':
+        # Failed runs keep whatever progress the handler saved itself
+        fields.append('result')
+    current.save(update_fields=fields)
+    return current
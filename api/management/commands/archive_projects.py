@@ -0,0 +1,77 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from api.archive import archive_project, restore_project, projects_to_archive, projects_to_restore
+from api.models import Projects
+from api.tenancy import TeamMoving, using_alias
+
+
+class Command(BaseCommand):
+    help = 'Move tasks and comments of long completed projects to the archive tables and restore reopened ones'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--older-than-days',
+            type=int,
+            default=settings.ARCHIVE_AFTER_DAYS,
+            help='Archive projects completed at least this many days ago'
+        )
+        parser.add_argument('--batch-size', type=int, default=settings.ARCHIVE_BATCH_SIZE)
+        parser.add_argument('--dry-run', action='store_true', help='Only list the projects that would be processed')
+
+    def process(self, options):
+        if not options['dry_run']:
+            # Projects completed before completed_at existed start aging from now
+            backfilled = Projects.objects.filter(
+                status='completed',
+                completed_at__isnull=True
+            ).update(completed_at=timezone.now())
+            if backfilled:
+                self.stdout.write(f'Set completed_at on {backfilled} projects')
+
+        to_restore = list(projects_to_restore())
+        to_archive = list(projects_to_archive(timedelta(days=options['older_than_days'])))
+        archived = restored = 0
+
+        for project in to_restore:
+            if options['dry_run']:
+                self.stdout.write(f'Would restore {project.id} ({project.name})')
+                continue
+            try:
+                count = restore_project(project, options['batch_size'])
+            except TeamMoving:
+                self.stdout.write(f'Skipped {project.id} ({project.name}), its team is being moved')
+                continue
+            restored += 1
+            self.stdout.write(f'Restored {count} tasks of {project.id} ({project.name})')
+
+        for project in to_archive:
+            if options['dry_run']:
+                self.stdout.write(f'Would archive {project.id} ({project.name})')
+                continue
+            try:
+                count = archive_project(project, options['batch_size'])
+            except TeamMoving:
+                self.stdout.write(f'Skipped {project.id} ({project.name}), its team is being moved')
+                continue
+            archived += 1
+            self.stdout.write(f'Archived {count} tasks of {project.id} ({project.name})')
+        if options['dry_run']:
+            return len(to_archive), len(to_restore)
+        return archived, restored
+
+    def handle(self, *args, **options):
+        archived = restored = 0
+        # Every team database has its own projects
+        for alias in settings.TENANT_DATABASES:
+            with using_alias(alias):
+                alias_archived, alias_restored = self.process(options)
+            archived += alias_archived
+            restored += alias_restored
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{archived} projects archived, {restored} restored'
+        ))
@@ -0,0 +1,127 @@
+import random
+import time
+import uuid
+
+from django.apps.registry import Apps
+from django.core.management.base import BaseCommand
+from django.db import connection, models, transaction
+
+from api.fields import BinaryUUIDField, uuid7
+
+LAYOUTS = {
+    'char_uuid4': (models.UUIDField, uuid.uuid4),
+    'binary_uuid7': (BinaryUUIDField, uuid7),
+}
+
+
+def build_models(name, field_class, default):
+    """A parent/child pair shaped like Projects/Tasks, in a registry of its own"""
+    registry = Apps(['api'])
+
+    def meta(table):
+        return type('Meta', (), {'app_label': 'api', 'apps': registry, 'db_table': table})
+
+    parent = type(f'Bench{name}Parent', (models.Model,), {
+        '__module__': __name__,
+        'id': field_class(primary_key=True, default=default),
+        'Meta': meta(f'bench_{name}_parent'),
+    })
+    child = type(f'Bench{name}Child', (models.Model,), {
+        '__module__': __name__,
+        'id': field_class(primary_key=True, default=default),
+        'parent': models.ForeignKey(parent, on_delete=models.CASCADE),
+        'title': models.CharField(max_length=255),
+        'Meta': meta(f'bench_{name}_child'),
+    })
+    return parent, child
+
+
+def table_size(table):
+    """(data bytes, index bytes) on MySQL, None elsewhere"""
+    if connection.vendor != 'mysql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(f'ANALYZE TABLE {connection.ops.quote_name(table)}')
+        cursor.fetchall()
+        cursor.execute(
+            'SELECT DATA_LENGTH, INDEX_LENGTH FROM information_schema.TABLES '
+            'WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s',
+            [table]
+        )
+        return cursor.fetchone()
+
+
+class Command(BaseCommand):
+    help = 'Compare inserts and lookups with char(32) UUIDv4 keys and binary(16) UUIDv7 keys in scratch tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100000)
+        parser.add_argument('--parents', type=int, default=1000)
+        parser.add_argument('--lookups', type=int, default=5000)
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--keep', action='store_true', help='Leave the scratch tables in place')
+
+    def run_layout(self, name, field_class, default, options):
+        parent, child = build_models(name, field_class, default)
+        with connection.schema_editor() as editor:
+            editor.create_model(parent)
+            editor.create_model(child)
+        try:
+            parents = parent.objects.bulk_create(
+                [parent() for _ in range(options['parents'])],
+                batch_size=options['batch_size']
+            )
+
+            ids = []
+            started = time.perf_counter()
+            for offset in range(0, options['rows'], options['batch_size']):
+                size = min(options['batch_size'], options['rows'] - offset)
+                rows = [
+                    child(parent=random.choice(parents), title=f'task {offset + index}')
+                    for index in range(size)
+                ]
+                with transaction.atomic():
+                    child.objects.bulk_create(rows)
+                ids += [row.id for row in rows]
+            insert_seconds = time.perf_counter() - started
+
+            pk_sample = random.sample(ids, min(options['lookups'], len(ids)))
+            started = time.perf_counter()
+            for row_id in pk_sample:
+                child.objects.get(pk=row_id)
+            pk_seconds = time.perf_counter() - started
+
+            fk_sample = [random.choice(parents).id for _ in range(options['lookups'])]
+            started = time.perf_counter()
+            for parent_id in fk_sample:
+                list(child.objects.filter(parent_id=parent_id).values_list('id', flat=True))
+            fk_seconds = time.perf_counter() - started
+
+            return {
+                'insert_rows_per_s': options['rows'] / insert_seconds,
+                'pk_lookups_per_s': len(pk_sample) / pk_seconds,
+                'fk_lookups_per_s': len(fk_sample) / fk_seconds,
+                'size': table_size(child._meta.db_table),
+            }
+        finally:
+            if not options['keep']:
+                with connection.schema_editor() as editor:
+                    editor.delete_model(child)
+                    editor.delete_model(parent)
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f'{options["rows"]} rows, {options["parents"]} parents, '
+            f'{options["lookups"]} lookups on {connection.vendor}'
+        )
+        for name, (field_class, default) in LAYOUTS.items():
+            result = self.run_layout(name, field_class, default, options)
+            line = (
+                f'{name:>13}: {result["insert_rows_per_s"]:10.0f} inserts/s '
+                f'{result["pk_lookups_per_s"]:8.0f} pk lookups/s '
+                f'{result["fk_lookups_per_s"]:8.0f} fk lookups/s'
+            )
+            if result['size']:
+                data, index = result['size']
+                line += f'  data {data / 1024 ** 2:.1f} MiB, indexes {index / 1024 ** 2:.1f} MiB'
+            self.stdout.write(line)
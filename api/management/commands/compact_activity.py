@@ -0,0 +1,51 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from api.activity import compact_activity, purge_activity
+
+
+class Command(BaseCommand):
+    help = 'Delete activity entries past the retention period and merge bursts of updates to the same row'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--retention-days',
+            type=int,
+            default=settings.ACTIVITY_RETENTION_DAYS,
+            help='Delete entries older than this many days'
+        )
+        parser.add_argument(
+            '--compact-after-days',
+            type=int,
+            default=settings.ACTIVITY_COMPACT_AFTER_DAYS,
+            help='Compact entries at least this many days old'
+        )
+        parser.add_argument(
+            '--span-days',
+            type=int,
+            default=1,
+            help='How many days of entries before --compact-after-days to compact, match the schedule of the command'
+        )
+        parser.add_argument('--window-minutes', type=int, default=settings.ACTIVITY_COMPACT_WINDOW_MINUTES)
+        parser.add_argument('--batch-size', type=int, default=settings.ACTIVITY_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        batch_size = options['batch_size']
+
+        purged = purge_activity(now - timedelta(days=options['retention_days']), batch_size)
+        self.stdout.write(f'Deleted {purged} entries older than {options["retention_days"]} days')
+
+        end = now - timedelta(days=options['compact_after_days'])
+        merged, deleted = compact_activity(
+            end - timedelta(days=options['span_days']),
+            end,
+            timedelta(minutes=options['window_minutes']),
+            batch_size
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Compacted {merged} update bursts, removing {deleted} entries'
+        ))
@@ -0,0 +1,82 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from api.fields import BinaryUUIDField
+
+
+def uuid_columns():
+    """(table, column, null) of every BinaryUUIDField column, foreign keys included"""
+    columns = []
+    for model in apps.get_app_config('api').get_models():
+        for field in model._meta.concrete_fields:
+            target = field.target_field if field.is_relation else field
+            if isinstance(target, BinaryUUIDField):
+                columns.append((model._meta.db_table, field.column, field.null))
+    return columns
+
+
+class Command(BaseCommand):
+    help = (
+        'Convert UUID columns created as char(32) on MySQL to binary(16) in place. '
+        'Existing ids keep their value, only their storage changes. Prints the SQL '
+        'unless --execute is given; run it in a maintenance window.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--execute', action='store_true', help='Run the statements instead of printing them')
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS, help='Database alias to convert, run once per tenant shard')
+
+    def handle(self, *args, **options):
+        connection = connections[options['database']]
+        if connection.vendor == 'postgresql':
+            self.stdout.write('PostgreSQL stores UUIDs natively, nothing to convert')
+            return
+        if connection.vendor != 'mysql':
+            raise CommandError(f'Converting existing columns is only supported on MySQL, not {connection.vendor}')
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT TABLE_NAME, COLUMN_NAME FROM information_schema.COLUMNS '
+                "WHERE TABLE_SCHEMA = DATABASE() AND DATA_TYPE = 'char' AND CHARACTER_MAXIMUM_LENGTH = 32"
+            )
+            pending = set(cursor.fetchall())
+
+        tables = {}
+        for table, column, null in uuid_columns():
+            if (table, column) in pending:
+                tables.setdefault(table, []).append((column, 'NULL' if null else 'NOT NULL'))
+        if not tables:
+            self.stdout.write(self.style.SUCCESS('All UUID columns are binary(16) already'))
+            return
+
+        quote = connection.ops.quote_name
+        # Foreign keys are converted table by table, so their checks are off meanwhile
+        statements = ['SET FOREIGN_KEY_CHECKS = 0']
+        for table, columns in tables.items():
+            # char -> varbinary keeps the hex text, UNHEX turns it into the 16 raw bytes
+            statements.append(f'ALTER TABLE {quote(table)} ' + ', '.join(
+                f'MODIFY {quote(column)} varbinary(32) {null}' for column, null in columns
+            ))
+            statements.append(f'UPDATE {quote(table)} SET ' + ', '.join(
+                f'{quote(column)} = UNHEX({quote(column)})' for column, _ in columns
+            ))
+            statements.append(f'ALTER TABLE {quote(table)} ' + ', '.join(
+                f'MODIFY {quote(column)} binary(16) {null}' for column, null in columns
+            ))
+        statements.append('SET FOREIGN_KEY_CHECKS = 1')
+
+        if not options['execute']:
+            for statement in statements:
+                self.stdout.write(statement + ';')
+            return
+
+        with connection.cursor() as cursor:
+            try:
+                for statement in statements:
+                    self.stdout.write(statement)
+                    cursor.execute(statement)
+            finally:
+                cursor.execute('SET FOREIGN_KEY_CHECKS = 1')
+        count = sum(len(columns) for columns in tables.values())
+        self.stdout.write(self.style.SUCCESS(f'Converted {count} columns in {len(tables)} tables'))
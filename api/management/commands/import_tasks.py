@@ -0,0 +1,60 @@
+import json
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from api.importer import TaskImporter, iter_rows, detect_format, FORMATS
+from api.models import Projects
+from api.tenancy import TeamMoving, locate, using_alias
+
+
+class Command(BaseCommand):
+    help = 'Bulk import tasks into a project from a CSV, NDJSON or JSON file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('project_id')
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=FORMATS, help='Input format, detected from the extension by default')
+        parser.add_argument('--batch-size', type=int, help='Rows per bulk insert')
+        parser.add_argument('--created-by', help='Clerk user id recorded as the creator')
+        parser.add_argument('--dry-run', action='store_true', help='Only validate the input')
+        parser.add_argument('--report', help='Write the full JSON report to this file')
+
+    def handle(self, *args, **options):
+        alias, _ = locate(Projects, options['project_id'], 'team_id')
+        with using_alias(alias):
+            self.import_into(options)
+
+    def import_into(self, options):
+        try:
+            project = Projects.objects.get(id=options['project_id'])
+        except (Projects.DoesNotExist, ValueError, ValidationError):
+            raise CommandError(f'Project {options["project_id"]} does not exist')
+
+        importer = TaskImporter(
+            project,
+            created_by=options['created_by'],
+            batch_size=options['batch_size'],
+            dry_run=options['dry_run']
+        )
+        input_format = options['format'] or detect_format(options['path'])
+
+        with open(options['path'], 'rb') as source:
+            try:
+                report = importer.run(iter_rows(source, input_format))
+            except (ValueError, UnicodeDecodeError) as e:
+                raise CommandError(f'Could not parse input: {e}')
+            except TeamMoving:
+                raise CommandError('The project\'s team is being moved to another database, nothing was imported')
+
+        for error in report['errors']:
+            self.stderr.write(f'Row {error["row"]}: {json.dumps(error["errors"])}')
+        if options['report']:
+            with open(options['report'], 'w') as output:
+                json.dump(report, output, indent=2)
+
+        verb = 'Validated' if report['dry_run'] else 'Imported'
+        count = report['valid'] if report['dry_run'] else report['created']
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {count} tasks, {report["error_count"]} rows with errors'
+        ))
@@ -0,0 +1,41 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api.team_moves import move_team
+
+
+class Command(BaseCommand):
+    help = (
+        'Move a team and everything it owns to another database alias. The team stays '
+        'readable throughout; writes to it are paused for the final catch-up only.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('team_id')
+        parser.add_argument('alias', help=f'Target database, one of {", ".join(settings.TENANT_DATABASES)}')
+        parser.add_argument('--batch-size', type=int, default=settings.TENANT_MOVE_BATCH_SIZE)
+        parser.add_argument(
+            '--settle-seconds',
+            type=float,
+            default=settings.TENANT_DIRECTORY_CACHE_TIMEOUT,
+            help='Wait after pausing writes and after switching, at least the directory cache timeout (TENANT_DIRECTORY_CACHE_TIMEOUT)'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            counts = move_team(
+                options['team_id'],
+                options['alias'],
+                batch_size=options['batch_size'],
+                settle_seconds=options['settle_seconds'],
+                log=self.stdout.write
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+        for table, changes in counts.items():
+            if any(changes.values()):
+                self.stdout.write(
+                    f'{table}: {changes["inserted"]} inserted, {changes["updated"]} updated, '
+                    f'{changes["deleted"]} deleted in the catch-up'
+                )
+        self.stdout.write(self.style.SUCCESS(f'Moved team {options["team_id"]} to {options["alias"]}'))
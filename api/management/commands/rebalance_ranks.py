@@ -0,0 +1,56 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.db.models.functions import Length
+
+from api.models import Tasks
+from api.ranking import rebalance_column
+from api.tenancy import TeamMoving, team_writes, using_alias
+
+
+class Command(BaseCommand):
+    help = 'Rewrite task ranks of board columns that hold unranked tasks or overly long ranks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--project', help='Only rebalance columns of this project')
+        parser.add_argument(
+            '--max-length',
+            type=int,
+            default=settings.TASK_RANK_REBALANCE_LENGTH,
+            help='Rebalance columns holding a rank longer than this'
+        )
+        parser.add_argument('--all', action='store_true', help='Rebalance every column')
+
+    def columns(self, options):
+        tasks = Tasks.objects.filter(project__isnull=False)
+        if options['project']:
+            tasks = tasks.filter(project_id=options['project'])
+        if not options['all']:
+            tasks = tasks.annotate(rank_length=Length('rank')).filter(
+                Q(rank='') | Q(rank_length__gt=options['max_length'])
+            )
+        return list(tasks.values_list('project__team_id', 'project_id', 'status').distinct())
+
+    def handle(self, *args, **options):
+        total = 0
+        # Every team database has its own boards, each queried in its own context
+        for alias in settings.TENANT_DATABASES:
+            with using_alias(alias):
+                teams = defaultdict(list)
+                for team_id, project_id, status in self.columns(options):
+                    teams[team_id].append((project_id, status))
+
+                for team_id, columns in teams.items():
+                    # Written where the team lives now, not while it is being moved
+                    try:
+                        with team_writes(team_id):
+                            for project_id, status in columns:
+                                count = rebalance_column(project_id, status)
+                                total += count
+                                self.stdout.write(f'Rebalanced {count} tasks in {project_id} / {status}')
+                    except TeamMoving:
+                        self.stderr.write(self.style.WARNING(f'Skipped team {team_id} while it is being moved'))
+
+        self.stdout.write(self.style.SUCCESS(f'Rebalanced {total} tasks'))
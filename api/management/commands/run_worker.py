@@ -0,0 +1,27 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.jobs import claim_next, requeue_stale, run_job
+
+
+class Command(BaseCommand):
+    help = 'Process queued background jobs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Exit once the queue is empty')
+        parser.add_argument('--poll', type=float, default=settings.WORKER_POLL_SECONDS, help='Seconds to sleep when idle')
+
+    def handle(self, *args, **options):
+        while True:
+            requeue_stale()
+            current = claim_next()
+            if current is None:
+                if options['once']:
+                    return
+                time.sleep(options['poll'])
+                continue
+
+            current = run_job(current)
+            self.stdout.write(f'{current.kind} {current.id}: {current.status}')
@@ -0,0 +1,30 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.reminders import scan
+
+
+class Command(BaseCommand):
+    help = 'Scan for tasks coming due or overdue and send reminder digests'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Run a single scan and exit')
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=settings.REMINDER_SCAN_INTERVAL,
+            help='Seconds between scans'
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            result = scan()
+            self.stdout.write(
+                f"Sent {result['reminders']} reminders in {result['digests']} digests, "
+                f"{result['failed']} failed"
+            )
+            if options['once']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,61 @@
+import threading
+import time
+import uuid
+from collections import Counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.throttling import TokenBucket
+
+
+class Command(BaseCommand):
+    help = 'Hammer the Clerk token buckets from concurrent clients and report per-user fairness'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=5, help='Number of simulated users')
+        parser.add_argument('--threads', type=int, default=2, help='Concurrent clients per regular user')
+        parser.add_argument('--chatty-threads', type=int, default=20, help='Concurrent clients of the first user')
+        parser.add_argument('--duration', type=float, default=5.0, help='Seconds to run for')
+        parser.add_argument('--cost', type=int, default=5, help='Tokens charged per request')
+        parser.add_argument('--capacity', type=int, default=settings.CLERK_THROTTLE['CAPACITY'])
+        parser.add_argument('--refill-rate', type=float, default=settings.CLERK_THROTTLE['REFILL_RATE'])
+
+    def handle(self, *args, **options):
+        run_id = uuid.uuid4().hex[:8]
+        users = [f'load-{run_id}-{i}' for i in range(options['users'])]
+        allowed = Counter()
+        denied = Counter()
+        counter_lock = threading.Lock()
+        deadline = time.monotonic() + options['duration']
+
+        def client(user_id):
+            bucket = TokenBucket(user_id, options['capacity'], options['refill_rate'])
+            while time.monotonic() < deadline:
+                ok, _, wait = bucket.consume(options['cost'])
+                with counter_lock:
+                    (allowed if ok else denied)[user_id] += 1
+                # Well behaved clients honour Retry-After, the chatty one does not
+                if not ok and user_id != users[0]:
+                    time.sleep(min(wait, max(0, deadline - time.monotonic())))
+
+        threads = []
+        for index, user_id in enumerate(users):
+            count = options['chatty_threads'] if index == 0 else options['threads']
+            threads += [threading.Thread(target=client, args=(user_id,)) for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        budget = options['capacity'] + options['refill_rate'] * options['duration']
+        expected = int(budget // options['cost'])
+        for user_id in users:
+            self.stdout.write(
+                f'{user_id}: allowed={allowed[user_id]} denied={denied[user_id]} (budget {expected})'
+            )
+
+        # Jain's fairness index over admitted requests, 1.0 means perfectly fair
+        shares = [allowed[user_id] for user_id in users]
+        fairness = sum(shares) ** 2 / (len(shares) * sum(s * s for s in shares)) if any(shares) else 1.0
+        self.stdout.write(self.style.SUCCESS(f'Fairness index: {fairness:.3f}'))
@@ -0,0 +1,169 @@
+# membership.py
+# The teams, roles and projects a user belongs to, resolved once per request
+# (see ClerkUser.membership) and, when the cache backend is shared between
+# processes, across requests through the cache. TeamMembers and Projects
+# signals invalidate a user's entry by bumping its version, so a reader racing
+# with a change never stores a stale copy under the current key. A
+# per-process cache would miss the bumps made by other processes and keep a
+# removed member's access, so there membership is loaded on every request.
+# A user's teams can live in several databases (see tenancy.py), so
+# membership is read from all of them.
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+from django.db.models.signals import post_save, post_delete, pre_save
+from django.dispatch import receiver
+
+from .models import Projects, TeamMembers, Tasks, ArchivedTasks
+from .tenancy import fan_out, team_shards
+
+# Cache backends local to one process, invalidations made elsewhere don't reach them
+LOCAL_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+# Tasks without a project, or whose project is not being deleted
+NOT_PENDING_DELETION = Q(project__isnull=True) | Q(project__deletion_requested_at__isnull=True)
+
+
+class MembershipContext:
+    def __init__(self, roles, project_teams):
+        # team_id -> role
+        self.roles = roles
+        self.team_ids = list(roles)
+        # project_id -> team_id
+        self.project_teams = project_teams
+        self.project_ids = list(project_teams)
+
+    def role(self, team_id):
+        return self.roles.get(uuid.UUID(str(team_id))) if team_id else None
+
+    def is_member(self, team_id):
+        return self.role(team_id) is not None
+
+    def to_cache(self):
+        return {
+            'roles': {str(team_id): role for team_id, role in self.roles.items()},
+            'project_teams': {str(project_id): str(team_id) for project_id, team_id in self.project_teams.items()},
+        }
+
+    @classmethod
+    def from_cache(cls, data):
+        return cls(
+            {uuid.UUID(team_id): role for team_id, role in data['roles'].items()},
+            {uuid.UUID(project_id): uuid.UUID(team_id) for project_id, team_id in data['project_teams'].items()}
+        )
+
+
+def _version_key(user_id):
+    return f'membership_version:{user_id}'
+
+
+def _version(user_id):
+    version = cache.get(_version_key(user_id))
+    if version is None:
+        cache.add(_version_key(user_id), uuid.uuid4().hex, timeout=None)
+        version = cache.get(_version_key(user_id))
+    return version
+
+
+def _load_shard(user_id):
+    # Teams and projects pending deletion are left out, which hides them everywhere
+    roles = dict(
+        TeamMembers.objects.filter(
+            user_id=user_id,
+            team__deletion_requested_at__isnull=True
+        ).values_list('team_id', 'role')
+    )
+    project_teams = dict(
+        Projects.objects.filter(
+            team_id__in=list(roles),
+            deletion_requested_at__isnull=True
+        ).values_list('id', 'team_id')
+    )
+    return roles, project_teams
+
+
+def load_membership(user_id):
+    shards = fan_out(lambda alias: _load_shard(user_id), settings.TENANT_DATABASES)
+    found = team_shards(team_id for roles, _ in shards for team_id in roles)
+
+    roles, project_teams = {}, {}
+    for alias, (shard_roles, shard_projects) in zip(settings.TENANT_DATABASES, shards):
+        # Mid-move a team is in two databases, only the one in the directory counts
+        roles.update({team_id: role for team_id, role in shard_roles.items() if found[team_id][0] == alias})
+        project_teams.update({
+            project_id: team_id for project_id, team_id in shard_projects.items() if found[team_id][0] == alias
+        })
+    return MembershipContext(roles, project_teams)
+
+
+def shared_cache():
+    return settings.CACHES['default']['BACKEND'] not in LOCAL_CACHE_BACKENDS
+
+
+def get_membership(user_id):
+    if not shared_cache():
+        return load_membership(user_id)
+
+    key = f'membership:{user_id}:{_version(user_id)}'
+    data = cache.get(key)
+    # Entries cached before project_teams existed are reloaded
+    if data is not None and 'project_teams' in data:
+        return MembershipContext.from_cache(data)
+
+    membership = load_membership(user_id)
+    cache.set(key, membership.to_cache(), timeout=settings.MEMBERSHIP_CACHE_TIMEOUT)
+    return membership
+
+
+def visible_tasks(user):
+    """Tasks the user created, is assigned to, or that belong to their projects"""
+    return Tasks.objects.filter(
+        Q(assigned_to=user.id) |
+        Q(created_by=user.id) |
+        Q(project_id__in=user.membership.project_ids)
+    ).filter(NOT_PENDING_DELETION).select_related('project').distinct()
+
+
+def visible_archived_tasks(user):
+    return ArchivedTasks.objects.filter(
+        Q(assigned_to=user.id) |
+        Q(created_by=user.id) |
+        Q(project_id__in=user.membership.project_ids)
+    ).filter(NOT_PENDING_DELETION).distinct()
+
+
+def invalidate_membership(*user_ids):
+    for user_id in user_ids:
+        cache.set(_version_key(user_id), uuid.uuid4().hex, timeout=None)
+
+
+def invalidate_team(*team_ids):
+    team_ids = [team_id for team_id in team_ids if team_id]
+    if team_ids:
+        invalidate_membership(*TeamMembers.objects.filter(team_id__in=team_ids).values_list('user_id', flat=True))
+
+
+@receiver([post_save, post_delete], sender=TeamMembers)
+def team_member_changed(sender, instance, **kwargs):
+    invalidate_membership(instance.user_id)
+
+
+@receiver(pre_save, sender=Projects)
+def project_saving(sender, instance, **kwargs):
+    # Remember the previous team so its members are invalidated on a move
+    instance._previous_team_id = (
+        Projects.objects.filter(pk=instance.pk).values_list('team_id', flat=True).first()
+        if not instance._state.adding else None
+    )
+
+
+@receiver([post_save, post_delete], sender=Projects)
+def project_changed(sender, instance, **kwargs):
+    previous_team_id = getattr(instance, '_previous_team_id', None)
+    if kwargs.get('created') or previous_team_id != instance.team_id or kwargs['signal'] is post_delete:
+        invalidate_team(instance.team_id, previous_team_id)
@@ -1,12 +1,14 @@
 # models.py
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
-import uuid
 from django.utils import timezone
 from django.core.exceptions import ValidationError
 from django.db.models import Q
 
+from .fields import BinaryUUIDField, uuid7
+
 class Projects(models.Model):
-    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    id = BinaryUUIDField(primary_key=True, default=uuid7, editable=False)
     name = models.CharField(max_length=255)
     description = models.TextField()
     status = models.CharField(max_length=20, choices=[
@@ -18,20 +20,26 @@ class Projects(models.Model):
     created_at = models.DateTimeField(default=timezone.now)
     due_date = models.DateTimeField(null=True, blank=True)
     team = models.ForeignKey('Teams', on_delete=models.CASCADE, null=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+    # Set once all tasks and comments were moved to the archive tables
+    archived_at = models.DateTimeField(null=True, blank=True)
+    # Hidden everywhere while its rows are deleted in the background, see deletion.py
+    deletion_requested_at = models.DateTimeField(null=True, blank=True)
 
     class Meta:
         db_table = 'Projects'
 
 class Teams(models.Model):
-    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    id = BinaryUUIDField(primary_key=True, default=uuid7, editable=False)
     name = models.CharField(max_length=255)
     description = models.TextField()
+    deletion_requested_at = models.DateTimeField(null=True, blank=True)
 
     class Meta:
         db_table = 'Teams'
 
 class TeamMembers(models.Model):
-    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    id = BinaryUUIDField(primary_key=True, default=uuid7, editable=False)
     team = models.ForeignKey(Teams, on_delete=models.CASCADE)
     user_id = models.CharField(max_length=255, db_index=True)
     role = models.CharField(max_length=10, choices=[
@@ -45,7 +53,7 @@ class TeamMembers(models.Model):
         unique_together = ('team', 'user_id')
 
 class ProjectInvites(models.Model):
-    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    id = BinaryUUIDField(primary_key=True, default=uuid7, editable=False)
     team = models.ForeignKey(Teams, on_delete=models.CASCADE)
     email = models.EmailField()
     role = models.CharField(max_length=10, choices=[
@@ -73,7 +81,7 @@ class ProjectInvites(models.Model):
         ]
 
 class Tasks(models.Model):
-    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    id = BinaryUUIDField(primary_key=True, default=uuid7, editable=False)
     title = models.CharField(max_length=255)
     description = models.TextField()
     status = models.CharField(max_length=255, db_index=True, null=True, blank=True)
@@ -83,11 +91,21 @@ class Tasks(models.Model):
         ('high', 'High')
     ])
     due_date = models.DateTimeField(db_index=True)
+    # When due_date was last set or the task moved database (see team_moves.py),
+    # so reminder scans see tasks moved into their window
+    due_date_set_at = models.DateTimeField(default=timezone.now, db_index=True)
     created_at = models.DateTimeField(default=timezone.now, db_index=True)
     project = models.ForeignKey(Projects, on_delete=models.PROTECT, null=True, blank=True)
     assigned_to = models.CharField(max_length=255, null=True, blank=True)
     created_by = models.CharField(max_length=255, null=True)
     tags = models.JSONField()
+    # Fractional rank within the (project, status) column, see ranking.py
+    rank = models.CharField(max_length=255, default='', blank=True)
+    # RFC 5545 RRULE (e.g. FREQ=WEEKLY;BYDAY=MO) repeating the task from its due_date
+    recurrence = models.CharField(max_length=255, default='', blank=True)
+    # Set on occurrences of a recurring task that were edited and stored as real rows
+    recurrence_parent = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True, related_name='occurrences')
+    occurrence_date = models.DateTimeField(null=True, blank=True)
 
     def clean(self):
         if self.project and self.status not in self.project.task_statuses:
@@ -97,13 +115,170 @@ class Tasks(models.Model):
 
     class Meta:
         db_table = 'Tasks'
+        indexes = [
+            models.Index(fields=['project', 'status', 'rank'], name='tasks_board_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['recurrence_parent', 'occurrence_date'], name='tasks_unique_occurrence'),
+        ]
 
 class Comments(models.Model):
-    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    id = BinaryUUIDField(primary_key=True, default=uuid7, editable=False)
     task = models.ForeignKey(Tasks, on_delete=models.CASCADE)
     content = models.TextField()
     created_at = models.DateTimeField(default=timezone.now)
     created_by = models.CharField(max_length=255)
 
     class Meta:
-        db_table = 'Comments'
\ No newline at end of file
+        db_table = 'Comments'
+
+
+# Cold storage for tasks and comments of long completed projects, see archive.py.
+# Rows keep their original ids so they can be moved back when a project reopens.
+class ArchivedTasks(models.Model):
+    id = BinaryUUIDField(primary_key=True, editable=False)
+    title = models.CharField(max_length=255)
+    description = models.TextField()
+    status = models.CharField(max_length=255, null=True, blank=True)
+    priority = models.CharField(max_length=10)
+    due_date = models.DateTimeField()
+    created_at = models.DateTimeField()
+    project = models.ForeignKey(Projects, on_delete=models.PROTECT, null=True, blank=True)
+    assigned_to = models.CharField(max_length=255, null=True, blank=True)
+    created_by = models.CharField(max_length=255, null=True)
+    tags = models.JSONField()
+    rank = models.CharField(max_length=255, default='', blank=True)
+    recurrence = models.CharField(max_length=255, default='', blank=True)
+    recurrence_parent_id = BinaryUUIDField(null=True, blank=True)
+    occurrence_date = models.DateTimeField(null=True, blank=True)
+    archived_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        db_table = 'ArchivedTasks'
+
+class ArchivedComments(models.Model):
+    id = BinaryUUIDField(primary_key=True, editable=False)
+    task = models.ForeignKey(ArchivedTasks, on_delete=models.CASCADE)
+    content = models.TextField()
+    created_at = models.DateTimeField()
+    created_by = models.CharField(max_length=255)
+    archived_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        db_table = 'ArchivedComments'
+
+class BackgroundJobs(models.Model):
+    id = BinaryUUIDField(primary_key=True, default=uuid7, editable=False)
+    kind = models.CharField(max_length=50)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=[
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed')
+    ], default='pending')
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True, default='')
+    attempts = models.PositiveIntegerField(default=0)
+    created_by = models.CharField(max_length=255, null=True, blank=True)
+    # Database the job's team data lives in, see tenancy.py
+    tenant_alias = models.CharField(max_length=100, default='default')
+    created_at = models.DateTimeField(default=timezone.now)
+    run_after = models.DateTimeField(default=timezone.now)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'BackgroundJobs'
+        indexes = [
+            models.Index(fields=['status', 'run_after']),
+        ]
+
+# Reminder scanning state, see reminders.py
+class ReminderWatermarks(models.Model):
+    # '<kind>' for the default database, '<kind>@<alias>' for other shards
+    kind = models.CharField(max_length=120, primary_key=True)
+    # Everything due up to this point has been scanned
+    watermark = models.DateTimeField()
+    last_run_at = models.DateTimeField()
+
+    class Meta:
+        db_table = 'ReminderWatermarks'
+
+class SentReminders(models.Model):
+    id = BinaryUUIDField(primary_key=True, default=uuid7, editable=False)
+    task = models.ForeignKey(Tasks, on_delete=models.CASCADE)
+    kind = models.CharField(max_length=20, choices=[
+        ('due_soon', 'Due Soon'),
+        ('overdue', 'Overdue')
+    ])
+    # A task moved to another due date is reminded about again
+    due_date = models.DateTimeField()
+    user_id = models.CharField(max_length=255)
+    # Pending until the digest holding the reminder was delivered
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'SentReminders'
+        unique_together = ('task', 'kind', 'due_date')
+
+# Append-only history of changes, see activity.py. Ids are plain columns so
+# the history outlives the rows it describes.
+class ActivityLogs(models.Model):
+    id = BinaryUUIDField(primary_key=True, default=uuid7, editable=False)
+    project_id = BinaryUUIDField(null=True, blank=True)
+    task_id = BinaryUUIDField(null=True, blank=True)
+    team_id = BinaryUUIDField(null=True, blank=True)
+    entity = models.CharField(max_length=20, choices=[
+        ('task', 'Task'),
+        ('comment', 'Comment'),
+        ('team_member', 'Team Member'),
+        ('invite', 'Invite')
+    ])
+    entity_id = BinaryUUIDField()
+    action = models.CharField(max_length=10, choices=[
+        ('create', 'Create'),
+        ('update', 'Update'),
+        ('delete', 'Delete')
+    ])
+    # {field: [old, new]}
+    changes = models.JSONField(default=dict)
+    actor = models.CharField(max_length=255, null=True, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        db_table = 'ActivityLogs'
+        indexes = [
+            models.Index(fields=['project_id', 'created_at', 'id'], name='activity_project_idx'),
+            models.Index(fields=['task_id', 'created_at', 'id'], name='activity_task_idx'),
+            models.Index(fields=['created_at'], name='activity_created_idx'),
+        ]
+
+
+# Precomputed home screen document of a user, see snapshots.py
+class UserSnapshots(models.Model):
+    user_id = models.CharField(max_length=255, primary_key=True)
+    # Lets invite changes find the snapshots of the invited email
+    email = models.CharField(max_length=255, null=True, blank=True, db_index=True)
+    document = models.JSONField(default=dict, encoder=DjangoJSONEncoder)
+    version = models.PositiveBigIntegerField(default=0)
+    # Sections to rebuild on the next refresh
+    dirty = models.JSONField(default=list)
+    stale_since = models.DateTimeField(null=True, blank=True)
+    refreshed_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        db_table = 'UserSnapshots'
+
+
+# Database alias holding each team's rows, see tenancy.py. Teams without a
+# row live in the default database.
+class TeamShards(models.Model):
+    team_id = BinaryUUIDField(primary_key=True)
+    alias = models.CharField(max_length=100)
+    # Set while the team is being moved, writes to it are refused meanwhile
+    read_only = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        db_table = 'TeamShards'
@@ -0,0 +1,15 @@
+# negotiation.py
+# Content negotiation for endpoints that pick their own output format, like
+# the project export. DRF would otherwise treat `?format=csv` as a renderer
+# override and answer 404 or 406 before the view could stream anything.
+from rest_framework.negotiation import BaseContentNegotiation
+
+
+class IgnoreClientContentNegotiation(BaseContentNegotiation):
+    """Always use the view's first parser and renderer, whatever the client asks for"""
+
+    def select_parser(self, request, parsers):
+        return parsers[0]
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        return renderers[0], renderers[0].media_type
@@ -0,0 +1,40 @@
+# pagination.py
+import base64
+import json
+
+
+def encode_cursor(*values):
+    """Encode the keyset position of the last returned row as an opaque string"""
+    raw = json.dumps([str(value) for value in values]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor, *parsers):
+    """Decode a cursor produced by encode_cursor, returning None if it is invalid.
+
+    Each value is converted by the matching parser, which raises ValueError
+    for a value that could not have come from encode_cursor.
+    """
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(values, list) or len(values) != len(parsers):
+        return None
+    if not all(isinstance(value, str) for value in values):
+        return None
+    try:
+        return [parse(value) for parse, value in zip(parsers, values)]
+    except ValueError:
+        return None
+
+
+def parse_limit(value, default, maximum):
+    try:
+        limit = int(value)
+    except (TypeError, ValueError):
+        return default
+    return max(1, min(limit, maximum))
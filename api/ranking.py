@@ -0,0 +1,208 @@
+# ranking.py
+# Fractional, lexicographically sortable ranks for ordering tasks inside a
+# status column. A rank is a string of base-36 digits read as a fraction
+# (0.xyz...), so a new rank can always be generated between two neighbours
+# and moving a card only rewrites that card's row.
+#
+# Only digits and lowercase letters are used so the ordering is the same under
+# MySQL's case-insensitive collations as it is in Python.
+from django.conf import settings
+from django.db import transaction
+
+from .jobs import job, enqueue
+from .models import BackgroundJobs, Projects, Tasks
+from .tenancy import current_alias, locate, team_writes
+
+DIGITS = '0123456789abcdefghijklmnopqrstuvwxyz'
+BASE = len(DIGITS)
+
+
+def _digit(rank, index):
+    return DIGITS.index(rank[index]) if index < len(rank) else 0
+
+
+def _midpoint(before, after):
+    """Return a rank strictly between before ('' = start) and after (None = end)"""
+    if after is not None:
+        # Skip the shared prefix, treating missing digits of `before` as zeros
+        n = 0
+        while n < len(after) and _digit(before, n) == DIGITS.index(after[n]):
+            n += 1
+        if n > 0:
+            return after[:n] + _midpoint(before[n:], after[n:])
+
+    low = _digit(before, 0)
+    high = DIGITS.index(after[0]) if after is not None else BASE
+
+    if high - low > 1:
+        if after is None and before:
+            # Appending steps one digit at a time so the column end grows slowly
+            return DIGITS[low + 1]
+        return DIGITS[(low + high) // 2]
+    if after is not None and len(after) > 1:
+        return after[0]
+    return DIGITS[low] + _midpoint(before[1:], None)
+
+
+def validate_rank(rank):
+    if not rank or rank[-1] == DIGITS[0] or any(c not in DIGITS for c in rank):
+        raise ValueError(f'Invalid rank: {rank!r}')
+
+
+def parse_rank(rank):
+    """A stored rank read back from a cursor; unranked tasks have ''"""
+    if rank:
+        validate_rank(rank)
+    return rank
+
+
+def rank_between(before=None, after=None):
+    """Generate a rank that sorts after `before` and before `after`.
+
+    Either bound may be None to mean the start or end of the column.
+    """
+    if before:
+        validate_rank(before)
+    if after:
+        validate_rank(after)
+        if before and before >= after:
+            raise ValueError(f'{before!r} must sort before {after!r}')
+    return _midpoint(before or '', after or None)
+
+
+def _encode(value, width):
+    """Fixed width base-36 digits of `value`, without the trailing zeros ranks may not have"""
+    digits = []
+    for _ in range(width):
+        value, remainder = divmod(value, BASE)
+        digits.append(DIGITS[remainder])
+    return ''.join(reversed(digits)).rstrip(DIGITS[0])
+
+
+def spread_ranks(total):
+    """Return `total` evenly spaced ranks, used when rebalancing a column.
+
+    The ranks only cover the first half of the key space, leaving the end of
+    the column free for the short ranks appended tasks get.
+    """
+    if total <= 0:
+        return []
+    width = 1
+    while BASE ** width <= total * 4:
+        width += 1
+    step = BASE ** width // (total * 2)
+    return [_encode(step * i, width) for i in range(1, total + 1)]
+
+
+def rank_sequence(after=None, width=4):
+    """Yield an endless run of increasing ranks sorting after `after`.
+
+    Used to append many tasks at once: every rank shares one short prefix
+    followed by a fixed width counter, so they stay short however many there are.
+    """
+    prefix = rank_between(after, None)
+    while True:
+        for i in range(1, BASE ** width):
+            rank = prefix + _encode(i, width)
+            yield rank
+        prefix = rank_between(rank, None)
+
+
+def last_rank(project_id, status):
+    return (
+        Tasks.objects
+        .filter(project_id=project_id, status=status)
+        .exclude(rank='')
+        .order_by('-rank')
+        .values_list('rank', flat=True)
+        .first()
+    )
+
+
+def schedule_rebalance(project_id, status, rank):
+    """Queue a background rebalance of the column once its ranks grow too long"""
+    if len(rank) <= settings.TASK_RANK_REBALANCE_LENGTH:
+        return
+    payload = {'project_id': str(project_id), 'status': status}
+    pending = BackgroundJobs.objects.filter(
+        kind='rebalance_column',
+        status='pending',
+        payload__project_id=payload['project_id'],
+        payload__status=status
+    )
+    if not pending.exists():
+        enqueue('rebalance_column', payload)
+
+
+def next_rank(project_id, status):
+    """Rank for a task appended to the bottom of a column"""
+    rank = rank_between(last_rank(project_id, status), None)
+    schedule_rebalance(project_id, status, rank)
+    return rank
+
+
+def rebalance_column(project_id, status):
+    """Rewrite the ranks of one column with short, evenly spaced values"""
+    with transaction.atomic(using=current_alias()):
+        tasks = list(
+            Tasks.objects
+            .select_for_update()
+            .filter(project_id=project_id, status=status)
+            .order_by('rank', 'created_at', 'id')
+            .only('id', 'rank')
+        )
+        if not tasks:
+            # The column emptied before a queued rebalance ran
+            return 0
+        for task, rank in zip(tasks, spread_ranks(len(tasks))):
+            task.rank = rank
+        Tasks.objects.bulk_update(tasks, ['rank'], batch_size=500)
+    return len(tasks)
+
+
+def _neighbour_ranks(task, status, before_id, after_id):
+    column = (
+        Tasks.objects
+        .filter(project_id=task.project_id, status=status)
+        .exclude(id=task.id)
+        .values_list('rank', flat=True)
+    )
+    before = column.get(id=before_id) if before_id else None
+    after = column.get(id=after_id) if after_id else None
+
+    if before_id and not after_id:
+        after = column.filter(rank__gt=before).order_by('rank').first()
+    elif after_id and not before_id:
+        before = column.filter(rank__lt=after).order_by('-rank').first()
+    elif not before_id and not after_id:
+        before = column.order_by('-rank').first()
+    return before, after
+
+
+def move_rank(task, status, before_id=None, after_id=None):
+    """Rank placing `task` between two neighbours of the target column.
+
+    With a single neighbour the task is placed right next to it, with none it
+    goes to the bottom of the column. Columns holding unranked or colliding
+    rows are rebalanced once before retrying. Raises Tasks.DoesNotExist when a
+    neighbour is not in the target column.
+    """
+    for _ in range(2):
+        before, after = _neighbour_ranks(task, status, before_id, after_id)
+        if before != '' and after != '':
+            try:
+                rank = rank_between(before, after)
+                schedule_rebalance(task.project_id, status, rank)
+                return rank
+            except ValueError:
+                pass
+        rebalance_column(task.project_id, status)
+    raise ValueError('Could not place task between the given neighbours')
+
+
+@job('rebalance_column')
+def rebalance_column_job(current):
+    _, team_id = locate(Projects, current.payload['project_id'], 'team_id')
+    with team_writes(team_id):
+        count = rebalance_column(current.payload['project_id'], current.payload['status'])
+    return {'rebalanced': count}
@@ -0,0 +1,86 @@
+# recurrence.py
+# Recurring tasks are stored once, as a task with an RRULE. Occurrences are
+# expanded on the fly for the requested window only (and cached), and become
+# real rows only when one of them is edited, see materialize_occurrence().
+import hashlib
+from datetime import timedelta
+
+from dateutil.rrule import rrulestr
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+
+from .models import Tasks
+from .ranking import next_rank
+
+MAX_OCCURRENCES = 1000
+
+
+def parse_rule(rule, dtstart):
+    return rrulestr(rule, dtstart=dtstart)
+
+
+def validate_rule(rule, dtstart):
+    """Raise ValueError if `rule` is not a usable RRULE"""
+    if rule.upper().startswith('DTSTART') or '\n' in rule:
+        raise ValueError('Only a single RRULE is supported, it starts at the due date.')
+    parse_rule(rule, dtstart)
+
+
+def series_start(task):
+    # rrule drops microseconds from its start
+    return task.due_date.replace(microsecond=0)
+
+
+def _cache_key(task, start, end):
+    raw = f'{task.id}|{task.recurrence}|{task.due_date.isoformat()}|{start.isoformat()}|{end.isoformat()}'
+    return 'occurrences:' + hashlib.md5(raw.encode()).hexdigest()
+
+
+def occurrence_dates(task, start, end):
+    """Occurrence datetimes of `task` in [start, end), excluding the stored first one"""
+    key = _cache_key(task, start, end)
+    dates = cache.get(key)
+    if dates is None:
+        dates = []
+        for occurrence in parse_rule(task.recurrence, series_start(task)).xafter(start, inc=True):
+            if occurrence >= end or len(dates) >= MAX_OCCURRENCES:
+                break
+            if occurrence != series_start(task):
+                dates.append(occurrence)
+        cache.set(key, dates, timeout=settings.CALENDAR_CACHE_TIMEOUT)
+    return dates
+
+
+def materialize_occurrence(task, occurrence_date):
+    """Return the real row for one occurrence of a recurring task, creating it if needed"""
+    if occurrence_date == series_start(task):
+        raise ValueError('The first occurrence is the task itself, edit it directly.')
+    if occurrence_date not in occurrence_dates(task, occurrence_date, occurrence_date + timedelta(seconds=1)):
+        raise ValueError('The task does not occur at that date.')
+
+    existing = Tasks.objects.filter(recurrence_parent=task, occurrence_date=occurrence_date).first()
+    if existing:
+        return existing, False
+
+    occurrence = Tasks(
+        title=task.title,
+        description=task.description,
+        status=task.status,
+        priority=task.priority,
+        due_date=occurrence_date,
+        project=task.project,
+        assigned_to=task.assigned_to,
+        created_by=task.created_by,
+        tags=task.tags,
+        rank=next_rank(task.project_id, task.status) if task.project_id else '',
+        recurrence_parent=task,
+        occurrence_date=occurrence_date
+    )
+    try:
+        with transaction.atomic(using=task._state.db):
+            occurrence.save()
+    except IntegrityError:
+        # Materialized concurrently by another request
+        return Tasks.objects.get(recurrence_parent=task, occurrence_date=occurrence_date), False
+    return occurrence, True
@@ -0,0 +1,198 @@
+# reminders.py
+# Incremental due-soon / overdue reminder scanning. Each kind keeps a
+# high-water mark of the due dates it has already looked at, so a scan only
+# range-scans the due_date index between the previous mark and the new one
+# (plus tasks whose due date was set since the last run, by creating them or
+# editing it, to a date the mark already passed). The cost of a scan grows
+# with the tasks entering the window, not with the table.
+# Every task a scan finds is queued as a pending SentReminders row before the
+# marks move on, and stays pending until a digest holding it was delivered,
+# so a failed delivery is retried from that row without holding back the
+# marks. Each team database (see tenancy.py) is scanned with marks of its own,
+# and a user gets one digest across all of them. Tasks of a team being moved
+# are left to its new database, where the move makes them due for a rescan.
+import json
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models.signals import pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .activity import changes_field
+from .membership import NOT_PENDING_DELETION
+from .models import Tasks, ReminderWatermarks, SentReminders
+from .tenancy import using_alias, writable_teams
+
+
+class ConsoleBackend:
+    def send_digest(self, user_id, reminders):
+        print(f"Reminders for {user_id}:")
+        for reminder in reminders:
+            print(f"  [{reminder['kind']}] {reminder['title']} due {reminder['due_date']}")
+
+
+class FileBackend:
+    """Append one JSON line per digest to settings.REMINDER_FILE_PATH"""
+
+    def send_digest(self, user_id, reminders):
+        with open(settings.REMINDER_FILE_PATH, 'a', encoding='utf-8') as output:
+            output.write(json.dumps({
+                'user_id': user_id,
+                'sent_at': timezone.now(),
+                'reminders': reminders
+            }, default=str) + '\n')
+
+
+def get_backend():
+    return import_string(settings.REMINDER_BACKEND)()
+
+
+def _is_done(task):
+    # The last column of a project's workflow is its "done" state
+    if task.project_id and task.project.task_statuses:
+        return task.status == task.project.task_statuses[-1]
+    return task.status == 'Done'
+
+
+def _mark_key(kind, alias):
+    return kind if alias == DEFAULT_DB_ALIAS else f'{kind}@{alias}'
+
+
+def _candidates(kind, now, alias=DEFAULT_DB_ALIAS):
+    """Tasks that entered the kind's window since its last scan, and the new mark"""
+    lookback = timedelta(hours=settings.REMINDER_INITIAL_LOOKBACK_HOURS)
+    upper = now + timedelta(hours=settings.REMINDER_DUE_SOON_HOURS) if kind == 'due_soon' else now
+    floor = now if kind == 'due_soon' else now - lookback
+
+    mark = ReminderWatermarks.objects.filter(kind=_mark_key(kind, alias)).first()
+    lower = mark.watermark if mark else upper - lookback
+
+    # Range scan over the due_date index
+    queries = [Tasks.objects.filter(due_date__gt=max(lower, floor), due_date__lte=upper)]
+    if mark:
+        # Tasks given a due date the mark already passed since the last run,
+        # a range scan over the due_date_set_at index
+        queries.append(Tasks.objects.filter(
+            due_date_set_at__gt=mark.last_run_at,
+            due_date__gt=floor,
+            due_date__lte=upper
+        ))
+
+    tasks = {}
+    for query in queries:
+        for task in query.filter(NOT_PENDING_DELETION).select_related('project'):
+            tasks[task.id] = task
+    tasks = [task for task in tasks.values() if not _is_done(task)]
+    writable = _writable(tasks, alias)
+    return [task for task in tasks if task.id in writable], upper
+
+
+def _writable(tasks, alias):
+    """Ids of the tasks whose team accepts writes in `alias`, personal tasks included"""
+    # Skip teams being moved and copies a finished move left behind
+    teams = writable_teams({task.project.team_id for task in tasks if task.project_id}, alias)
+    return {
+        task.id for task in tasks
+        if not task.project_id or not task.project.team_id or task.project.team_id in teams
+    }
+
+
+def _queue(now, alias):
+    """Record a pending reminder for every task entering a window, then move the marks"""
+    for kind in ('due_soon', 'overdue'):
+        tasks, watermark = _candidates(kind, now, alias)
+        # Tasks reminded about at this due date already conflict and are skipped
+        SentReminders.objects.using(alias).bulk_create([
+            SentReminders(
+                task=task,
+                kind=kind,
+                due_date=task.due_date,
+                user_id=task.assigned_to or task.created_by
+            )
+            for task in tasks if task.assigned_to or task.created_by
+        ], ignore_conflicts=True)
+        ReminderWatermarks.objects.update_or_create(
+            kind=_mark_key(kind, alias),
+            defaults={'watermark': watermark, 'last_run_at': now}
+        )
+
+
+def _still_due(reminder, now):
+    task = reminder.task
+    if task.due_date != reminder.due_date or _is_done(task):
+        return False
+    if task.project_id and task.project.deletion_requested_at:
+        return False
+    return reminder.kind == 'overdue' or task.due_date > now
+
+
+def _pending(now, alias):
+    """Reminders of `alias` not delivered yet, dropping those that no longer apply"""
+    reminders = list(
+        SentReminders.objects.using(alias)
+        .filter(sent_at__isnull=True)
+        .select_related('task__project')
+        .order_by('kind', 'due_date')
+    )
+    writable = _writable([reminder.task for reminder in reminders], alias)
+    reminders = [reminder for reminder in reminders if reminder.task_id in writable]
+    stale = [reminder.id for reminder in reminders if not _still_due(reminder, now)]
+    SentReminders.objects.using(alias).filter(id__in=stale).delete()
+    return [reminder for reminder in reminders if reminder.id not in stale]
+
+
+def scan(now=None, backend=None):
+    """Run one scan, deliver the digests and return counts of what was sent"""
+    now = now or timezone.now()
+    backend = backend or get_backend()
+
+    digests = defaultdict(list)
+    for alias in settings.TENANT_DATABASES:
+        with using_alias(alias):
+            _queue(now, alias)
+            for reminder in _pending(now, alias):
+                digests[reminder.user_id].append(reminder)
+
+    delivered = failed = 0
+    for user_id, reminders in digests.items():
+        try:
+            backend.send_digest(user_id, [
+                {
+                    'kind': reminder.kind,
+                    'task_id': str(reminder.task_id),
+                    'title': reminder.task.title,
+                    'due_date': reminder.due_date.isoformat(),
+                    'project_id': str(reminder.task.project_id) if reminder.task.project_id else None,
+                    'project_name': reminder.task.project.name if reminder.task.project_id else None,
+                }
+                for reminder in reminders
+            ])
+        except Exception as e:
+            # Left pending, the next scan tries again
+            print(f"Error sending reminders to {user_id}: {str(e)}")
+            failed += 1
+            continue
+        by_alias = defaultdict(list)
+        for reminder in reminders:
+            by_alias[reminder._state.db].append(reminder.id)
+        for alias, ids in by_alias.items():
+            SentReminders.objects.using(alias).filter(id__in=ids).update(sent_at=timezone.now())
+        delivered += len(reminders)
+
+    return {
+        'digests': len(digests) - failed,
+        'reminders': delivered,
+        'failed': failed,
+    }
+
+
+@receiver(pre_save, sender=Tasks)
+def due_date_saving(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and 'due_date' not in update_fields:
+        return
+    if changes_field(instance, 'due_date'):
+        instance.due_date_set_at = timezone.now()
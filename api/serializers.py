@@ -1,8 +1,9 @@
 from rest_framework import serializers
 from django.utils import timezone
-from .models import Projects, Teams, TeamMembers, Tasks, Comments, ProjectInvites
+from .models import Projects, Teams, TeamMembers, Tasks, Comments, ProjectInvites, ArchivedTasks, ArchivedComments, BackgroundJobs, ActivityLogs
 from clerk_backend_api import Clerk
 from django.conf import settings
+from .recurrence import validate_rule
 import os
 
 
@@ -10,7 +11,7 @@ class TeamSerializer(serializers.ModelSerializer):
     class Meta:
         model = Teams
         fields = '__all__'
-        read_only_fields = ('id',)
+        read_only_fields = ('id', 'deletion_requested_at')
 
 
 class TeamMemberSerializer(serializers.ModelSerializer):
@@ -32,14 +33,14 @@ class ProjectDetailSerializer(serializers.ModelSerializer):
     class Meta:
         model = Projects
         fields = '__all__'
-        read_only_fields = ('id', 'created_at')
+        read_only_fields = ('id', 'created_at', 'completed_at', 'archived_at', 'deletion_requested_at')
 
 
 class TaskSerializer(serializers.ModelSerializer):
     class Meta:
         model = Tasks
         fields = '__all__'
-        read_only_fields = ('id', 'created_at')
+        read_only_fields = ('id', 'created_at', 'rank', 'recurrence_parent', 'occurrence_date', 'due_date_set_at')
 
     def validate(self, data):
         project = data.get('project', None)
@@ -71,6 +72,16 @@ class TaskSerializer(serializers.ModelSerializer):
         elif not status:
             data['status'] = 'Todo'
 
+        recurrence = data.get('recurrence')
+        if recurrence:
+            due_date = data.get('due_date') or getattr(self.instance, 'due_date', None)
+            try:
+                validate_rule(recurrence, due_date)
+            except (ValueError, TypeError) as e:
+                raise serializers.ValidationError({
+                    'recurrence': f'Invalid recurrence rule: {str(e)}'
+                })
+
         return data
 
 
@@ -80,7 +91,7 @@ class ProjectBasicSerializer(serializers.ModelSerializer):
     class Meta:
         model = Projects
         fields = '__all__'
-        read_only_fields = ('id', 'created_at')
+        read_only_fields = ('id', 'created_at', 'completed_at', 'archived_at', 'deletion_requested_at')
 
     def get_members(self, obj):
         try:
@@ -118,7 +129,7 @@ class ProjectSerializer(serializers.ModelSerializer):
     class Meta:
         model = Projects
         fields = '__all__'
-        read_only_fields = ('id', 'created_at')
+        read_only_fields = ('id', 'created_at', 'completed_at', 'archived_at', 'deletion_requested_at')
 
 
 class TaskWithProjectSerializer(serializers.ModelSerializer):
@@ -127,7 +138,7 @@ class TaskWithProjectSerializer(serializers.ModelSerializer):
     class Meta:
         model = Tasks
         fields = '__all__'
-        read_only_fields = ('id', 'created_at')
+        read_only_fields = ('id', 'created_at', 'rank', 'recurrence_parent', 'occurrence_date', 'due_date_set_at')
 
     def validate(self, data):
         project = data.get('project', None)
@@ -158,13 +169,25 @@ class CommentSerializer(serializers.ModelSerializer):
         read_only_fields = ('id', 'created_at')
 
 
+class ArchivedTaskSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ArchivedTasks
+        fields = '__all__'
+
+
+class ArchivedCommentSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ArchivedComments
+        fields = '__all__'
+
+
 class ProjectWithTasksSerializer(serializers.ModelSerializer):
     tasks = serializers.SerializerMethodField()
 
     class Meta:
         model = Projects
         fields = '__all__'
-        read_only_fields = ('id', 'created_at')
+        read_only_fields = ('id', 'created_at', 'completed_at', 'archived_at', 'deletion_requested_at')
 
     def get_tasks(self, obj):
         # Get only tasks assigned to the current user
@@ -188,4 +211,41 @@ class InviteRequestSerializer(serializers.Serializer):
 
 class InviteResponseSerializer(serializers.Serializer):
     invite_id = serializers.UUIDField()
-    response = serializers.ChoiceField(choices=['accepted', 'declined'])
\ No newline at end of file
+    response = serializers.ChoiceField(choices=['accepted', 'declined'])
+
+
+class TaskMoveSerializer(serializers.Serializer):
+    status = serializers.CharField(required=False)
+    before = serializers.UUIDField(required=False, allow_null=True)
+    after = serializers.UUIDField(required=False, allow_null=True)
+
+
+class BackgroundJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = BackgroundJobs
+        fields = ('id', 'kind', 'status', 'result', 'attempts', 'created_at', 'started_at', 'finished_at')
+
+
+class OccurrenceSerializer(serializers.Serializer):
+    occurrence_date = serializers.DateTimeField()
+
+
+class ActivityLogSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ActivityLogs
+        fields = ('id', 'project_id', 'task_id', 'entity', 'entity_id', 'action', 'changes', 'actor', 'created_at')
+
+
+class BatchItemSerializer(serializers.Serializer):
+    method = serializers.ChoiceField(choices=['GET', 'POST', 'PUT', 'PATCH', 'DELETE'], default='GET')
+    path = serializers.CharField(max_length=2000)
+    body = serializers.JSONField(required=False)
+
+    def validate_path(self, value):
+        if not value.startswith('/'):
+            raise serializers.ValidationError('Path must start with /')
+        return value
+
+
+class BatchRequestSerializer(serializers.Serializer):
+    requests = BatchItemSerializer(many=True, allow_empty=False, max_length=settings.BATCH_MAX_REQUESTS)
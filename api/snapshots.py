@@ -0,0 +1,294 @@
+# snapshots.py
+# Precomputed home screen documents served by GET /me/snapshot/. Each user's
+# document is stored in UserSnapshots, so reading it is one primary key
+# lookup. The document is split into sections; model signals mark just the
+# sections a change affects as dirty for just the users it affects, and a
+# `refresh_snapshot` job rebuilds those sections in the worker. `version`
+# goes up on every refresh so clients can tell whether anything changed.
+# Marking runs once the change commits, with plain updates, so saves don't
+# wait on snapshot row locks, and queues a refresh for every snapshot that has
+# none waiting, so one whose refresh failed for good is retried on the next
+# change. A user's first snapshot is built in the worker too; until then they
+# get an empty one marked stale.
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q, Value
+from django.db.models.functions import Coalesce
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .activity import activity_suppressed, previous_values
+from .authentication import ClerkUser
+from .clerk_users import get_user_profile, get_user_profiles
+from .jobs import job, enqueue_on_commit
+from .models import UserSnapshots, Projects, TeamMembers, Tasks, ProjectInvites, BackgroundJobs
+from .serializers import ProjectDetailSerializer, TaskSerializer
+from .tenancy import current_alias, fan_out, merge_data, user_aliases
+
+SECTIONS = ('projects', 'tasks', 'invites')
+
+# Served while a new user's first snapshot is being built
+EMPTY_DOCUMENT = {
+    'projects': [],
+    'tasks': {'personal_tasks': [], 'project_tasks': []},
+    'invites': [],
+}
+
+
+def _projects(user):
+    """The user's projects, each with its members' profiles like basic_projects"""
+    projects = list(Projects.objects.filter(id__in=user.membership.project_ids))
+    members = list(TeamMembers.objects.filter(team_id__in={project.team_id for project in projects}))
+    profiles = get_user_profiles(member.user_id for member in members)
+
+    by_team = defaultdict(list)
+    for member in members:
+        profile = profiles.get(member.user_id)
+        if profile:
+            by_team[member.team_id].append({**profile, 'role': member.role})
+
+    data = []
+    for project in projects:
+        project_data = ProjectDetailSerializer(project).data
+        project_data['members'] = by_team[project.team_id]
+        data.append(project_data)
+    return data
+
+
+def _tasks(user):
+    """Personal tasks and assigned project tasks, like user_visible_tasks"""
+    personal_tasks = Tasks.objects.filter(
+        Q(assigned_to=user.id) | Q(created_by=user.id),
+        project__isnull=True
+    )
+    assigned = defaultdict(list)
+    for task in Tasks.objects.filter(project_id__in=user.membership.project_ids, assigned_to=user.id):
+        assigned[task.project_id].append(task)
+
+    project_tasks = []
+    for project in Projects.objects.filter(id__in=list(assigned)):
+        project_data = ProjectDetailSerializer(project).data
+        project_data['tasks'] = TaskSerializer(assigned[project.id], many=True).data
+        project_tasks.append(project_data)
+
+    return {
+        'personal_tasks': TaskSerializer(personal_tasks, many=True).data,
+        'project_tasks': project_tasks
+    }
+
+
+def _email(user):
+    """The user's email, or the one stored with their snapshot while Clerk can't be reached"""
+    profile = get_user_profile(user.id)
+    if profile:
+        return profile.get('email')
+    return UserSnapshots.objects.filter(user_id=user.id).values_list('email', flat=True).first()
+
+
+def _invites(user):
+    """Pending invites for the user's email, like pending_invites"""
+    email = _email(user)
+    if not email:
+        return []
+    invites = ProjectInvites.objects.filter(
+        email=email,
+        status='pending',
+        team__deletion_requested_at__isnull=True
+    ).select_related('team')
+    projects = {
+        project.team_id: project
+        for project in Projects.objects.filter(
+            team_id__in=[invite.team_id for invite in invites],
+            deletion_requested_at__isnull=True
+        )
+    }
+    return [
+        {
+            'invite_id': invite.id,
+            'project_id': projects[invite.team_id].id,
+            'project_name': projects[invite.team_id].name,
+            'team_id': invite.team.id,
+            'team_name': invite.team.name,
+            'role': invite.role,
+            'invited_at': invite.invited_at
+        }
+        for invite in invites if invite.team_id in projects
+    ]
+
+
+BUILDERS = {
+    'projects': _projects,
+    'tasks': _tasks,
+    'invites': _invites,
+}
+
+
+def build_section(section, user):
+    """Build a section on every database holding the user's data and merge the parts"""
+    # Invites come from any team, not just the user's
+    aliases = settings.TENANT_DATABASES if section == 'invites' else user_aliases(user)
+    return merge_data(fan_out(lambda alias: BUILDERS[section](user), aliases))
+
+
+def refresh_snapshot(user_id):
+    """Rebuild the dirty sections of the user's snapshot, or all of a new one"""
+    with transaction.atomic():
+        snapshot, _ = UserSnapshots.objects.select_for_update().get_or_create(user_id=user_id)
+        sections = snapshot.dirty if snapshot.version else list(SECTIONS)
+        # Changes made while the sections are built mark them dirty again
+        snapshot.dirty = []
+        snapshot.stale_since = None
+        snapshot.save(update_fields=['dirty', 'stale_since'])
+
+    user = ClerkUser(user_id)
+    try:
+        built = {section: build_section(section, user) for section in sections}
+    except Exception:
+        # Keep the sections dirty for the job's next attempt
+        with transaction.atomic():
+            snapshot = UserSnapshots.objects.select_for_update().get(user_id=user_id)
+            snapshot.dirty = sorted(set(snapshot.dirty) | set(sections))
+            snapshot.stale_since = snapshot.stale_since or timezone.now()
+            snapshot.save(update_fields=['dirty', 'stale_since'])
+        raise
+
+    with transaction.atomic():
+        snapshot = UserSnapshots.objects.select_for_update().get(user_id=user_id)
+        snapshot.document = {**snapshot.document, **built}
+        snapshot.email = _email(user)
+        snapshot.version += 1
+        snapshot.refreshed_at = timezone.now()
+        snapshot.save(update_fields=['document', 'email', 'version', 'refreshed_at'])
+    return snapshot
+
+
+def _queue_refresh(user_ids):
+    """Queue a refresh for each of the users that has none waiting to run.
+
+    A running refresh does not count, it may have started before the change.
+    """
+    user_ids = set(user_ids)
+    waiting = set(
+        BackgroundJobs.objects
+        .filter(kind='refresh_snapshot', status='pending', payload__user_id__in=list(user_ids))
+        .values_list('payload__user_id', flat=True)
+    )
+    for user_id in user_ids - waiting:
+        enqueue_on_commit('refresh_snapshot', {'user_id': user_id})
+
+
+def _mark(sections, user_ids, emails):
+    rows = list(
+        UserSnapshots.objects
+        .filter(Q(user_id__in=user_ids) | Q(email__in=emails))
+        .values_list('user_id', 'dirty', 'stale_since')
+    )
+    # Snapshots sharing the same new dirty sections get one update
+    groups = defaultdict(list)
+    for user_id, dirty, stale_since in rows:
+        if stale_since is None or not set(sections) <= set(dirty):
+            groups[tuple(sorted(set(dirty) | set(sections)))].append(user_id)
+
+    now = timezone.now()
+    for dirty, snapshot_ids in groups.items():
+        UserSnapshots.objects.filter(user_id__in=snapshot_ids).update(
+            dirty=list(dirty),
+            stale_since=Coalesce(F('stale_since'), Value(now))
+        )
+    # Also for snapshots that were stale already, their refresh may have failed for good
+    _queue_refresh(user_id for user_id, _, _ in rows)
+
+
+def mark_stale(sections, user_ids=(), emails=()):
+    """Mark sections of existing snapshots dirty and queue one refresh per snapshot,
+    once the surrounding transaction commits"""
+    user_ids = {user_id for user_id in user_ids if user_id}
+    emails = {email for email in emails if email}
+    if not user_ids and not emails:
+        return
+    transaction.on_commit(lambda: _mark(sections, user_ids, emails), using=current_alias())
+
+
+def mark_team_stale(team_ids, sections):
+    """Mark sections of every member's snapshot dirty, and of invitees' for 'invites'"""
+    team_ids = [team_id for team_id in team_ids if team_id]
+    if not team_ids:
+        return
+    emails = ()
+    if 'invites' in sections:
+        emails = ProjectInvites.objects.filter(team_id__in=team_ids, status='pending').values_list('email', flat=True)
+    mark_stale(
+        sections,
+        user_ids=TeamMembers.objects.filter(team_id__in=team_ids).values_list('user_id', flat=True),
+        emails=emails
+    )
+
+
+def get_snapshot(user_id):
+    """The stored snapshot, queued for a build on first use and for refresh once it is old"""
+    snapshot = UserSnapshots.objects.filter(user_id=user_id).first()
+    if snapshot is None:
+        snapshot, created = UserSnapshots.objects.get_or_create(
+            user_id=user_id,
+            defaults={'document': EMPTY_DOCUMENT, 'dirty': list(SECTIONS), 'stale_since': timezone.now()}
+        )
+        if created:
+            enqueue_on_commit('refresh_snapshot', {'user_id': user_id})
+        return snapshot
+
+    old = timezone.now() - timedelta(seconds=settings.SNAPSHOT_MAX_AGE_SECONDS)
+    if snapshot.stale_since is None:
+        # Catches changes no signal sees, such as Clerk profile updates
+        if snapshot.refreshed_at < old:
+            mark_stale(SECTIONS, user_ids=[user_id])
+    elif snapshot.stale_since < old:
+        # Stale for long, its refresh may have failed for good
+        _queue_refresh([user_id])
+    return snapshot
+
+
+@job('refresh_snapshot')
+def refresh_snapshot_job(current):
+    snapshot = refresh_snapshot(current.payload['user_id'])
+    return {'version': snapshot.version}
+
+
+@receiver(pre_save, sender=Tasks)
+def task_saving(sender, instance, **kwargs):
+    # activity.py keeps the values the task was loaded with, so a reassignment
+    # also refreshes the previous assignee without another query
+    instance._previous_assignee = previous_values(instance).get('assigned_to')
+
+
+@receiver([post_save, post_delete], sender=Tasks)
+def task_changed(sender, instance, **kwargs):
+    if activity_suppressed():
+        return
+    previous_assignee = getattr(instance, '_previous_assignee', None)
+    mark_stale(['tasks'], user_ids=[instance.assigned_to, instance.created_by, previous_assignee])
+
+
+@receiver([post_save, post_delete], sender=Projects)
+def project_changed(sender, instance, **kwargs):
+    if activity_suppressed():
+        return
+    mark_team_stale([instance.team_id, getattr(instance, '_previous_team_id', None)], ['projects', 'tasks'])
+
+
+@receiver([post_save, post_delete], sender=TeamMembers)
+def team_member_changed(sender, instance, **kwargs):
+    if activity_suppressed():
+        return
+    mark_stale(['projects', 'tasks'], user_ids=[instance.user_id])
+    mark_team_stale([instance.team_id], ['projects'])
+
+
+@receiver([post_save, post_delete], sender=ProjectInvites)
+def invite_changed(sender, instance, **kwargs):
+    if activity_suppressed():
+        return
+    mark_stale(['invites'], emails=[instance.email])
@@ -0,0 +1,174 @@
+# team_moves.py
+# Moving a team to another database while it stays in use. Its rows are
+# copied while the team is live, then writes to it are paused
+# (TeamShards.read_only makes them answer 503) and a second pass brings the
+# copy up to date by comparing both sides chunk by chunk in primary key
+# order. The directory then points at the new alias, writes resume, and the
+# rows left behind in the old alias are deleted in batches.
+#
+# Requests cache the directory for TENANT_DIRECTORY_CACHE_TIMEOUT, and jobs
+# and commands check it before every batch, so the pause has to last at
+# least that long before the catch-up copy starts.
+import time
+import uuid
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .activity import suppress_activity
+from .deletion import delete_in_batches
+from .membership import invalidate_team
+from .models import (
+    Teams, TeamMembers, ProjectInvites, Projects, Tasks, Comments,
+    ArchivedTasks, ArchivedComments, SentReminders, TeamShards
+)
+from .tenancy import team_alias, forget_team, using_alias
+
+# (model, path from the model to its team id, extra filters), parents before
+# children; recurring tasks go before their occurrences
+TEAM_TABLES = [
+    (Teams, 'id', {}),
+    (TeamMembers, 'team_id', {}),
+    (ProjectInvites, 'team_id', {}),
+    (Projects, 'team_id', {}),
+    (Tasks, 'project__team_id', {'recurrence_parent__isnull': True}),
+    (Tasks, 'project__team_id', {'recurrence_parent__isnull': False}),
+    (Comments, 'task__project__team_id', {}),
+    (ArchivedTasks, 'project__team_id', {}),
+    (ArchivedComments, 'task__project__team_id', {}),
+    (SentReminders, 'task__project__team_id', {}),
+]
+
+
+def _team_rows(model, team_path, filters, team_id, alias):
+    return model.objects.using(alias).filter(**{team_path: team_id}, **filters).order_by('pk')
+
+
+def sync_table(model, team_path, filters, team_id, source, target, batch_size):
+    """Insert and update the team's rows of `model` in `target` to match `source`.
+
+    Returns (inserted, updated, ids only found in target); those are deleted
+    separately, children first.
+    """
+    fields = [field.name for field in model._meta.concrete_fields if not field.primary_key]
+    pk_name = model._meta.pk.attname
+    inserted = updated = 0
+    extra = []
+    after = None
+    while True:
+        rows = _team_rows(model, team_path, filters, team_id, source)
+        if after is not None:
+            rows = rows.filter(pk__gt=after)
+        rows = list(rows.values()[:batch_size])
+
+        # The target's rows in the same key range as this chunk, or all the
+        # rest after the last one
+        last = len(rows) < batch_size
+        existing = _team_rows(model, team_path, filters, team_id, target)
+        if after is not None:
+            existing = existing.filter(pk__gt=after)
+        if not last:
+            existing = existing.filter(pk__lte=rows[-1][pk_name])
+        existing = {row[pk_name]: row for row in existing.values()}
+
+        source_ids = {row[pk_name] for row in rows}
+        to_create = [model(**row) for row in rows if row[pk_name] not in existing]
+        to_update = [model(**row) for row in rows if row[pk_name] in existing and existing[row[pk_name]] != row]
+        extra += [pk for pk in existing if pk not in source_ids]
+        with transaction.atomic(using=target):
+            model.objects.using(target).bulk_create(to_create)
+            if to_update:
+                model.objects.using(target).bulk_update(to_update, fields)
+        inserted += len(to_create)
+        updated += len(to_update)
+
+        if last:
+            return inserted, updated, extra
+        after = rows[-1][pk_name]
+
+
+def sync_team(team_id, source, target, batch_size):
+    """Make the team's rows in `target` match `source`, returning counts per table"""
+    counts = {}
+    extras = []
+    for model, team_path, filters in TEAM_TABLES:
+        inserted, updated, extra = sync_table(model, team_path, filters, team_id, source, target, batch_size)
+        name = model._meta.db_table
+        counts[name] = {
+            'inserted': counts.get(name, {}).get('inserted', 0) + inserted,
+            'updated': counts.get(name, {}).get('updated', 0) + updated,
+            'deleted': counts.get(name, {}).get('deleted', 0) + len(extra),
+        }
+        extras.append((model, extra))
+    for model, extra in reversed(extras):
+        for start in range(0, len(extra), batch_size):
+            model.objects.using(target).filter(pk__in=extra[start:start + batch_size]).delete()
+    return counts
+
+
+def purge_team(team_id, alias, batch_size):
+    """Delete the team's rows from `alias`, children first"""
+    with using_alias(alias):
+        for model, team_path, filters in reversed(TEAM_TABLES):
+            delete_in_batches(_team_rows(model, team_path, filters, team_id, alias), batch_size, lambda count: None)
+
+
+def _point_directory(team_id, alias, read_only):
+    TeamShards.objects.update_or_create(
+        team_id=team_id,
+        defaults={'alias': alias, 'read_only': read_only, 'updated_at': timezone.now()}
+    )
+    forget_team(team_id)
+
+
+def move_team(team_id, target, batch_size=None, settle_seconds=None, log=print):
+    """Move a team's rows to the `target` database alias"""
+    team_id = uuid.UUID(str(team_id))
+    batch_size = batch_size or settings.TENANT_MOVE_BATCH_SIZE
+    # Long enough for in-flight requests to finish and cached directory entries to expire
+    if settle_seconds is None:
+        settle_seconds = settings.TENANT_DIRECTORY_CACHE_TIMEOUT
+    if settle_seconds < settings.TENANT_DIRECTORY_CACHE_TIMEOUT:
+        raise ValueError(
+            f'settle_seconds must be at least the directory cache timeout '
+            f'({settings.TENANT_DIRECTORY_CACHE_TIMEOUT}s)'
+        )
+    if target not in settings.TENANT_DATABASES:
+        raise ValueError(f'Unknown database alias {target!r}, expected one of {settings.TENANT_DATABASES}')
+    source = team_alias(team_id)
+    if source == target:
+        raise ValueError(f'Team {team_id} already lives in {target!r}')
+    team = Teams.objects.using(source).filter(id=team_id).first()
+    if team is None:
+        raise ValueError(f'Team {team_id} not found in {source!r}')
+    if team.deletion_requested_at:
+        raise ValueError(f'Team {team_id} is being deleted')
+
+    # Copies and deletes are not changes to the team's history
+    with suppress_activity():
+        log(f'Copying team {team_id} from {source!r} to {target!r}')
+        counts = sync_team(team_id, source, target, batch_size)
+
+        log('Pausing writes to the team')
+        _point_directory(team_id, source, read_only=True)
+        time.sleep(settle_seconds)
+        try:
+            log('Copying changes made during the copy')
+            counts = sync_team(team_id, source, target, batch_size)
+            _point_directory(team_id, target, read_only=False)
+        except Exception:
+            _point_directory(team_id, source, read_only=False)
+            raise
+        # The target's reminder scans have their own marks, have them look at
+        # the team's tasks again; SentReminders came along and stops repeats
+        Tasks.objects.using(target).filter(project__team_id=team_id).update(due_date_set_at=timezone.now())
+        with using_alias(target):
+            invalidate_team(team_id)
+        log(f'Team {team_id} now lives in {target!r}')
+
+        # Readers holding the old directory entry finish before the rows go
+        time.sleep(settle_seconds)
+        purge_team(team_id, source, batch_size)
+        log(f'Deleted the team from {source!r}')
+    return counts
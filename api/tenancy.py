@@ -0,0 +1,373 @@
+# tenancy.py
+# Team-based tenant routing. Everything a team owns (members, invites,
+# projects, tasks, comments and their archives) lives in one database alias,
+# recorded in the TeamShards directory in the default database; teams without
+# an entry live in `default`. TenantRouter sends a model instance to its
+# team's database and other queries to the alias of the current tenant
+# context, which TenantRoutingMixin sets per request and run_job per job.
+# User-wide reads spanning several teams run on every alias involved in
+# parallel (fan_out) and merge their results.
+#
+# Writes look the team up in the directory itself rather than the cache: a
+# team being moved (see team_moves.py) is read_only and refuses them with
+# TeamMoving. Requests check once, jobs and commands before every batch, and
+# move_team waits at least the directory cache timeout after pausing writes,
+# so anything that passed the check has committed before the final copy.
+#
+# With a single database (no TENANT_SHARDS) all of this short-circuits to
+# `default` without extra queries.
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db import DEFAULT_DB_ALIAS, connections
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.response import Response
+
+from .models import TeamShards, Teams, Projects, Tasks, ProjectInvites
+
+# Models whose rows belong to a team, by model_name
+TENANT_MODELS = {
+    'teams', 'teammembers', 'projectinvites', 'projects', 'tasks', 'comments',
+    'archivedtasks', 'archivedcomments', 'sentreminders',
+}
+
+_alias = ContextVar('tenant_alias', default=None)
+
+
+def sharded():
+    return len(settings.TENANT_DATABASES) > 1
+
+
+def current_alias():
+    return _alias.get() or DEFAULT_DB_ALIAS
+
+
+@contextmanager
+def using_alias(alias):
+    token = _alias.set(alias)
+    try:
+        yield
+    finally:
+        _alias.reset(token)
+
+
+def iter_using(alias, iterable):
+    """Iterate in a tenant context, for streamed responses that outlive their view"""
+    with using_alias(alias):
+        yield from iterable
+
+
+def _cache_key(team_id):
+    return f'team_shard:{team_id}'
+
+
+def team_shards(team_ids):
+    """team_id -> (alias, read_only) from the TeamShards directory, cached"""
+    team_ids = {uuid.UUID(str(team_id)) for team_id in team_ids if team_id}
+    if not sharded():
+        return {team_id: (DEFAULT_DB_ALIAS, False) for team_id in team_ids}
+
+    cached = cache.get_many([_cache_key(team_id) for team_id in team_ids])
+    shards = {
+        team_id: tuple(cached[_cache_key(team_id)])
+        for team_id in team_ids if _cache_key(team_id) in cached
+    }
+    missing = team_ids - set(shards)
+    if missing:
+        found = {
+            entry.team_id: (entry.alias, entry.read_only)
+            for entry in TeamShards.objects.filter(team_id__in=missing)
+        }
+        fetched = {team_id: found.get(team_id, (DEFAULT_DB_ALIAS, False)) for team_id in missing}
+        cache.set_many(
+            {_cache_key(team_id): shard for team_id, shard in fetched.items()},
+            timeout=settings.TENANT_DIRECTORY_CACHE_TIMEOUT
+        )
+        shards.update(fetched)
+    return shards
+
+
+def team_alias(team_id):
+    if not team_id:
+        return DEFAULT_DB_ALIAS
+    return team_shards([team_id])[uuid.UUID(str(team_id))][0]
+
+
+def forget_team(team_id):
+    cache.delete(_cache_key(team_id))
+
+
+def user_aliases(user):
+    """Aliases holding the user's teams, plus default for personal tasks"""
+    aliases = {alias for alias, _ in team_shards(user.membership.team_ids).values()}
+    aliases.discard(DEFAULT_DB_ALIAS)
+    return [DEFAULT_DB_ALIAS] + sorted(aliases)
+
+
+def _run_on(alias, func):
+    try:
+        with using_alias(alias):
+            return func(alias)
+    finally:
+        # Pool threads open their own connections, don't leave them behind
+        connections.close_all()
+
+
+def fan_out(func, aliases):
+    """Run func(alias) in each alias' tenant context in parallel, results in alias order"""
+    aliases = list(aliases)
+    if len(aliases) == 1:
+        with using_alias(aliases[0]):
+            return [func(aliases[0])]
+    with ThreadPoolExecutor(max_workers=len(aliases)) as pool:
+        return list(pool.map(lambda alias: _run_on(alias, func), aliases))
+
+
+def _merge_lists(lists):
+    # A row can show up twice while its team is being copied to another alias
+    seen = set()
+    merged = []
+    for items in lists:
+        for item in items:
+            key = item.get('id', item.get('invite_id')) if isinstance(item, dict) else None
+            if key is not None:
+                if key in seen:
+                    continue
+                seen.add(key)
+            merged.append(item)
+    return merged
+
+
+def merge_data(results):
+    """Concatenate per-alias lists, or the list values of per-alias dicts"""
+    first = results[0]
+    if isinstance(first, list):
+        return _merge_lists(results)
+    if isinstance(first, dict):
+        return {
+            key: _merge_lists([result.get(key, []) for result in results]) if isinstance(value, list) else value
+            for key, value in first.items()
+        }
+    return first
+
+
+def across_shards(all_shards=False):
+    """Run a read-only view method on each of the user's aliases and merge the responses.
+
+    With all_shards the method runs on every alias, for reads that are not
+    limited to the user's teams (invites sent to their email).
+    """
+    def decorate(method):
+        @wraps(method)
+        def wrapper(self, request, *args, **kwargs):
+            if not sharded():
+                return method(self, request, *args, **kwargs)
+            aliases = settings.TENANT_DATABASES if all_shards else user_aliases(request.user)
+            responses = fan_out(lambda alias: method(self, request, *args, **kwargs), aliases)
+            if len(responses) == 1:
+                return responses[0]
+            for response in responses:
+                if response.status_code >= 400:
+                    return response
+            return Response(merge_data([response.data for response in responses]), status=responses[0].status_code)
+        return wrapper
+    return decorate
+
+
+def locate(model, pk, team_path):
+    """(alias, team_id) of the `model` row with primary key `pk`, searching every alias"""
+    try:
+        pk = model._meta.pk.to_python(pk)
+    except ValidationError:
+        return DEFAULT_DB_ALIAS, None
+    if not sharded():
+        return DEFAULT_DB_ALIAS, None
+
+    found = fan_out(
+        lambda alias: list(model.objects.filter(pk=pk).values_list(team_path, flat=True)[:1]),
+        settings.TENANT_DATABASES
+    )
+    for alias, rows in zip(settings.TENANT_DATABASES, found):
+        if not rows:
+            continue
+        # Rows without a team (personal tasks) stay where they are found; a
+        # team's rows can be in two aliases mid-move, the directory decides
+        return (team_alias(rows[0]), rows[0]) if rows[0] else (alias, None)
+    return DEFAULT_DB_ALIAS, None
+
+
+class TeamMoving(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'This team is being moved to another database, try again shortly.'
+    default_code = 'team_moving'
+
+
+def team_directory(team_ids):
+    """team_id -> (alias, read_only) read straight from TeamShards, for writes"""
+    team_ids = {uuid.UUID(str(team_id)) for team_id in team_ids if team_id}
+    if not sharded():
+        return {team_id: (DEFAULT_DB_ALIAS, False) for team_id in team_ids}
+    found = {
+        team_id: (alias, read_only)
+        for team_id, alias, read_only in TeamShards.objects.filter(team_id__in=team_ids)
+        .values_list('team_id', 'alias', 'read_only')
+    }
+    return {team_id: found.get(team_id, (DEFAULT_DB_ALIAS, False)) for team_id in team_ids}
+
+
+def writable_teams(team_ids, alias):
+    """The teams among team_ids that live in `alias` and accept writes"""
+    return {
+        team_id for team_id, (location, read_only) in team_directory(team_ids).items()
+        if location == alias and not read_only
+    }
+
+
+def check_writable(team_id, alias=None):
+    """The team's alias, or TeamMoving while its writes are paused.
+
+    With `alias`, also raises when the team no longer lives there, such as
+    for a job queued before the team was moved. Rows without a team stay
+    where they are.
+    """
+    if not team_id:
+        return alias or current_alias()
+    location, read_only = team_directory([team_id])[uuid.UUID(str(team_id))]
+    if read_only or (alias is not None and location != alias):
+        raise TeamMoving()
+    return location
+
+
+@contextmanager
+def team_writes(team_id):
+    """Run a job's or command's writes to a team in the database it lives in now"""
+    with using_alias(check_writable(team_id)):
+        yield
+
+
+class TenantRoutingMixin:
+    """Run a ViewSet's request against the database of the team it concerns.
+
+    The team comes from the detail route's object (`tenant_lookup`), or from a
+    project, team, task or invite id in the request. Creates without one start
+    new teams in the default database; anything else uses the user's alias
+    when all their teams share one.
+    """
+
+    # (model, path from the model to its team id) of the detail route's object
+    tenant_lookup = None
+
+    def _tenant_of(self, model, team_path, value):
+        try:
+            value = uuid.UUID(str(value))
+        except ValueError:
+            return None
+        if model is Teams:
+            team_id = value
+        elif model is Projects:
+            team_id = self.request.user.membership.project_teams.get(value)
+            if team_id is None:
+                return None
+        else:
+            return locate(model, value, team_path)
+        return team_alias(team_id), team_id
+
+    def resolve_tenant(self, request):
+        if self.kwargs.get('pk') and self.tenant_lookup:
+            return self._tenant_of(*self.tenant_lookup, self.kwargs['pk']) or (DEFAULT_DB_ALIAS, None)
+
+        params = dict(request.query_params.items())
+        if isinstance(request.data, dict):
+            params.update(request.data.items())
+        for key, model, team_path in (
+            ('project', Projects, 'team_id'),
+            ('project_id', Projects, 'team_id'),
+            ('team', Teams, 'id'),
+            ('task', Tasks, 'project__team_id'),
+            ('invite_id', ProjectInvites, 'team_id'),
+        ):
+            if params.get(key):
+                tenant = self._tenant_of(model, team_path, params[key])
+                if tenant:
+                    return tenant
+
+        if self.action == 'create':
+            return DEFAULT_DB_ALIAS, None
+        aliases = {alias for alias, _ in team_shards(request.user.membership.team_ids).values()}
+        return (aliases.pop() if len(aliases) == 1 else DEFAULT_DB_ALIAS), None
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        alias = DEFAULT_DB_ALIAS
+        if sharded():
+            alias, team_id = self.resolve_tenant(request)
+            if team_id and request.method not in SAFE_METHODS:
+                # A cached directory entry can be a move behind
+                alias = check_writable(team_id)
+        self._tenant_token = _alias.set(alias)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        token = getattr(self, '_tenant_token', None)
+        if token is not None:
+            _alias.reset(token)
+            self._tenant_token = None
+        return super().finalize_response(request, response, *args, **kwargs)
+
+
+class TenantRouter:
+    """Route team-owned models to their team's alias, everything else to default"""
+
+    def _is_tenant(self, model):
+        return model._meta.app_label == 'api' and model._meta.model_name in TENANT_MODELS
+
+    def _instance_alias(self, instance):
+        if instance._state.db:
+            return instance._state.db
+        if isinstance(instance, Teams):
+            return team_alias(instance.pk)
+        team_id = getattr(instance, 'team_id', None)
+        if team_id:
+            return team_alias(team_id)
+        for name in ('project', 'task'):
+            try:
+                field = instance._meta.get_field(name)
+            except FieldDoesNotExist:
+                continue
+            if getattr(instance, field.attname) is None:
+                # Personal tasks live in the default database
+                return DEFAULT_DB_ALIAS
+            if field.is_cached(instance):
+                return self._instance_alias(getattr(instance, name))
+            break
+        return None
+
+    def _route(self, model, **hints):
+        if not self._is_tenant(model) or not sharded():
+            return None
+        instance = hints.get('instance')
+        if instance is not None and self._is_tenant(type(instance)):
+            alias = self._instance_alias(instance)
+            if alias:
+                return alias
+        return current_alias()
+
+    db_for_read = _route
+    db_for_write = _route
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if self._is_tenant(type(obj1)) or self._is_tenant(type(obj2)):
+            return obj1._state.db == obj2._state.db
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if app_label == 'api' and model_name in TENANT_MODELS:
+            return db in settings.TENANT_DATABASES
+        return db == DEFAULT_DB_ALIAS
@@ -1,3 +1,1016 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import os
+import tempfile
+import uuid
+from contextlib import redirect_stdout
+from datetime import datetime, timedelta, timezone as dt_timezone
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from .activity import compact_activity
+from .archive import archive_project
+from .authentication import ClerkUser
+from .clerk_users import _cache_key
+from .deletion import request_project_deletion
+from .fields import uuid7
+from .importer import TaskImporter, iter_rows
+from .jobs import claim_next, run_job
+from .membership import get_membership
+from .models import (
+    ActivityLogs, ArchivedComments, ArchivedTasks, BackgroundJobs, Comments, ProjectInvites, Projects,
+    ReminderWatermarks, SentReminders, Tasks, TeamMembers, Teams, TeamShards, UserSnapshots
+)
+from .pagination import decode_cursor, encode_cursor
+from .ranking import move_rank, parse_rank, rank_between, rebalance_column, spread_ranks
+from .recurrence import MAX_OCCURRENCES, occurrence_dates
+from .reminders import scan
+from .snapshots import get_snapshot
+from .team_moves import move_team
+from .tenancy import TenantRouter, using_alias
+from .throttling import TokenBucket
+
+
+def utc(*args):
+    return datetime(*args, tzinfo=dt_timezone.utc)
+
+
+def make_project(name='Project', user_id='u1'):
+    team = Teams.objects.create(name=f'Team for {name}', description='')
+    TeamMembers.objects.create(team=team, user_id=user_id, role='owner')
+    return Projects.objects.create(name=name, description='', status='active', team=team)
+
+
+def make_task(project, title, rank='', status='Todo', due_date=utc(2026, 1, 1), **kwargs):
+    return Tasks.objects.create(
+        title=title,
+        description='',
+        status=status,
+        priority='low',
+        due_date=due_date,
+        project=project,
+        tags=[],
+        rank=rank,
+        **kwargs
+    )
+
+
+def run_pending_jobs():
+    """Run queued jobs the way `manage.py run_worker` does, returning them"""
+    done = []
+    while (current := claim_next()) is not None:
+        done.append(run_job(current))
+    return done
+
+
+class RankBetweenTests(SimpleTestCase):
+    def test_sorts_between_neighbours(self):
+        for before, after in [(None, None), ('a', None), (None, 'a'), ('a', 'b'), ('a', 'a1'), ('az', 'b')]:
+            rank = rank_between(before, after)
+            self.assertGreater(rank, before or '')
+            if after:
+                self.assertLess(rank, after)
+
+    def test_repeated_inserts_keep_order(self):
+        ranks = [rank_between(None, None)]
+        for _ in range(50):
+            ranks.insert(0, rank_between(None, ranks[0]))
+            ranks.insert(len(ranks) // 2, rank_between(ranks[len(ranks) // 2 - 1], ranks[len(ranks) // 2]))
+            ranks.append(rank_between(ranks[-1], None))
+        self.assertEqual(ranks, sorted(ranks))
+        self.assertEqual(len(set(ranks)), len(ranks))
+
+    def test_rejects_swapped_or_invalid_bounds(self):
+        with self.assertRaises(ValueError):
+            rank_between('b', 'a')
+        with self.assertRaises(ValueError):
+            rank_between('a', 'a')
+        for invalid in ('A', 'a0', 'a-b'):
+            with self.assertRaises(ValueError):
+                rank_between(invalid, None)
+
+    def test_parse_rank(self):
+        self.assertEqual(parse_rank(''), '')
+        self.assertEqual(parse_rank('a1'), 'a1')
+        with self.assertRaises(ValueError):
+            parse_rank('A')
+
+
+class SpreadRanksTests(SimpleTestCase):
+    def test_empty(self):
+        self.assertEqual(spread_ranks(0), [])
+
+    def test_evenly_spaced_in_first_half(self):
+        for total in (1, 2, 9, 100, 5000):
+            ranks = spread_ranks(total)
+            self.assertEqual(len(ranks), total)
+            self.assertEqual(ranks, sorted(set(ranks)))
+            self.assertLessEqual(ranks[-1], 'i')
+            # Appending after a rebalanced column still works
+            self.assertGreater(rank_between(ranks[-1], None), ranks[-1])
+
+
+class MoveRankTests(TestCase):
+    def setUp(self):
+        self.project = make_project()
+        self.first = make_task(self.project, 'first', rank='a')
+        self.second = make_task(self.project, 'second', rank='b')
+        self.third = make_task(self.project, 'third', rank='c')
+
+    def test_between_neighbours(self):
+        rank = move_rank(self.third, 'Todo', before_id=self.first.id, after_id=self.second.id)
+        self.assertTrue('a' < rank < 'b')
+
+    def test_single_neighbour_or_none(self):
+        self.assertLess(move_rank(self.third, 'Todo', after_id=self.first.id), 'a')
+        self.assertTrue('a' < move_rank(self.third, 'Todo', before_id=self.first.id) < 'b')
+        self.assertGreater(move_rank(self.first, 'Todo'), 'c')
+
+    def test_swapped_neighbours(self):
+        with self.assertRaises(ValueError):
+            move_rank(self.first, 'Todo', before_id=self.third.id, after_id=self.second.id)
+
+    def test_neighbour_in_another_column(self):
+        other = make_task(self.project, 'other', rank='a', status='Done')
+        with self.assertRaises(Tasks.DoesNotExist):
+            move_rank(self.first, 'Todo', before_id=other.id)
+
+    def test_unranked_column_is_rebalanced(self):
+        Tasks.objects.filter(project=self.project).update(rank='')
+        rank = move_rank(self.third, 'Todo', before_id=self.first.id, after_id=self.second.id)
+        ranks = dict(Tasks.objects.values_list('id', 'rank'))
+        self.assertTrue(ranks[self.first.id] < rank < ranks[self.second.id])
+
+    def test_rebalance(self):
+        Tasks.objects.filter(project=self.project).update(rank='')
+        self.assertEqual(rebalance_column(self.project.id, 'Todo'), 3)
+        ranks = list(Tasks.objects.filter(project=self.project).order_by('created_at', 'id').values_list('rank', flat=True))
+        self.assertEqual(ranks, sorted(ranks))
+        self.assertNotIn('', ranks)
+        self.assertEqual(rebalance_column(self.project.id, 'In Progress'), 0)
+
+
+class CursorTests(SimpleTestCase):
+    def test_round_trip(self):
+        task_id = uuid.uuid4()
+        cursor = encode_cursor('a1', task_id)
+        self.assertEqual(decode_cursor(cursor, parse_rank, uuid.UUID), ['a1', task_id])
+
+    def test_invalid(self):
+        task_id = uuid.uuid4()
+        for cursor in (
+            '',
+            None,
+            'not base64 !',
+            encode_cursor('a1'),
+            encode_cursor('a1', task_id, 'extra'),
+            encode_cursor('A', task_id),
+            encode_cursor('a1', 'not-a-uuid'),
+        ):
+            self.assertIsNone(decode_cursor(cursor, parse_rank, uuid.UUID), cursor)
+
+    def test_non_string_values(self):
+        # Valid base64 JSON that encode_cursor never produces
+        cursor = 'WzEsIDJd'  # [1, 2]
+        self.assertIsNone(decode_cursor(cursor, str, str))
+
+
+# Requests on several databases read them from worker threads, which can't see a test's transaction
+@override_settings(TENANT_DATABASES=['default'])
+class BoardTests(TestCase):
+    def setUp(self):
+        self.project = make_project()
+        self.client = APIClient()
+        self.client.force_authenticate(user=ClerkUser('u1'))
+
+    def test_board_rejects_tampered_cursor(self):
+        board = f'/projects/{self.project.id}/board/'
+        self.assertEqual(self.client.get(board, {'status': 'Todo', 'cursor': encode_cursor('a', uuid.uuid4())}).status_code, 200)
+        for cursor in (encode_cursor('A', uuid.uuid4()), encode_cursor('a', 'x'), 'garbage'):
+            response = self.client.get(board, {'status': 'Todo', 'cursor': cursor})
+            self.assertEqual(response.status_code, 400, cursor)
+
+    def test_columns_in_rank_order(self):
+        make_task(self.project, 'second', rank='b')
+        make_task(self.project, 'first', rank='a')
+        columns = self.client.get(f'/projects/{self.project.id}/board/').data['columns']
+        self.assertEqual([column['status'] for column in columns], self.project.task_statuses)
+        self.assertEqual([task['title'] for task in columns[0]['tasks']], ['first', 'second'])
+
+    def test_move(self):
+        first = make_task(self.project, 'first', rank='a')
+        second = make_task(self.project, 'second', rank='b')
+        moved = make_task(self.project, 'moved', rank='c')
+
+        response = self.client.post(f'/tasks/{moved.id}/move/', {'before': first.id, 'after': second.id}, format='json')
+        self.assertEqual(response.status_code, 200)
+        moved.refresh_from_db()
+        self.assertTrue('a' < moved.rank < 'b')
+
+        response = self.client.post(f'/tasks/{moved.id}/move/', {'before': second.id, 'after': first.id}, format='json')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(f'/tasks/{moved.id}/move/', {'status': 'Done', 'before': first.id}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(
+    TENANT_DATABASES=['default'],
+    CLERK_THROTTLE={'CAPACITY': 5, 'REFILL_RATE': 0.5, 'COSTS': {'project.retrieve': 2}},
+)
+class ThrottleTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.project = make_project()
+        self.client = APIClient()
+        self.client.force_authenticate(user=ClerkUser('u1'))
+
+    def test_headers_and_429(self):
+        url = f'/projects/{self.project.id}/'
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-RateLimit-Limit'], '5')
+        self.assertEqual(response['X-RateLimit-Remaining'], '3')
+        self.assertEqual(response['X-RateLimit-Cost'], '2')
+        self.assertEqual(response['X-RateLimit-Reset'], '4')
+
+        self.assertEqual(self.client.get(url).status_code, 200)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '2')
+        self.assertEqual(response['X-RateLimit-Remaining'], '1')
+
+        # Unpriced routes and other users have their own budget
+        self.assertEqual(self.client.get('/projects/').status_code, 200)
+        other = APIClient()
+        other.force_authenticate(user=ClerkUser('u2'))
+        self.assertNotEqual(other.get(url).status_code, 429)
+
+    def test_lock_timeout_fails_open(self):
+        bucket = TokenBucket('u1', 5, 0.5)
+        cache.add(bucket.lock_key, 1)
+        allowed, remaining, wait = bucket.consume(2)
+        self.assertEqual((allowed, remaining, wait), (True, 3, 0))
+        cache.delete(bucket.lock_key)
+        self.assertEqual(bucket.consume(2, now=0)[:2], (True, 3))
+
+
+@override_settings(TENANT_DATABASES=['default'])
+class ArchiveTests(TestCase):
+    def setUp(self):
+        self.project = make_project()
+        self.task = make_task(self.project, 'recurring', recurrence='FREQ=DAILY')
+        self.occurrence = make_task(self.project, 'occurrence', recurrence_parent_id=self.task.id)
+        self.other = make_task(self.project, 'other')
+        Comments.objects.create(task=self.task, content='note', created_by='u1')
+        Projects.objects.filter(id=self.project.id).update(status='completed', completed_at=utc(2025, 1, 1))
+        self.project.refresh_from_db()
+        self.client = APIClient()
+        self.client.force_authenticate(user=ClerkUser('u1'))
+
+    def test_archive_moves_rows_in_batches(self):
+        self.assertEqual(archive_project(self.project, batch_size=1), 3)
+        self.assertFalse(Tasks.objects.exists())
+        self.assertFalse(Comments.objects.exists())
+        self.assertEqual(ArchivedTasks.objects.count(), 3)
+        self.assertEqual(ArchivedComments.objects.get().task_id, self.task.id)
+        self.project.refresh_from_db()
+        self.assertIsNotNone(self.project.archived_at)
+
+    def test_archived_rows_are_listed_on_request(self):
+        archive_project(self.project)
+        self.assertEqual(self.client.get('/tasks/').data, [])
+        titles = {task['title'] for task in self.client.get('/tasks/', {'include_archived': 'true'}).data}
+        self.assertEqual(titles, {'recurring', 'occurrence', 'other'})
+
+    def test_reopen_restores_in_the_worker(self):
+        archive_project(self.project)
+        response = self.client.patch(f'/projects/{self.project.id}/', {'status': 'active'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(BackgroundJobs.objects.filter(kind='restore_project', status='pending').exists())
+
+        jobs = [job for job in run_pending_jobs() if job.kind == 'restore_project']
+        self.assertEqual([(job.status, job.result) for job in jobs], [('done', {'restored': 3})])
+        self.assertEqual(Tasks.objects.count(), 3)
+        self.assertEqual(Comments.objects.get().task_id, self.task.id)
+        self.assertFalse(ArchivedTasks.objects.exists())
+        self.project.refresh_from_db()
+        self.assertIsNone(self.project.archived_at)
+
+
+@override_settings(TENANT_DATABASES=['default'], EXPORT_CHUNK_SIZE=2)
+class ExportTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        cache.set(_cache_key('u1'), {'user_id': 'u1', 'first_name': 'Ada', 'last_name': 'Lovelace', 'email': None})
+        self.project = make_project()
+        # Ties on created_at are broken by id across chunk boundaries
+        self.tasks = sorted(
+            (make_task(self.project, f'task {n}', created_by='u1', created_at=utc(2026, 1, n // 2 + 1)) for n in range(5)),
+            key=lambda task: (task.created_at, task.id.bytes)
+        )
+        Comments.objects.create(task=self.tasks[0], content='first', created_by='u1')
+        self.url = f'/projects/{self.project.id}/export/'
+        self.client = APIClient()
+        self.client.force_authenticate(user=ClerkUser('u1'))
+
+    def body(self, response):
+        return b''.join(response.streaming_content).decode()
+
+    def test_csv(self):
+        response = self.client.get(self.url, HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        rows = list(csv.DictReader(io.StringIO(self.body(response))))
+        self.assertEqual([row['id'] for row in rows], [str(task.id) for task in self.tasks])
+        self.assertEqual(rows[0]['created_by_name'], 'Ada Lovelace')
+
+    def test_ndjson_with_comments(self):
+        response = self.client.get(self.url, {'format': 'ndjson', 'include_comments': 'true'})
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = [json.loads(line) for line in self.body(response).splitlines()]
+        self.assertEqual([line['title'] for line in lines], [task.title for task in self.tasks])
+        self.assertEqual([comment['content'] for comment in lines[0]['comments']], ['first'])
+        self.assertEqual(lines[1]['comments'], [])
+
+    def test_job_and_errors_are_json(self):
+        response = self.client.get(self.url, {'format': 'xml'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response['Content-Type'], 'application/json')
+
+        response = self.client.get(self.url, {'format': 'ndjson', 'background': 'true'})
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual(BackgroundJobs.objects.get(id=response.data['id']).payload['format'], 'ndjson')
+
+
+# Activity entries are written once the import commits
+@override_settings(TENANT_DATABASES=['default'])
+class TaskImporterTests(TransactionTestCase):
+    def setUp(self):
+        self.project = make_project()
+
+    def rows(self, count):
+        return [
+            {'title': f'Task {i}', 'priority': 'low', 'due_date': '2026-01-01', 'tags': 'a, b'}
+            for i in range(count)
+        ]
+
+    def test_inserts_in_batches(self):
+        insert = f'INSERT INTO {connection.ops.quote_name(Tasks._meta.db_table)}'
+        with CaptureQueriesContext(connection) as queries:
+            report = TaskImporter(self.project, created_by='u1', batch_size=2).run(self.rows(5))
+
+        self.assertEqual(report['created'], 5)
+        self.assertEqual(report['error_count'], 0)
+        self.assertEqual(sum(query['sql'].startswith(insert) for query in queries.captured_queries), 3)
+        tasks = list(Tasks.objects.filter(project=self.project).order_by('rank'))
+        self.assertEqual([task.title for task in tasks], [f'Task {i}' for i in range(5)])
+        self.assertEqual(tasks[0].tags, ['a', 'b'])
+        self.assertEqual(tasks[0].status, 'Todo')
+        # bulk_create skips the signals, the importer logs the creates itself
+        self.assertEqual(ActivityLogs.objects.filter(action='create', actor='u1').count(), 5)
+
+    def test_reports_errors_per_row(self):
+        rows = self.rows(2) + [
+            {'title': '', 'priority': 'urgent', 'due_date': 'soon'},
+            {'title': 'Bad status', 'priority': 'low', 'due_date': '2026-01-01', 'status': 'Nope'},
+            'not an object',
+        ]
+        report = TaskImporter(self.project, batch_size=2).run(rows)
+
+        self.assertEqual(report['created'], 2)
+        self.assertEqual(report['error_count'], 3)
+        errors = {error['row']: error['errors'] for error in report['errors']}
+        self.assertEqual(set(errors[3]), {'title', 'priority', 'due_date'})
+        self.assertEqual(set(errors[4]), {'status'})
+        self.assertEqual(errors[5], {'row': 'Expected a JSON object.'})
+
+    def test_dry_run(self):
+        report = TaskImporter(self.project, dry_run=True).run(self.rows(3))
+        self.assertEqual((report['valid'], report['created']), (3, 0))
+        self.assertFalse(Tasks.objects.exists())
+
+    def test_parses_csv_and_ndjson(self):
+        csv_rows = list(iter_rows(io.BytesIO(b'title,priority,due_date\nOne,high,2026-01-01\n'), 'csv'))
+        self.assertEqual(csv_rows, [{'title': 'One', 'priority': 'high', 'due_date': '2026-01-01'}])
+
+        ndjson = io.BytesIO(b'{"title": "One"}\n\n{broken\n')
+        self.assertEqual(list(iter_rows(ndjson, 'ndjson')), [{'title': 'One'}, '{broken\n'])
+
+    def test_endpoint(self):
+        client = APIClient()
+        client.force_authenticate(user=ClerkUser('u1'))
+        url = f'/projects/{self.project.id}/import/'
+        upload = SimpleUploadedFile('tasks.csv', b'title,priority,due_date\nOne,high,2026-01-01\n')
+
+        response = client.post(url + '?dry_run=true', {'file': upload}, format='multipart')
+        self.assertEqual((response.status_code, response.data['valid']), (200, 1))
+        self.assertFalse(Tasks.objects.exists())
+
+        response = client.post(url, {'tasks': self.rows(2)}, format='json')
+        self.assertEqual((response.status_code, response.data['created']), (201, 2))
+
+        upload = SimpleUploadedFile('tasks.xml', b'<tasks/>')
+        response = client.post(url, {'file': upload, 'file_format': 'xml'}, format='multipart')
+        self.assertEqual(response.status_code, 400)
+
+
+class OccurrenceDatesTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def task(self, rule, due_date=utc(2026, 1, 1, 9)):
+        return Tasks(title='Recurring', due_date=due_date, recurrence=rule)
+
+    def test_daily_excludes_the_task_itself(self):
+        dates = occurrence_dates(self.task('FREQ=DAILY;COUNT=5'), utc(2026, 1, 1), utc(2026, 2, 1))
+        self.assertEqual(dates, [utc(2026, 1, day, 9) for day in (2, 3, 4, 5)])
+
+    def test_window_is_half_open(self):
+        dates = occurrence_dates(self.task('FREQ=DAILY'), utc(2026, 1, 3, 9), utc(2026, 1, 5, 9))
+        self.assertEqual(dates, [utc(2026, 1, 3, 9), utc(2026, 1, 4, 9)])
+
+    def test_weekly_by_day(self):
+        # 2026-01-01 is a Thursday
+        dates = occurrence_dates(self.task('FREQ=WEEKLY;BYDAY=MO,TH'), utc(2026, 1, 1), utc(2026, 1, 16))
+        self.assertEqual(dates, [utc(2026, 1, 5, 9), utc(2026, 1, 8, 9), utc(2026, 1, 12, 9), utc(2026, 1, 15, 9)])
+
+    def test_until_and_microseconds(self):
+        task = self.task('FREQ=DAILY;UNTIL=20260103T090000Z', due_date=utc(2026, 1, 1, 9, 0, 0, 123000))
+        dates = occurrence_dates(task, utc(2026, 1, 1), utc(2026, 2, 1))
+        self.assertEqual(dates, [utc(2026, 1, 2, 9), utc(2026, 1, 3, 9)])
+
+    def test_capped(self):
+        dates = occurrence_dates(self.task('FREQ=MINUTELY'), utc(2026, 1, 1), utc(2027, 1, 1))
+        self.assertEqual(len(dates), MAX_OCCURRENCES)
+
+
+@override_settings(TENANT_DATABASES=['default'])
+class OccurrenceEndpointTests(TestCase):
+    def setUp(self):
+        self.project = make_project()
+        self.task = make_task(self.project, 'standup', recurrence='FREQ=DAILY')
+        self.client = APIClient()
+        self.client.force_authenticate(user=ClerkUser('u1'))
+
+    def test_edit_one_occurrence(self):
+        url = f'/tasks/{self.task.id}/occurrences/'
+        response = self.client.post(url, {'occurrence_date': '2026-01-03T00:00:00Z', 'title': 'moved'}, format='json')
+        self.assertEqual(response.status_code, 201)
+        occurrence = Tasks.objects.get(recurrence_parent_id=self.task.id)
+        self.assertEqual((occurrence.title, occurrence.recurrence), ('moved', ''))
+
+        response = self.client.post(url, {'occurrence_date': '2026-01-03T00:00:00Z', 'priority': 'high'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Tasks.objects.filter(recurrence_parent_id=self.task.id).count(), 1)
+
+        response = self.client.post(url, {'occurrence_date': '2026-01-03T10:00:00Z'}, format='json')
+        self.assertEqual(response.status_code, 400)
+        once = make_task(self.project, 'once')
+        response = self.client.post(f'/tasks/{once.id}/occurrences/', {'occurrence_date': '2026-01-03T00:00:00Z'}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class RecordingBackend:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.digests = []
+
+    def send_digest(self, user_id, reminders):
+        if self.fail:
+            raise ConnectionError('mail server down')
+        self.digests.append((user_id, [(reminder['kind'], reminder['title']) for reminder in reminders]))
+
+
+@override_settings(TENANT_DATABASES=['default'], REMINDER_DUE_SOON_HOURS=24, REMINDER_INITIAL_LOOKBACK_HOURS=24)
+class ReminderTests(TestCase):
+    def setUp(self):
+        self.project = make_project()
+        # Tasks made by make_task are due at midnight
+        self.now = utc(2025, 12, 31, 22)
+        self.task = make_task(self.project, 'soon', created_by='u1')
+
+    def test_each_task_is_reminded_once(self):
+        backend = RecordingBackend()
+        self.assertEqual(scan(self.now, backend)['reminders'], 1)
+        self.assertEqual(scan(self.now + timedelta(minutes=1), backend)['reminders'], 0)
+        self.assertEqual(backend.digests, [('u1', [('due_soon', 'soon')])])
+
+        # Past its due date it becomes overdue
+        scan(utc(2026, 1, 1, 1), backend)
+        self.assertEqual(backend.digests[-1], ('u1', [('overdue', 'soon')]))
+
+    def test_due_date_set_behind_the_mark(self):
+        backend = RecordingBackend()
+        scan(self.now, backend)
+        self.assertEqual(ReminderWatermarks.objects.get(kind='due_soon').watermark, self.now + timedelta(hours=24))
+
+        make_task(self.project, 'late addition', created_by='u1', due_date=utc(2026, 1, 1, 12))
+        moved = make_task(self.project, 'moved', created_by='u1', due_date=utc(2026, 3, 1))
+        scan(self.now + timedelta(minutes=1), backend)
+        moved.due_date = utc(2026, 1, 1, 6)
+        moved.save()
+        scan(self.now + timedelta(minutes=2), backend)
+        self.assertEqual(backend.digests[1:], [
+            ('u1', [('due_soon', 'late addition')]),
+            ('u1', [('due_soon', 'moved')]),
+        ])
+
+    def failing_scan(self, now):
+        with redirect_stdout(io.StringIO()):
+            return scan(now, RecordingBackend(fail=True))
+
+    def test_failed_delivery_is_retried_without_holding_the_marks(self):
+        self.assertEqual(self.failing_scan(self.now)['failed'], 1)
+        self.assertEqual(ReminderWatermarks.objects.get(kind='due_soon').last_run_at, self.now)
+        self.assertIsNone(SentReminders.objects.get(task=self.task).sent_at)
+
+        backend = RecordingBackend()
+        later = self.now + timedelta(minutes=1)
+        self.assertEqual(scan(later, backend)['reminders'], 1)
+        self.assertEqual(ReminderWatermarks.objects.get(kind='due_soon').last_run_at, later)
+        self.assertIsNotNone(SentReminders.objects.get(task=self.task).sent_at)
+        self.assertEqual(scan(later, backend)['reminders'], 0)
+
+    def test_pending_reminder_dropped_once_done(self):
+        self.failing_scan(self.now)
+        Tasks.objects.filter(id=self.task.id).update(status='Done')
+        backend = RecordingBackend()
+        scan(self.now + timedelta(minutes=1), backend)
+        self.assertEqual(backend.digests, [])
+        self.assertFalse(SentReminders.objects.exists())
+
+    def test_due_date_set_at_is_read_only(self):
+        client = APIClient()
+        client.force_authenticate(user=ClerkUser('u1'))
+        set_at = self.task.due_date_set_at
+        response = client.patch(f'/tasks/{self.task.id}/', {'due_date_set_at': '2030-01-01T00:00:00Z'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.task.refresh_from_db()
+        self.assertEqual(self.task.due_date_set_at, set_at)
+
+
+@override_settings(
+    TENANT_DATABASES=['default'],
+    CACHES={'default': {
+        # Shared between processes, so membership is cached across requests
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(tempfile.gettempdir(), 'taskflow-test-cache'),
+    }},
+)
+class MembershipCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.project = make_project()
+        self.team = self.project.team
+
+    def test_cached_until_membership_changes(self):
+        self.assertFalse(get_membership('u2').is_member(self.team.id))
+        with self.assertNumQueries(0):
+            self.assertFalse(get_membership('u2').is_member(self.team.id))
+
+        member = TeamMembers.objects.create(team=self.team, user_id='u2', role='member')
+        membership = get_membership('u2')
+        self.assertEqual(membership.role(self.team.id), 'member')
+        self.assertEqual(membership.project_ids, [self.project.id])
+
+        member.delete()
+        self.assertFalse(get_membership('u2').is_member(self.team.id))
+
+    def test_project_changes_invalidate_both_teams(self):
+        other = make_project('Other', user_id='u2')
+        self.assertEqual(get_membership('u1').project_ids, [self.project.id])
+
+        created = Projects.objects.create(name='New', description='', status='active', team=self.team)
+        self.assertEqual(set(get_membership('u1').project_ids), {self.project.id, created.id})
+
+        get_membership('u2')
+        created.team = other.team
+        created.save()
+        self.assertEqual(get_membership('u1').project_ids, [self.project.id])
+        self.assertEqual(set(get_membership('u2').project_ids), {other.id, created.id})
+
+    def test_removed_member_loses_access(self):
+        member = TeamMembers.objects.create(team=self.team, user_id='u2', role='member')
+
+        def get_project():
+            # A new user per request, like ClerkAuthentication gives
+            client = APIClient()
+            client.force_authenticate(user=ClerkUser('u2'))
+            return client.get(f'/projects/{self.project.id}/').status_code
+
+        self.assertEqual(get_project(), 200)
+        member.delete()
+        self.assertEqual(get_project(), 404)
+
+
+@override_settings(TENANT_DATABASES=['default'], DELETION_BATCH_SIZE=1)
+class DeletionTests(TestCase):
+    def setUp(self):
+        self.project = make_project()
+        self.team = self.project.team
+        task = make_task(self.project, 'recurring', recurrence='FREQ=DAILY')
+        make_task(self.project, 'occurrence', recurrence_parent_id=task.id)
+        Comments.objects.create(task=task, content='note', created_by='u1')
+        self.client = APIClient()
+        self.client.force_authenticate(user=ClerkUser('u1'))
+
+    def test_project_is_hidden_then_deleted_in_the_worker(self):
+        response = self.client.delete(f'/projects/{self.project.id}/')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(BackgroundJobs.objects.get(id=response.data['id']).kind, 'delete_project')
+
+        client = APIClient()
+        client.force_authenticate(user=ClerkUser('u1'))
+        self.assertEqual(client.get(f'/projects/{self.project.id}/').status_code, 404)
+        self.assertEqual(client.get('/tasks/').data, [])
+
+        [deletion] = run_pending_jobs()
+        self.assertEqual(deletion.status, 'done')
+        # The occurrence goes along with its recurring task
+        self.assertEqual(deletion.result, {'tasks': 1, 'projects': 1})
+        self.assertFalse(Tasks.objects.exists())
+        self.assertFalse(Projects.objects.exists())
+        self.assertFalse(Comments.objects.exists())
+        self.assertTrue(Teams.objects.filter(id=self.team.id).exists())
+
+    def test_team_deletion(self):
+        response = self.client.delete(f'/teams/{self.team.id}/')
+        self.assertEqual(response.status_code, 202)
+        [deletion] = run_pending_jobs()
+        self.assertEqual(deletion.result, {'tasks': 1, 'projects': 1, 'members': 1, 'teams': 1})
+        self.assertFalse(Teams.objects.exists())
+        self.assertFalse(TeamMembers.objects.exists())
+
+    def test_mark_is_rolled_back_with_the_job(self):
+        with mock.patch('api.deletion.enqueue', side_effect=RuntimeError('queue down')):
+            with self.assertRaises(RuntimeError):
+                request_project_deletion(self.project, 'u1')
+        self.project.refresh_from_db()
+        self.assertIsNone(self.project.deletion_requested_at)
+
+
+@override_settings(TENANT_DATABASES=['default'])
+class ActivityTests(TestCase):
+    def setUp(self):
+        self.project = make_project()
+        self.task = make_task(self.project, 'task')
+
+    def test_diff_without_reading_the_row(self):
+        task = Tasks.objects.get(id=self.task.id)
+        task.title = 'renamed'
+        task.tags = ['x']
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertNumQueries(1):
+                task.save()
+        task.status = 'Done'
+        with self.captureOnCommitCallbacks(execute=True):
+            task.save(update_fields=['status'])
+
+        updates = ActivityLogs.objects.filter(action='update', entity_id=task.id).order_by('created_at', 'id')
+        self.assertEqual([entry.changes for entry in updates], [
+            {'title': ['task', 'renamed'], 'tags': [[], ['x']]},
+            {'status': ['Todo', 'Done']},
+        ])
+
+    def test_feed_pages(self):
+        for n in range(3):
+            ActivityLogs.objects.create(
+                project_id=self.project.id, entity='task', entity_id=self.task.id, action='update',
+                changes={'title': [str(n), str(n + 1)]}, created_at=utc(2026, 1, 1, n)
+            )
+        client = APIClient()
+        client.force_authenticate(user=ClerkUser('u1'))
+        url = f'/projects/{self.project.id}/activity/'
+
+        first = client.get(url, {'limit': 2}).data
+        self.assertEqual([entry['changes']['title'][1] for entry in first['activity']], ['3', '2'])
+        rest = client.get(url, {'limit': 2, 'cursor': first['next_cursor']}).data
+        self.assertEqual([entry['changes']['title'][1] for entry in rest['activity']], ['1'])
+        self.assertIsNone(rest['next_cursor'])
+
+        response = client.get(url, {'cursor': encode_cursor('yesterday', 'x')})
+        self.assertEqual(response.status_code, 400)
+
+    def test_compact_across_chunks(self):
+        other = make_task(self.project, 'other')
+
+        def update(task, minute, changes, actor='u1'):
+            return ActivityLogs.objects.create(
+                entity='task', entity_id=task.id, action='update', changes=changes,
+                actor=actor, created_at=utc(2026, 1, 1, 12, minute)
+            )
+
+        burst = update(self.task, 0, {'title': ['a', 'b']})
+        update(other, 1, {'title': ['x', 'y']})
+        update(self.task, 2, {'title': ['b', 'c'], 'status': ['Todo', 'Done']})
+        update(self.task, 3, {'status': ['Done', 'Todo']}, actor='u2')
+        update(self.task, 4, {'status': ['Done', 'Todo']})
+        # Changed back and forth, nothing left to show
+        update(other, 20, {'title': ['y', 'z']})
+        update(other, 21, {'title': ['z', 'y']})
+        late = update(self.task, 30, {'title': ['c', 'd']})
+
+        result = compact_activity(utc(2026, 1, 1), utc(2026, 1, 2), timedelta(minutes=5), batch_size=2)
+        self.assertEqual(result, (2, 4))
+        burst.refresh_from_db()
+        self.assertEqual(burst.changes, {'title': ['a', 'c']})
+        self.assertEqual(ActivityLogs.objects.count(), 4)
+        self.assertTrue(ActivityLogs.objects.filter(id=late.id).exists())
+
+
+class UUID7Tests(SimpleTestCase):
+    def test_layout_and_order(self):
+        ids = [uuid7() for _ in range(100)]
+        self.assertEqual({(value.version, value.variant) for value in ids}, {(7, uuid.RFC_4122)})
+        self.assertEqual(len(set(ids)), 100)
+        # Time ordered to the millisecond
+        prefixes = [value.int >> 80 for value in ids]
+        self.assertEqual(prefixes, sorted(prefixes))
+
+
+@override_settings(TENANT_DATABASES=['default'])
+class BinaryUUIDFieldTests(TestCase):
+    def test_round_trip(self):
+        project = make_project()
+        task = make_task(project, 'task')
+        comment = Comments.objects.create(task=task, content='note', created_by='u1')
+
+        self.assertEqual(Tasks.objects.get(id=str(task.id)).id, task.id)
+        self.assertEqual(Comments.objects.values_list('task_id', flat=True).get(), task.id)
+        self.assertEqual(Comments.objects.get(task__project=project).id, comment.id)
+        self.assertIsInstance(Tasks.objects.values_list('id', flat=True).get(), uuid.UUID)
+        self.assertIsNone(Tasks.objects.values_list('recurrence_parent_id', flat=True).get())
+
+        if not connection.features.has_native_uuid_field:
+            with connection.cursor() as cursor:
+                cursor.execute(f'SELECT {connection.ops.quote_name("id")} FROM {connection.ops.quote_name("Tasks")}')
+                self.assertEqual(bytes(cursor.fetchone()[0]), task.id.bytes)
+
+    def test_api_representation(self):
+        project = make_project()
+        task = make_task(project, 'task')
+        client = APIClient()
+        client.force_authenticate(user=ClerkUser('u1'))
+        [listed] = client.get('/tasks/').json()
+        self.assertEqual((listed['id'], listed['project']), (str(task.id), str(project.id)))
+        self.assertEqual(client.get(f'/tasks/{task.id}/activity/').status_code, 200)
+
+
+# Batched reads run in worker threads, which only see committed rows
+@override_settings(TENANT_DATABASES=['default'])
+class BatchTests(TransactionTestCase):
+    def setUp(self):
+        self.project = make_project()
+        self.task = make_task(self.project, 'task')
+        self.foreign = make_task(make_project('Foreign', user_id='u2'), 'foreign')
+        self.client = APIClient()
+        self.client.force_authenticate(user=ClerkUser('u1'))
+
+    def batch(self, *requests):
+        response = self.client.post('/batch/', {'requests': list(requests)}, format='json')
+        self.assertEqual(response.status_code, 200)
+        return response.data['responses']
+
+    def test_partial_failure(self):
+        responses = self.batch(
+            {'method': 'PATCH', 'path': f'/tasks/{self.task.id}/', 'body': {'title': 'renamed'}},
+            {'method': 'POST', 'path': '/tasks/', 'body': {'title': ''}},
+            {'path': f'/tasks/{self.foreign.id}/activity/'},
+            {'path': '/nowhere/'},
+            {'method': 'POST', 'path': '/batch/', 'body': {'requests': []}},
+            {'path': f'/tasks/{self.task.id}/activity/'},
+        )
+        self.assertEqual([response['status'] for response in responses], [200, 400, 404, 404, 400, 200])
+        self.assertEqual(responses[0]['body']['title'], 'renamed')
+        self.assertIn('title', responses[1]['body'])
+        self.task.refresh_from_db()
+        self.assertEqual(self.task.title, 'renamed')
+        # Logged for the batch's caller once the batch is done
+        update = ActivityLogs.objects.get(entity_id=self.task.id, action='update')
+        self.assertEqual((update.changes, update.actor), ({'title': ['task', 'renamed']}, 'u1'))
+
+    def test_reads_after_a_write_see_new_membership(self):
+        responses = self.batch(
+            {'path': '/teams/'},
+            {'method': 'POST', 'path': '/teams/', 'body': {'name': 'New team', 'description': 'Made in a batch'}},
+            {'path': '/teams/'},
+        )
+        self.assertEqual([response['status'] for response in responses], [200, 201, 200])
+        self.assertEqual(len(responses[2]['body']), len(responses[0]['body']) + 1)
+
+    def test_invalid_batch(self):
+        response = self.client.post('/batch/', {'requests': [{'path': 'tasks/'}]}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(TENANT_DATABASES=['default'], JOB_MAX_ATTEMPTS=1, SNAPSHOT_MAX_AGE_SECONDS=3600)
+class SnapshotTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        cache.set(_cache_key('u1'), {'user_id': 'u1', 'first_name': 'Ada', 'last_name': '', 'email': 'ada@example.com'})
+        self.project = make_project()
+        self.client = APIClient()
+        self.client.force_authenticate(user=ClerkUser('u1'))
+
+    def pending_refreshes(self):
+        return BackgroundJobs.objects.filter(kind='refresh_snapshot', status='pending').count()
+
+    def test_first_snapshot_is_built_in_the_worker(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.get('/me/snapshot/')
+        self.assertEqual((response.data['version'], response.data['stale'], response.data['projects']), (0, True, []))
+
+        run_pending_jobs()
+        response = self.client.get('/me/snapshot/')
+        self.assertEqual((response.data['version'], response.data['stale']), (1, False))
+        self.assertEqual([project['name'] for project in response.data['projects']], ['Project'])
+        self.assertEqual(response.data['projects'][0]['members'][0]['first_name'], 'Ada')
+        self.assertEqual(self.client.get('/me/snapshot/', HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+    def test_changes_mark_sections_stale_once(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            get_snapshot('u1')
+        run_pending_jobs()
+
+        for title in ('first', 'second'):
+            with self.captureOnCommitCallbacks(execute=True):
+                make_task(self.project, title, assigned_to='u1')
+        snapshot = UserSnapshots.objects.get(user_id='u1')
+        self.assertEqual(snapshot.dirty, ['tasks'])
+        self.assertIsNotNone(snapshot.stale_since)
+        self.assertEqual(self.pending_refreshes(), 1)
+
+        run_pending_jobs()
+        snapshot.refresh_from_db()
+        self.assertEqual((snapshot.dirty, snapshot.stale_since, snapshot.version), ([], None, 2))
+        titles = [task['title'] for task in snapshot.document['tasks']['project_tasks'][0]['tasks']]
+        self.assertEqual(sorted(titles), ['first', 'second'])
+
+    def test_failed_refresh_is_queued_again(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            get_snapshot('u1')
+        with mock.patch('api.snapshots.build_section', side_effect=RuntimeError('database away')):
+            [failed] = run_pending_jobs()
+        self.assertEqual(failed.status, 'failed')
+        self.assertIsNotNone(UserSnapshots.objects.get(user_id='u1').stale_since)
+
+        # The next change queues a refresh although the snapshot is stale already
+        with self.captureOnCommitCallbacks(execute=True):
+            make_task(self.project, 'task', assigned_to='u1')
+        self.assertEqual(self.pending_refreshes(), 1)
+        run_pending_jobs()
+        self.assertEqual(UserSnapshots.objects.get(user_id='u1').version, 1)
+
+    def test_long_stale_snapshot_is_queued_on_read(self):
+        UserSnapshots.objects.create(user_id='u1', dirty=['tasks'], stale_since=utc(2026, 1, 1))
+        for _ in range(2):
+            with self.captureOnCommitCallbacks(execute=True):
+                get_snapshot('u1')
+        self.assertEqual(self.pending_refreshes(), 1)
+
+    def test_invites_use_the_stored_email_without_clerk(self):
+        invited = make_project('Invited', user_id='u2')
+        ProjectInvites.objects.create(team=invited.team, email='ada@example.com', role='member')
+        UserSnapshots.objects.create(user_id='u1', email='ada@example.com', dirty=['invites'], stale_since=utc(2026, 1, 1))
+        with mock.patch('api.snapshots.get_user_profile', return_value=None):
+            with self.captureOnCommitCallbacks(execute=True):
+                get_snapshot('u1')
+            run_pending_jobs()
+        snapshot = UserSnapshots.objects.get(user_id='u1')
+        self.assertEqual(snapshot.email, 'ada@example.com')
+        self.assertEqual([invite['project_name'] for invite in snapshot.document['invites']], ['Invited'])
+
+
+@override_settings(TENANT_DATABASES=['default', 'shard1'])
+class TenantRouterTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.router = TenantRouter()
+        self.team_id = uuid.uuid4()
+        TeamShards.objects.create(team_id=self.team_id, alias='shard1')
+
+    def test_queries_follow_the_tenant_context(self):
+        self.assertEqual(self.router.db_for_read(Tasks), 'default')
+        with using_alias('shard1'):
+            self.assertEqual(self.router.db_for_read(Tasks), 'shard1')
+            self.assertEqual(self.router.db_for_write(Comments), 'shard1')
+            # Models that are not team data stay in default
+            self.assertIsNone(self.router.db_for_read(BackgroundJobs))
+            self.assertIsNone(self.router.db_for_write(TeamShards))
+
+    def test_instances_go_to_their_team(self):
+        self.assertEqual(self.router.db_for_write(Teams, instance=Teams(id=self.team_id)), 'shard1')
+        project = Projects(team_id=self.team_id)
+        self.assertEqual(self.router.db_for_write(Projects, instance=project), 'shard1')
+        self.assertEqual(self.router.db_for_write(Projects, instance=Projects(team_id=uuid.uuid4())), 'default')
+
+    def test_tasks(self):
+        project = Projects(team_id=self.team_id)
+        project._state.db = 'shard1'
+        with using_alias('shard1'):
+            # Personal tasks live in default whatever the context
+            self.assertEqual(self.router.db_for_write(Tasks, instance=Tasks(project=None)), 'default')
+        self.assertEqual(self.router.db_for_write(Tasks, instance=Tasks(project=project)), 'shard1')
+
+    def test_relations_stay_within_one_database(self):
+        project = Projects(team_id=self.team_id)
+        project._state.db = 'shard1'
+        task = Tasks()
+        task._state.db = 'default'
+        self.assertFalse(self.router.allow_relation(project, task))
+        task._state.db = 'shard1'
+        self.assertTrue(self.router.allow_relation(project, task))
+
+    def test_allow_migrate(self):
+        self.assertTrue(self.router.allow_migrate('shard1', 'api', 'tasks'))
+        self.assertTrue(self.router.allow_migrate('default', 'api', 'tasks'))
+        self.assertFalse(self.router.allow_migrate('shard1', 'api', 'backgroundjobs'))
+        self.assertFalse(self.router.allow_migrate('shard1', 'auth', 'user'))
+        self.assertTrue(self.router.allow_migrate('default', 'auth', 'user'))
+
+    @override_settings(TENANT_DATABASES=['default'])
+    def test_single_database(self):
+        with using_alias('shard1'):
+            self.assertIsNone(self.router.db_for_read(Tasks))
+
+
+@skipUnless('shard1' in settings.TENANT_DATABASES, 'needs TENANT_SHARDS=shard1')
+@override_settings(TENANT_DIRECTORY_CACHE_TIMEOUT=0)
+class TwoDatabaseTests(TestCase):
+    """Run with TENANT_SHARDS=shard1, e.g. the SQLite setup described in settings.py"""
+
+    databases = set(settings.TENANT_DATABASES)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_instances_are_saved_in_their_team_database(self):
+        team = Teams(name='Sharded', description='')
+        TeamShards.objects.create(team_id=team.id, alias='shard1')
+        team.save()
+        project = Projects(name='P', description='', status='active', team=team)
+        project.save()
+        Tasks(title='task', description='', priority='low', due_date=utc(2026, 1, 1), project=project, tags=[]).save()
+
+        self.assertTrue(Teams.objects.using('shard1').filter(id=team.id).exists())
+        self.assertFalse(Teams.objects.using('default').filter(id=team.id).exists())
+        self.assertEqual(Tasks.objects.using('shard1').count(), 1)
+
+    def test_queries_use_the_tenant_context(self):
+        with using_alias('shard1'):
+            make_task(make_project(), 'task')
+            self.assertEqual(list(Tasks.objects.values_list('title', flat=True)), ['task'])
+        self.assertFalse(Tasks.objects.exists())
+        self.assertEqual(Tasks.objects.using('shard1').count(), 1)
+
+    def test_rebalance_skips_teams_being_moved(self):
+        moving, staying = make_project('Moving'), make_project('Staying')
+        for project in (moving, staying):
+            make_task(project, 'unranked')
+        TeamShards.objects.create(team_id=moving.team_id, alias='default', read_only=True)
+
+        err = io.StringIO()
+        call_command('rebalance_ranks', stdout=io.StringIO(), stderr=err)
+        self.assertIn(f'Skipped team {moving.team_id}', err.getvalue())
+        self.assertEqual(Tasks.objects.get(project=moving).rank, '')
+        self.assertNotEqual(Tasks.objects.get(project=staying).rank, '')
+
+    def test_move_team(self):
+        project = make_project()
+        make_task(project, 'first', rank='a')
+        make_task(project, 'second', rank='b')
+
+        move_team(project.team_id, 'shard1', settle_seconds=0, log=lambda message: None)
+
+        self.assertEqual(TeamShards.objects.get(team_id=project.team_id).alias, 'shard1')
+        self.assertFalse(TeamShards.objects.get(team_id=project.team_id).read_only)
+        self.assertFalse(Projects.objects.using('default').exists())
+        self.assertEqual(
+            sorted(Tasks.objects.using('shard1').values_list('title', flat=True)),
+            ['first', 'second']
+        )
+
+
+@override_settings(TENANT_DATABASES=['default'], TENANT_DIRECTORY_CACHE_TIMEOUT=0)
+class RebalanceRanksCommandTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.project = make_project()
+        make_task(self.project, 'first')
+        make_task(self.project, 'second')
+
+    def test_rebalances_unranked_columns(self):
+        out = io.StringIO()
+        call_command('rebalance_ranks', stdout=out)
+        self.assertIn('Rebalanced 2 tasks', out.getvalue())
+        self.assertNotIn('', Tasks.objects.values_list('rank', flat=True))
@@ -0,0 +1,105 @@
+# throttling.py
+# Token-bucket throttling for the endpoints that fan out to Clerk. Every user
+# owns one bucket in the shared cache; each route takes a number of tokens
+# roughly matching the remote calls it makes, so a chatty client cannot starve
+# the worker pool or burn through our Clerk rate limit.
+import math
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.throttling import BaseThrottle
+
+LOCK_ATTEMPTS = 20
+LOCK_WAIT = 0.005
+
+
+class TokenBucket:
+    def __init__(self, key, capacity, refill_rate):
+        self.key = f'throttle:{key}'
+        self.lock_key = f'{self.key}:lock'
+        self.capacity = capacity
+        self.refill_rate = refill_rate
+
+    def _acquire(self):
+        for _ in range(LOCK_ATTEMPTS):
+            if cache.add(self.lock_key, 1, timeout=1):
+                return True
+            time.sleep(LOCK_WAIT)
+        return False
+
+    def consume(self, cost, now=None):
+        """Take `cost` tokens if available.
+
+        Returns (allowed, remaining, wait) where wait is the number of seconds
+        until enough tokens have been refilled.
+        """
+        if not self._acquire():
+            # Only a user hammering their own bucket contends for the lock, and
+            # a slow cache is no reason to refuse them: let the request through
+            tokens, _ = cache.get(self.key, (self.capacity, None))
+            return True, max(0, tokens - cost), 0
+        try:
+            now = time.time() if now is None else now
+            tokens, updated_at = cache.get(self.key, (self.capacity, now))
+            now = max(now, updated_at)
+            tokens = min(self.capacity, tokens + (now - updated_at) * self.refill_rate)
+
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            wait = 0 if allowed else (cost - tokens) / self.refill_rate
+
+            # Idle buckets are full again after this long, no need to keep them
+            timeout = math.ceil(self.capacity / self.refill_rate) + 1
+            cache.set(self.key, (tokens, now), timeout=timeout)
+            return allowed, tokens, wait
+        finally:
+            cache.delete(self.lock_key)
+
+
+class ClerkRouteThrottle(BaseThrottle):
+    """Charge the route's configured cost against the user's token bucket.
+
+    Costs are looked up in settings.CLERK_THROTTLE['COSTS'] by
+    '<basename>.<action>'; routes without a cost are not throttled.
+    """
+
+    def get_cost(self, view):
+        costs = settings.CLERK_THROTTLE['COSTS']
+        return costs.get(f'{getattr(view, "basename", "")}.{getattr(view, "action", "")}', 0)
+
+    def allow_request(self, request, view):
+        cost = self.get_cost(view)
+        if not cost or not getattr(request.user, 'is_authenticated', False):
+            return True
+
+        config = settings.CLERK_THROTTLE
+        bucket = TokenBucket(request.user.id, config['CAPACITY'], config['REFILL_RATE'])
+        allowed, remaining, self.wait_seconds = bucket.consume(cost)
+
+        refill = (config['CAPACITY'] - remaining) / config['REFILL_RATE']
+        request.rate_limit = {
+            'limit': config['CAPACITY'],
+            'remaining': math.floor(remaining),
+            'reset': math.ceil(refill),
+            'cost': cost,
+        }
+        return allowed
+
+    def wait(self):
+        return getattr(self, 'wait_seconds', None)
+
+
+class RateLimitHeadersMixin:
+    """Expose the throttle state of the request as rate-limit response headers"""
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        rate_limit = getattr(request, 'rate_limit', None)
+        if rate_limit:
+            response['X-RateLimit-Limit'] = rate_limit['limit']
+            response['X-RateLimit-Remaining'] = rate_limit['remaining']
+            response['X-RateLimit-Reset'] = rate_limit['reset']
+            response['X-RateLimit-Cost'] = rate_limit['cost']
+        return response
@@ -1,6 +1,9 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import ProjectViewSet, TeamViewSet, TaskViewSet, CommentViewSet, ProjectInviteViewSet
+from .views import (
+    ProjectViewSet, TeamViewSet, TaskViewSet, CommentViewSet, ProjectInviteViewSet, JobViewSet,
+    CalendarViewSet, BatchViewSet, MeViewSet
+)
 
 router = DefaultRouter()
 router.register(r'projects', ProjectViewSet, basename='project')
@@ -8,6 +11,10 @@ router.register(r'teams', TeamViewSet, basename='team')
 router.register(r'tasks', TaskViewSet, basename='task')
 router.register(r'comments', CommentViewSet, basename='comment')
 router.register(r'invites', ProjectInviteViewSet, basename='invite')
+router.register(r'jobs', JobViewSet, basename='job')
+router.register(r'calendar', CalendarViewSet, basename='calendar')
+router.register(r'batch', BatchViewSet, basename='batch')
+router.register(r'me', MeViewSet, basename='me')
 
 urlpatterns = [
     path('', include(router.urls)),
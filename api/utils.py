@@ -0,0 +1,25 @@
+# utils.py
+from datetime import datetime, time
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+
+def query_flag(request, name):
+    """Read a boolean query parameter such as ?include_archived=true"""
+    return request.query_params.get(name, '').lower() in ('1', 'true', 'yes')
+
+
+def parse_when(value):
+    """Parse an ISO date or datetime into an aware datetime, None if invalid"""
+    value = (value or '').strip()
+    try:
+        parsed = parse_datetime(value)
+        if parsed is None:
+            day = parse_date(value)
+            parsed = datetime.combine(day, time()) if day else None
+    except ValueError:
+        return None
+    if parsed is not None and timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
@@ -1,25 +1,53 @@
 import os
-from rest_framework import viewsets, status
+import uuid
+from rest_framework import viewsets, status, serializers
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from rest_framework.renderers import JSONRenderer
 from rest_framework.permissions import IsAuthenticated
 from django.db.models import Q
 from datetime import datetime
 from django.shortcuts import get_object_or_404
-from .models import Projects, Teams, TeamMembers, Tasks, Comments, ProjectInvites
+from django.conf import settings
+from django.http import StreamingHttpResponse, FileResponse, Http404
+from django.core.files.storage import default_storage
+from .models import (
+    Projects, Teams, TeamMembers, Tasks, Comments, ProjectInvites,
+    ArchivedTasks, ArchivedComments, BackgroundJobs, ActivityLogs
+)
 from .serializers import (
     ProjectSerializer, TeamSerializer, TeamMemberSerializer,
     TaskSerializer, CommentSerializer, TaskWithProjectSerializer,
     ProjectDetailSerializer, ProjectBasicSerializer, InviteResponseSerializer,
-    InviteRequestSerializer, ProjectInviteSerializer 
+    InviteRequestSerializer, ProjectInviteSerializer, TaskMoveSerializer,
+    ArchivedTaskSerializer, ArchivedCommentSerializer, BackgroundJobSerializer,
+    OccurrenceSerializer, ActivityLogSerializer, BatchRequestSerializer
 )
+from .export import iter_export, CONTENT_TYPES
+from .importer import TaskImporter, iter_rows, detect_format, FORMATS
+from .jobs import enqueue
+from .batch import run_batch
+from .snapshots import get_snapshot, mark_stale
+from .activity import activity_page, record_activity
+from .negotiation import IgnoreClientContentNegotiation
+from .recurrence import occurrence_dates, materialize_occurrence
+from .deletion import request_project_deletion, request_team_deletion
+from .membership import visible_tasks, visible_archived_tasks
+from .utils import query_flag, parse_when
+from .archive import include_archived
+from .pagination import encode_cursor, decode_cursor, parse_limit
+from .ranking import next_rank, move_rank, parse_rank
+from .throttling import ClerkRouteThrottle, RateLimitHeadersMixin
+from .tenancy import TenantRoutingMixin, across_shards, current_alias, fan_out, iter_using, user_aliases
 from clerk_backend_api import Clerk
 from django.utils import timezone
 
 
-class ProjectViewSet(viewsets.ModelViewSet):
+class ProjectViewSet(TenantRoutingMixin, RateLimitHeadersMixin, viewsets.ModelViewSet):
     serializer_class = ProjectSerializer
     permission_classes = [IsAuthenticated]
+    throttle_classes = [ClerkRouteThrottle]
+    tenant_lookup = (Projects, 'team_id')
 
     def get_serializer_class(self):
         if self.action == 'basic_projects':
@@ -27,11 +55,23 @@ class ProjectViewSet(viewsets.ModelViewSet):
         return ProjectSerializer
 
     def get_queryset(self):
-        user_id = self.request.user.id
-        team_memberships = TeamMembers.objects.filter(user_id=user_id).values_list('team_id', flat=True)
-        return Projects.objects.filter(team_id__in=team_memberships)
+        return Projects.objects.filter(
+            team_id__in=self.request.user.membership.team_ids,
+            deletion_requested_at__isnull=True
+        )
+
+    def destroy(self, request, *args, **kwargs):
+        """Hide the project at once and delete its rows in the background"""
+        project = self.get_object()
+        deletion_job = request_project_deletion(project, request.user.id)
+        return Response(BackgroundJobSerializer(deletion_job).data, status=status.HTTP_202_ACCEPTED)
+
+    @across_shards()
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
 
     @action(detail=False, methods=['GET'])
+    @across_shards()
     def basic_projects(self, request):
         """Get basic project information with member details"""
         queryset = self.get_queryset()
@@ -41,6 +81,7 @@ class ProjectViewSet(viewsets.ModelViewSet):
         })
 
     @action(detail=False, methods=['GET'])
+    @across_shards()
     def user_projects(self, request):
         """Get projects where the user is a member"""
         queryset = self.get_queryset()
@@ -49,8 +90,172 @@ class ProjectViewSet(viewsets.ModelViewSet):
             "projects": serializer.data
         })
 
+    @action(detail=True, methods=['GET'])
+    def board(self, request, pk=None):
+        """Get the project's tasks grouped into its task_statuses columns.
+
+        Each column returns up to `limit` tasks in rank order. Pass `status`
+        together with that column's `next_cursor` as `cursor` to page further.
+        """
+        project = self.get_object()
+        limit = parse_limit(
+            request.query_params.get('limit'),
+            settings.BOARD_COLUMN_LIMIT,
+            settings.BOARD_COLUMN_MAX_LIMIT
+        )
+        statuses = project.task_statuses or []
+
+        column_status = request.query_params.get('status')
+        cursor = None
+        if column_status is not None:
+            if column_status not in statuses:
+                return Response(
+                    {'error': f'Status must be one of: {", ".join(statuses)}'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            statuses = [column_status]
+            if request.query_params.get('cursor'):
+                cursor = decode_cursor(request.query_params['cursor'], parse_rank, uuid.UUID)
+                if cursor is None:
+                    return Response({'error': 'Invalid cursor'}, status=status.HTTP_400_BAD_REQUEST)
+
+        columns = []
+        for task_status in statuses:
+            # Served by the (project, status, rank) index
+            tasks = Tasks.objects.filter(
+                project=project,
+                status=task_status
+            ).order_by('rank', 'id')
+            if cursor:
+                rank, task_id = cursor
+                tasks = tasks.filter(Q(rank__gt=rank) | Q(rank=rank, id__gt=task_id))
+
+            page = list(tasks[:limit + 1])
+            next_cursor = None
+            if len(page) > limit:
+                page = page[:limit]
+                next_cursor = encode_cursor(page[-1].rank, page[-1].id)
+
+            columns.append({
+                'status': task_status,
+                'tasks': TaskSerializer(page, many=True).data,
+                'next_cursor': next_cursor
+            })
+
+        return Response({
+            'project_id': project.id,
+            'columns': columns
+        })
+
+    @action(detail=True, methods=['GET'])
+    def activity(self, request, pk=None):
+        """Get the project's activity feed, newest first, `limit` entries per page.
+
+        Pass the returned `next_cursor` as `cursor` to get older entries.
+        """
+        project = self.get_object()
+        limit = parse_limit(
+            request.query_params.get('limit'),
+            settings.ACTIVITY_PAGE_SIZE,
+            settings.ACTIVITY_MAX_PAGE_SIZE
+        )
+        # Served by the (project_id, created_at, id) index
+        try:
+            entries, next_cursor = activity_page(
+                ActivityLogs.objects.filter(project_id=project.id),
+                request.query_params.get('cursor'),
+                limit
+            )
+        except ValueError:
+            return Response({'error': 'Invalid cursor'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({
+            'activity': ActivityLogSerializer(entries, many=True).data,
+            'next_cursor': next_cursor
+        })
+
+    @action(
+        detail=True,
+        methods=['GET'],
+        renderer_classes=[JSONRenderer],
+        content_negotiation_class=IgnoreClientContentNegotiation
+    )
+    def export(self, request, pk=None):
+        """Stream the project's tasks as CSV or NDJSON (?format=csv|ndjson).
+
+        ?include_comments=true joins comments in, ?background=true writes the
+        export to a file from the worker and returns the job to poll instead.
+        The job and any error are plain JSON whatever the format.
+        """
+        project = self.get_object()
+        export_format = request.query_params.get('format', 'csv')
+        if export_format not in CONTENT_TYPES:
+            return Response(
+                {'error': f'format must be one of: {", ".join(CONTENT_TYPES)}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        include_comments = query_flag(request, 'include_comments')
+
+        if query_flag(request, 'background'):
+            export_job = enqueue('export_project', {
+                'project_id': str(project.id),
+                'format': export_format,
+                'include_comments': include_comments
+            }, created_by=request.user.id)
+            return Response(
+                BackgroundJobSerializer(export_job).data,
+                status=status.HTTP_202_ACCEPTED
+            )
+
+        # The body is generated after the view returns, in the project's database still
+        response = StreamingHttpResponse(
+            iter_using(current_alias(), iter_export(project, export_format, include_comments)),
+            content_type=CONTENT_TYPES[export_format]
+        )
+        response['Content-Disposition'] = f'attachment; filename="project-{project.id}.{export_format}"'
+        return response
+
+    @action(detail=True, methods=['POST'], url_path='import')
+    def import_tasks(self, request, pk=None):
+        """Bulk import tasks from an uploaded CSV/NDJSON/JSON `file` or a JSON `tasks` list.
+
+        ?dry_run=true only validates and reports the errors per row.
+        """
+        project = self.get_object()
+        importer = TaskImporter(
+            project,
+            created_by=request.user.id,
+            dry_run=query_flag(request, 'dry_run')
+        )
+
+        upload = request.FILES.get('file')
+        try:
+            if upload:
+                input_format = request.data.get('file_format') or detect_format(upload.name)
+                if input_format not in FORMATS:
+                    return Response(
+                        {'error': f'file_format must be one of: {", ".join(FORMATS)}'},
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
+                report = importer.run(iter_rows(upload, input_format))
+            elif isinstance(request.data.get('tasks'), list):
+                report = importer.run(request.data['tasks'])
+            else:
+                return Response(
+                    {'error': 'Upload a file or send a list of tasks'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+        except (ValueError, UnicodeDecodeError) as e:
+            return Response(
+                {'error': f'Could not parse input: {str(e)}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        return Response(report, status=status.HTTP_200_OK if importer.dry_run else status.HTTP_201_CREATED)
+
     def perform_create(self, serializer):
         team_id = self.request.data.get('team')
+        # Projects created as completed start aging towards the archive at once
+        extra = {'completed_at': timezone.now()} if serializer.validated_data.get('status') == 'completed' else {}
         if not team_id:
             current_date = datetime.now().strftime("%Y-%m-%d")
             team = Teams.objects.create(
@@ -62,14 +267,31 @@ class ProjectViewSet(viewsets.ModelViewSet):
                 user_id=self.request.user.id,
                 role='owner'
             )
-            serializer.save(team=team)
+            serializer.save(team=team, **extra)
+        else:
+            serializer.save(**extra)
+
+    def perform_update(self, serializer):
+        instance = serializer.instance
+        was_completed = instance.status == 'completed'
+        is_completed = serializer.validated_data.get('status', instance.status) == 'completed'
+
+        if is_completed and not was_completed:
+            serializer.save(completed_at=timezone.now())
+        elif was_completed and not is_completed:
+            project = serializer.save(completed_at=None)
+            # Bring archived tasks back into the hot tables on reopen, in the
+            # worker since a project can have any number of them
+            enqueue('restore_project', {'project_id': str(project.id)}, created_by=self.request.user.id)
         else:
             serializer.save()
 
 
-class TaskViewSet(viewsets.ModelViewSet):
+class TaskViewSet(TenantRoutingMixin, RateLimitHeadersMixin, viewsets.ModelViewSet):
     serializer_class = TaskSerializer
     permission_classes = [IsAuthenticated]
+    throttle_classes = [ClerkRouteThrottle]
+    tenant_lookup = (Tasks, 'project__team_id')
 
     def get_serializer_class(self):
         if self.action in ['retrieve']:
@@ -77,20 +299,155 @@ class TaskViewSet(viewsets.ModelViewSet):
         return TaskSerializer
 
     def get_queryset(self):
-        user_id = self.request.user.id
-        team_memberships = TeamMembers.objects.filter(user_id=user_id).values_list('team_id', flat=True)
-        user_projects = Projects.objects.filter(team_id__in=team_memberships).values_list('id', flat=True)
-        
-        return Tasks.objects.filter(
-            Q(assigned_to=user_id) |
-            Q(created_by=user_id) |
-            Q(project_id__in=user_projects)
-        ).select_related('project').distinct()
+        return visible_tasks(self.request.user)
+
+    def get_archived_queryset(self):
+        return visible_archived_tasks(self.request.user)
+
+    @across_shards()
+    def list(self, request, *args, **kwargs):
+        response = super().list(request, *args, **kwargs)
+        if include_archived(request):
+            archived = ArchivedTaskSerializer(self.get_archived_queryset(), many=True).data
+            response.data = list(response.data) + list(archived)
+        return response
     
     def perform_create(self, serializer):
-        serializer.save(created_by=self.request.user.id)
+        project = serializer.validated_data.get('project')
+        rank = next_rank(project.id, serializer.validated_data.get('status')) if project else ''
+        serializer.save(created_by=self.request.user.id, rank=rank)
+
+    def perform_update(self, serializer):
+        instance = serializer.instance
+        project = serializer.validated_data.get('project', instance.project)
+        task_status = serializer.validated_data.get('status', instance.status)
+        # A task landing in another column goes to the bottom of it
+        if project and (project.id != instance.project_id or task_status != instance.status):
+            serializer.save(rank=next_rank(project.id, task_status))
+        else:
+            serializer.save()
+
+    @action(detail=True, methods=['POST'])
+    def move(self, request, pk=None):
+        """Move a task within or across board columns, updating only its own row.
+
+        `before` and `after` are the ids of the tasks that end up directly
+        above and below the moved task.
+        """
+        task = self.get_object()
+        serializer = TaskMoveSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        if not task.project:
+            return Response(
+                {'error': 'Only project tasks can be moved on a board'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        task_status = serializer.validated_data.get('status', task.status)
+        if task_status not in task.project.task_statuses:
+            return Response(
+                {'error': f'Status must be one of: {", ".join(task.project.task_statuses)}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            rank = move_rank(
+                task,
+                task_status,
+                before_id=serializer.validated_data.get('before'),
+                after_id=serializer.validated_data.get('after')
+            )
+        except Tasks.DoesNotExist:
+            return Response(
+                {'error': 'Neighbouring task not found in the target column'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        except ValueError:
+            # `before` does not sort above `after`, e.g. the two were swapped
+            return Response(
+                {'error': 'before must be the task directly above after'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        Tasks.objects.filter(id=task.id).update(status=task_status, rank=rank)
+        # update() skips the model signals, so log the move here
+        changes = {'rank': [task.rank, rank]}
+        if task_status != task.status:
+            changes['status'] = [task.status, task_status]
+            mark_stale(['tasks'], user_ids=[task.assigned_to, task.created_by])
+        record_activity(task, 'update', changes)
+
+        return Response({
+            'id': task.id,
+            'status': task_status,
+            'rank': rank
+        })
+
+    @action(detail=True, methods=['POST'])
+    def occurrences(self, request, pk=None):
+        """Edit one occurrence of a recurring task, storing it as a real task first.
+
+        Takes the `occurrence_date` to edit plus any task fields to change on it.
+        """
+        task = self.get_object()
+        if not task.recurrence:
+            return Response(
+                {'error': 'Task does not recur'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        serializer = OccurrenceSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            occurrence, created = materialize_occurrence(task, serializer.validated_data['occurrence_date'])
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        changes = {key: value for key, value in request.data.items() if key != 'occurrence_date'}
+        # An occurrence does not repeat on its own
+        changes.pop('recurrence', None)
+        task_serializer = TaskSerializer(occurrence, data=changes, partial=True)
+        if not task_serializer.is_valid():
+            return Response(task_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        task_serializer.save()
+
+        return Response(
+            task_serializer.data,
+            status=status.HTTP_201_CREATED if created else status.HTTP_200_OK
+        )
+
+    @action(detail=True, methods=['GET'])
+    def activity(self, request, pk=None):
+        """Get the task's activity feed, including its comments, newest first.
+
+        Pass the returned `next_cursor` as `cursor` to get older entries.
+        """
+        task = self.get_object()
+        limit = parse_limit(
+            request.query_params.get('limit'),
+            settings.ACTIVITY_PAGE_SIZE,
+            settings.ACTIVITY_MAX_PAGE_SIZE
+        )
+        # Served by the (task_id, created_at, id) index
+        try:
+            entries, next_cursor = activity_page(
+                ActivityLogs.objects.filter(task_id=task.id),
+                request.query_params.get('cursor'),
+                limit
+            )
+        except ValueError:
+            return Response({'error': 'Invalid cursor'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({
+            'activity': ActivityLogSerializer(entries, many=True).data,
+            'next_cursor': next_cursor
+        })
 
     @action(detail=False, methods=['GET'])
+    @across_shards()
     def personal_tasks(self, request):
         """Get tasks that aren't associated with any project"""
         user_id = self.request.user.id
@@ -105,18 +462,21 @@ class TaskViewSet(viewsets.ModelViewSet):
         })
 
     @action(detail=False, methods=['GET'])
+    @across_shards()
     def project_tasks(self, request):
-        user_id = request.user.id
-        team_memberships = TeamMembers.objects.filter(user_id=user_id).values_list('team_id', flat=True)
-        user_projects = Projects.objects.filter(team_id__in=team_memberships).values_list('id', flat=True)
+        user_projects = request.user.membership.project_ids
         
         tasks = Tasks.objects.filter(
             project_id__in=user_projects
         ).select_related('project')
         
         serializer = self.get_serializer(tasks, many=True)
+        data = serializer.data
+        if include_archived(request):
+            archived_tasks = ArchivedTasks.objects.filter(project_id__in=user_projects)
+            data = list(data) + list(ArchivedTaskSerializer(archived_tasks, many=True).data)
         return Response({
-            "tasks": serializer.data
+            "tasks": data
         })
 
     def retrieve(self, request, *args, **kwargs):
@@ -125,6 +485,7 @@ class TaskViewSet(viewsets.ModelViewSet):
         return Response(serializer.data)
 
     @action(detail=False, methods=['GET'])
+    @across_shards()
     def user_visible_tasks(self, request):
         user_id = request.user.id
         
@@ -135,8 +496,10 @@ class TaskViewSet(viewsets.ModelViewSet):
         )
         
         # Get projects and their tasks
-        team_memberships = TeamMembers.objects.filter(user_id=user_id).values_list('team_id', flat=True)
-        projects = Projects.objects.filter(team_id__in=team_memberships)
+        projects = Projects.objects.filter(
+            team_id__in=request.user.membership.team_ids,
+            deletion_requested_at__isnull=True
+        )
         
         project_tasks_data = []
         for project in projects:
@@ -157,13 +520,135 @@ class TaskViewSet(viewsets.ModelViewSet):
         return Response(response_data)
 
 
-class TeamViewSet(viewsets.ModelViewSet):
+class CalendarViewSet(viewsets.ViewSet):
+    permission_classes = [IsAuthenticated]
+
+    def list(self, request):
+        """Get visible tasks due in [start, end), with recurring tasks expanded into occurrences"""
+        start = parse_when(request.query_params.get('start'))
+        end = parse_when(request.query_params.get('end'))
+        if not start or not end or end <= start:
+            return Response(
+                {'error': 'start and end must be ISO dates with start before end'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if (end - start).days > settings.CALENDAR_MAX_DAYS:
+            return Response(
+                {'error': f'The window can span at most {settings.CALENDAR_MAX_DAYS} days'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        # Each database holding the user's teams builds its own entries
+        entries = []
+        for alias_entries in fan_out(lambda alias: self.entries(request, start, end), user_aliases(request.user)):
+            entries += alias_entries
+        entries.sort(key=lambda entry: entry[0])
+        return Response({
+            'start': start,
+            'end': end,
+            'tasks': [data for _, data in entries]
+        })
+
+    def entries(self, request, start, end):
+        """(due date, data) of the tasks and virtual occurrences in the current database"""
+        tasks_queryset = visible_tasks(request.user)
+        # Range scan over the due_date index
+        tasks = list(tasks_queryset.filter(due_date__gte=start, due_date__lt=end))
+        series = list(tasks_queryset.filter(due_date__lt=end).exclude(recurrence=''))
+
+        # Occurrences already stored as real rows are part of `tasks`
+        materialized = set(
+            Tasks.objects.filter(
+                recurrence_parent__in=[task.id for task in series],
+                occurrence_date__gte=start,
+                occurrence_date__lt=end
+            ).values_list('recurrence_parent_id', 'occurrence_date')
+        )
+
+        entries = []
+        for task in tasks:
+            data = TaskSerializer(task).data
+            data['virtual'] = False
+            entries.append((task.due_date, data))
+
+        date_field = serializers.DateTimeField()
+        for task in series:
+            template = TaskSerializer(task).data
+            for occurrence in occurrence_dates(task, start, end):
+                if (task.id, occurrence) in materialized:
+                    continue
+                data = dict(template)
+                data.update({
+                    'id': None,
+                    'due_date': date_field.to_representation(occurrence),
+                    'recurrence_parent': task.id,
+                    'occurrence_date': date_field.to_representation(occurrence),
+                    'virtual': True
+                })
+                entries.append((occurrence, data))
+        return entries
+
+
+class MeViewSet(viewsets.ViewSet):
+    permission_classes = [IsAuthenticated]
+
+    @action(detail=False, methods=['GET'])
+    def snapshot(self, request):
+        """Get the stored home screen snapshot: projects with members, tasks and invites.
+
+        Send the returned ETag as If-None-Match to get a 304 while the
+        snapshot's `version` is unchanged. A user's first snapshot is built in
+        the background, until then it is empty with version 0 and `stale` set.
+        """
+        snapshot = get_snapshot(request.user.id)
+        etag = f'"{snapshot.version}"'
+        if request.headers.get('If-None-Match') == etag:
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+
+        return Response({
+            'version': snapshot.version,
+            'refreshed_at': snapshot.refreshed_at,
+            'stale': snapshot.stale_since is not None,
+            **snapshot.document
+        }, headers={'ETag': etag})
+
+
+class BatchViewSet(viewsets.ViewSet):
+    permission_classes = [IsAuthenticated]
+
+    def create(self, request):
+        """Run several API requests in one round trip, authenticating once.
+
+        Takes `requests`, a list of {method, path, body}. Consecutive GET
+        requests run concurrently, anything else runs in order. Returns each
+        request's status and body under `responses`, in request order.
+        """
+        serializer = BatchRequestSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            'responses': run_batch(request, serializer.validated_data['requests'])
+        })
+
+
+class TeamViewSet(TenantRoutingMixin, viewsets.ModelViewSet):
     serializer_class = TeamSerializer
     permission_classes = [IsAuthenticated]
+    tenant_lookup = (Teams, 'id')
 
     def get_queryset(self):
-        user_id = self.request.user.id
-        return Teams.objects.filter(teammembers__user_id=user_id)
+        return Teams.objects.filter(id__in=self.request.user.membership.team_ids)
+
+    def destroy(self, request, *args, **kwargs):
+        """Hide the team and its projects at once and delete their rows in the background"""
+        team = self.get_object()
+        deletion_job = request_team_deletion(team, request.user.id)
+        return Response(BackgroundJobSerializer(deletion_job).data, status=status.HTTP_202_ACCEPTED)
+
+    @across_shards()
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
 
     def perform_create(self, serializer):
         team = serializer.save()
@@ -175,22 +660,32 @@ class TeamViewSet(viewsets.ModelViewSet):
         )
 
 
-class CommentViewSet(viewsets.ModelViewSet):
+class CommentViewSet(TenantRoutingMixin, viewsets.ModelViewSet):
     serializer_class = CommentSerializer
     permission_classes = [IsAuthenticated]
+    tenant_lookup = (Comments, 'task__project__team_id')
 
     def get_queryset(self):
-        user_id = self.request.user.id
         # Get all tasks visible to the user
-        visible_tasks = TaskViewSet(request=self.request).get_queryset()
-        return Comments.objects.filter(task__in=visible_tasks)
+        return Comments.objects.filter(task__in=visible_tasks(self.request.user))
+
+    @across_shards()
+    def list(self, request, *args, **kwargs):
+        response = super().list(request, *args, **kwargs)
+        if include_archived(request):
+            archived_tasks = visible_archived_tasks(request.user)
+            archived = ArchivedComments.objects.filter(task__in=archived_tasks)
+            response.data = list(response.data) + list(ArchivedCommentSerializer(archived, many=True).data)
+        return response
 
     def perform_create(self, serializer):
         serializer.save(created_by=self.request.user.id)
 
 
-class ProjectInviteViewSet(viewsets.ModelViewSet):
+class ProjectInviteViewSet(TenantRoutingMixin, RateLimitHeadersMixin, viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
+    throttle_classes = [ClerkRouteThrottle]
+    tenant_lookup = (ProjectInvites, 'team_id')
 
     @action(detail=False, methods=['POST'])
     def invite_user(self, request):
@@ -202,22 +697,18 @@ class ProjectInviteViewSet(viewsets.ModelViewSet):
         project_id = serializer.validated_data['project_id']
         role = serializer.validated_data['role']
 
-        try:
-            project = Projects.objects.get(id=project_id)
-            requesting_user_member = TeamMembers.objects.get(
-                team=project.team,
-                user_id=request.user.id
-            )
-            if requesting_user_member.role != 'admin' and role == 'owner':
-                return Response(
-                    {'error': 'Only admin users can send invites'}, 
-                    status=status.HTTP_403_FORBIDDEN
-                )
-        except (Projects.DoesNotExist, TeamMembers.DoesNotExist):
+        project = Projects.objects.select_related('team').filter(id=project_id, deletion_requested_at__isnull=True).first()
+        requesting_role = request.user.membership.role(project.team_id) if project else None
+        if requesting_role is None:
             return Response(
                 {'error': 'Project not found or you do not have access'},
                 status=status.HTTP_404_NOT_FOUND
             )
+        if requesting_role != 'admin' and role == 'owner':
+            return Response(
+                {'error': 'Only admin users can send invites'}, 
+                status=status.HTTP_403_FORBIDDEN
+            )
 
         # Check if user is already a team member
         clerk = Clerk(bearer_auth=os.getenv('CLERK_SECRET_KEY'))
@@ -274,14 +765,12 @@ class ProjectInviteViewSet(viewsets.ModelViewSet):
             )
 
     @action(detail=False, methods=['GET'])
+    @across_shards(all_shards=True)
     def pending_invites(self, request):
         """Get all pending invites for the current user's email"""
-        # Get user's email from Clerk
-        clerk = Clerk(bearer_auth=os.getenv('CLERK_SECRET_KEY'))
         try:
-            user = clerk.users.get(user_id=request.user.id)
-            user_email = user.email_addresses[0].email_address if user.email_addresses else None
-            
+            user_email = request.user.profile.get('email')
+
             if not user_email:
                 return Response(
                     {'error': 'No email found for user'},
@@ -290,13 +779,14 @@ class ProjectInviteViewSet(viewsets.ModelViewSet):
 
             invites = ProjectInvites.objects.filter(
                 email=user_email,
-                status='pending'
+                status='pending',
+                team__deletion_requested_at__isnull=True
             ).select_related('team')
 
             # Custom response with project details
             invite_data = []
             for invite in invites:
-                project = Projects.objects.filter(team=invite.team).first()
+                project = Projects.objects.filter(team=invite.team, deletion_requested_at__isnull=True).first()
                 if project:
                     invite_data.append({
                         'invite_id': invite.id,
@@ -327,15 +817,13 @@ class ProjectInviteViewSet(viewsets.ModelViewSet):
         response = serializer.validated_data['response']
 
         try:
-            # Get user's email from Clerk
-            clerk = Clerk(bearer_auth=os.getenv('CLERK_SECRET_KEY'))
-            user = clerk.users.get(user_id=request.user.id)
-            user_email = user.email_addresses[0].email_address if user.email_addresses else None
+            user_email = request.user.profile.get('email')
 
             invite = ProjectInvites.objects.get(
                 id=invite_id,
                 email=user_email,
-                status='pending'
+                status='pending',
+                team__deletion_requested_at__isnull=True
             )
 
             invite.status = response
@@ -363,4 +851,21 @@ class ProjectInviteViewSet(viewsets.ModelViewSet):
             return Response(
                 {'error': str(e)},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
-            )
\ No newline at end of file
+            )
+
+
+class JobViewSet(viewsets.ReadOnlyModelViewSet):
+    serializer_class = BackgroundJobSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        return BackgroundJobs.objects.filter(created_by=self.request.user.id)
+
+    @action(detail=True, methods=['GET'])
+    def download(self, request, pk=None):
+        """Download the file produced by a finished job"""
+        current = self.get_object()
+        name = (current.result or {}).get('file')
+        if current.status != 'done' or not name or not default_storage.exists(name):
+            raise Http404('No file available for this job')
+        return FileResponse(default_storage.open(name, 'rb'), as_attachment=True, filename=os.path.basename(name))
@@ -57,6 +57,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'api.activity.ActivityMiddleware',
 ]
 
 ROOT_URLCONF = 'taskflow.urls'
@@ -84,7 +85,7 @@ WSGI_APPLICATION = 'taskflow.wsgi.application'
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.mysql',
+        'ENGINE': os.getenv('DATABASE_ENGINE', 'django.db.backends.mysql'),
         'NAME': os.getenv('DATABASE_NAME'),
         'USER': os.getenv('DATABASE_USER'),
         'PASSWORD': os.getenv('DATABASE_PASSWORD'),
@@ -93,6 +94,26 @@ DATABASES = {
     }
 }
 
+# Extra databases for team data, see api/tenancy.py. Each alias in
+# TENANT_SHARDS is configured like default, overridden by
+# DATABASE_<ALIAS>_ENGINE/_NAME/_USER/_PASSWORD/_HOST/_PORT. For example two
+# SQLite files for local development:
+#   DATABASE_ENGINE=django.db.backends.sqlite3 DATABASE_NAME=default.sqlite3
+#   TENANT_SHARDS=shard1 DATABASE_SHARD1_NAME=shard1.sqlite3
+# then `python manage.py migrate --database=<alias>` for each alias.
+TENANT_SHARDS = [alias.strip() for alias in os.getenv('TENANT_SHARDS', '').split(',') if alias.strip()]
+for _alias in TENANT_SHARDS:
+    DATABASES[_alias] = {
+        **DATABASES['default'],
+        **{
+            key: os.getenv(f'DATABASE_{_alias.upper()}_{key}')
+            for key in ('ENGINE', 'NAME', 'USER', 'PASSWORD', 'HOST', 'PORT')
+            if os.getenv(f'DATABASE_{_alias.upper()}_{key}')
+        },
+    }
+TENANT_DATABASES = ['default'] + TENANT_SHARDS
+DATABASE_ROUTERS = ['api.tenancy.TenantRouter']
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -124,6 +145,9 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# Generated files such as background exports
+MEDIA_ROOT = os.getenv('MEDIA_ROOT', BASE_DIR / 'media')
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
@@ -145,6 +169,33 @@ REST_FRAMEWORK = {
     ],
 }
 
+# Cache shared by all workers (throttle buckets, lookups).
+# Point this at Redis/Memcached in production, the default is per-process.
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    }
+}
+
+# Token-bucket throttling of routes that call Clerk, see api/throttling.py.
+# Costs are weighted by the number of remote Clerk calls a route makes.
+CLERK_THROTTLE = {
+    'CAPACITY': int(os.getenv('CLERK_THROTTLE_CAPACITY', '30')),
+    'REFILL_RATE': float(os.getenv('CLERK_THROTTLE_REFILL_RATE', '1')),  # tokens per second
+    'COSTS': {
+        'project.basic_projects': 5,  # one lookup per team member
+        'task.retrieve': 3,  # embeds the project's members
+        'invite.invite_user': 3,  # lists Clerk users
+        'invite.pending_invites': 1,
+        'invite.respond_to_invite': 1,
+        'project.export': 2,  # batched lookups of member names
+    },
+}
+
+# Cached Clerk user profiles, see api/clerk_users.py
+CLERK_USER_CACHE_TIMEOUT = int(os.getenv('CLERK_USER_CACHE_TIMEOUT', '300'))
+
 # CORS Settings
 CORS_ALLOWED_ORIGIN_REGEXES = [
     r"^http://localhost:\d+$",  # Match localhost with any port
@@ -162,4 +213,62 @@ if not DEBUG:
     X_FRAME_OPTIONS = 'DENY'
     SECURE_HSTS_SECONDS = 31536000  # 1 year
     SECURE_HSTS_INCLUDE_SUBDOMAINS = True
-    SECURE_HSTS_PRELOAD = True
\ No newline at end of file
+    SECURE_HSTS_PRELOAD = True
+
+# Kanban board settings
+BOARD_COLUMN_LIMIT = int(os.getenv('BOARD_COLUMN_LIMIT', '50'))
+BOARD_COLUMN_MAX_LIMIT = int(os.getenv('BOARD_COLUMN_MAX_LIMIT', '200'))
+# Columns holding a rank longer than this are rewritten by `rebalance_ranks`
+TASK_RANK_REBALANCE_LENGTH = int(os.getenv('TASK_RANK_REBALANCE_LENGTH', '24'))
+
+# Archiving of completed projects, see api/archive.py
+ARCHIVE_AFTER_DAYS = int(os.getenv('ARCHIVE_AFTER_DAYS', '90'))
+ARCHIVE_BATCH_SIZE = int(os.getenv('ARCHIVE_BATCH_SIZE', '500'))
+
+# Background jobs processed by `manage.py run_worker`, see api/jobs.py
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', '3'))
+JOB_TIMEOUT_SECONDS = int(os.getenv('JOB_TIMEOUT_SECONDS', '3600'))
+WORKER_POLL_SECONDS = float(os.getenv('WORKER_POLL_SECONDS', '2'))
+
+# Project exports, see api/export.py
+EXPORT_CHUNK_SIZE = int(os.getenv('EXPORT_CHUNK_SIZE', '2000'))
+
+# Bulk task imports, see api/importer.py
+IMPORT_BATCH_SIZE = int(os.getenv('IMPORT_BATCH_SIZE', '500'))
+
+# Due-date calendar, see api/recurrence.py
+CALENDAR_MAX_DAYS = int(os.getenv('CALENDAR_MAX_DAYS', '366'))
+CALENDAR_CACHE_TIMEOUT = int(os.getenv('CALENDAR_CACHE_TIMEOUT', '300'))
+
+# Due-soon and overdue reminders, see api/reminders.py
+REMINDER_BACKEND = os.getenv('REMINDER_BACKEND', 'api.reminders.ConsoleBackend')
+REMINDER_FILE_PATH = os.getenv('REMINDER_FILE_PATH', BASE_DIR / 'reminders.log')
+REMINDER_DUE_SOON_HOURS = int(os.getenv('REMINDER_DUE_SOON_HOURS', '24'))
+REMINDER_INITIAL_LOOKBACK_HOURS = int(os.getenv('REMINDER_INITIAL_LOOKBACK_HOURS', '24'))
+REMINDER_SCAN_INTERVAL = float(os.getenv('REMINDER_SCAN_INTERVAL', '60'))
+
+# Cached team memberships of users, see api/membership.py. Only used with a
+# cache shared between processes (not LocMemCache or DummyCache).
+MEMBERSHIP_CACHE_TIMEOUT = int(os.getenv('MEMBERSHIP_CACHE_TIMEOUT', '300'))
+
+# Background deletion of teams and projects, see api/deletion.py
+DELETION_BATCH_SIZE = int(os.getenv('DELETION_BATCH_SIZE', '200'))
+
+# Activity feed, see api/activity.py and `manage.py compact_activity`
+ACTIVITY_PAGE_SIZE = int(os.getenv('ACTIVITY_PAGE_SIZE', '50'))
+ACTIVITY_MAX_PAGE_SIZE = int(os.getenv('ACTIVITY_MAX_PAGE_SIZE', '200'))
+ACTIVITY_RETENTION_DAYS = int(os.getenv('ACTIVITY_RETENTION_DAYS', '365'))
+ACTIVITY_COMPACT_AFTER_DAYS = int(os.getenv('ACTIVITY_COMPACT_AFTER_DAYS', '7'))
+ACTIVITY_COMPACT_WINDOW_MINUTES = int(os.getenv('ACTIVITY_COMPACT_WINDOW_MINUTES', '10'))
+ACTIVITY_BATCH_SIZE = int(os.getenv('ACTIVITY_BATCH_SIZE', '1000'))
+
+# POST /batch/, see api/batch.py
+BATCH_MAX_REQUESTS = int(os.getenv('BATCH_MAX_REQUESTS', '20'))
+BATCH_MAX_WORKERS = int(os.getenv('BATCH_MAX_WORKERS', '4'))
+
+# Home screen snapshots, see api/snapshots.py
+SNAPSHOT_MAX_AGE_SECONDS = int(os.getenv('SNAPSHOT_MAX_AGE_SECONDS', '3600'))
+
+# Team database routing, see api/tenancy.py and `manage.py move_team`
+TENANT_DIRECTORY_CACHE_TIMEOUT = int(os.getenv('TENANT_DIRECTORY_CACHE_TIMEOUT', '60'))
+TENANT_MOVE_BATCH_SIZE = int(os.getenv('TENANT_MOVE_BATCH_SIZE', '500'))